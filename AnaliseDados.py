@@ -1,281 +1,163 @@
 import pandas as pd
-import numpy as np
 import streamlit as st
-import plotly.express as px
-import plotly.graph_objects as go
-from io import StringIO
-from pmdarima import auto_arima
-from sklearn.metrics import mean_absolute_percentage_error
+import os
+import time
+from functools import partial
+from pathlib import Path
+from agregacoes import MAX_CLIENTES_EXIBIDOS
+from ingestao import LIMITE_STREAMING, carregador_colunar, carregador_streaming, conversor_parquet, hash_conteudo, identificador_anexo, identificador_dados, ler_cabecalho
+from particoes import cabecalho_particoes, carregar_particoes, identificador_particoes, listar_particoes, particoes_periodo, resumo_mensal, resumos_particoes
+from paineis import GRANULARIDADES, aquecer_importacoes, anexar_base, chave_pagina, gerador_pagina, memorizar, pagina_completa, preparar_base, preparar_periodo, resultado_persistente
+from snapshots import carregar_pagina, chave_periodo, pasta_pagina
+from armazenamento import caminho_resultado, chave_armazenamento, gravar_resultado, ler_resultado
+from instrumentacao import anotar, estagio, gravar_log, incorporar_medicoes, iniciar_medicoes, marcar_cache
+from memoria import AUSENTE, estatisticas_memoria
+from tarefas import descricao_progresso, iniciar_tarefa, resultado_tarefa
+from consultas import BACKEND, fonte_sql
 
 
 
 #Layout da página
 st.set_page_config("Análise de Dados de Vendas", layout="wide")
+medicoes = iniciar_medicoes() # Medições de desempenho desta execução (painel "Desempenho" na barra lateral)
 
 
-#Função de Carregamento dos dados 
-@st.cache_data
-def carregador_dados(uploaded_file):
-    if uploaded_file is None:
-        data = pd.read_csv("superstore_final_dataset.csv", encoding="latin-1")
-        new_order = ["Order_Date", "Customer_ID", "Category", "Sales"]
-        data = data[new_order]
-        
-        
-        
-    else:
-        try:
-            stringio = StringIO(uploaded_file.getvalue().decode("utf-8"))    
-            data = pd.read_csv(stringio)
-        
-        except Exception as e:
-            st.error("Erro ao aplicar codificação UTF-8 ao conjunto de dados." \
-            " Tentando abordagem alternativa... Escolha corretamente as colunas no dataframe e tente novamente.")
-            stringio = StringIO(uploaded_file.getvalue().decode("latin-1"))
-            data = pd.read_csv(stringio)
-        
-    
-    return data
-
-
-#Função de Geração dos Cálculos, Gráficos e Modelo ARIMA
-@st.cache_resource
-def gerador_de_calculos_e_graficos(data, coluna_data, coluna_id, coluna_categoria, coluna_valor, datas, meses_prever, maiores_valores):
-    #Primeira Função Aninhada(Geração dos Cálculos)
-    def gerador_calculos(data):              
-        data = data.set_index(coluna_data)
-        data.index = pd.to_datetime(data.index, format="%d/%m/%Y" if uploaded_file==None else "mixed") 
-        
-
-        #Cálculos Principais e preparação dos dados
-        vendas = data.resample("MS")[[coluna_valor]].sum().reset_index() # Os Dados para treinamento do modelo não serão filtrados
-        data = data.sort_index()
-        if len(datas)==2: #Filtra os meses se especificado            
-            #data = data.last(str(meses) + "MS") # Filtro utilizado anteriormente
-            data = data.loc[(data.index >= pd.to_datetime(datas[0], format="%Y/%m/%d")) & (data.index <= pd.to_datetime(datas[1], format="%Y/%m/%d"))]
-        elif len(datas)==1:
-            data = data.loc[data.index >= pd.to_datetime(datas[0], format="%Y/%m/%d")]
-
-        data[coluna_id] = data[coluna_id].astype(str) #Transforma a coluna de identificação em string para plotagem adequada
-        data_copy = data.copy()
-        total_vendas = data[coluna_valor].sum()
-        vendas_por_categoria = data.groupby(coluna_categoria)[[coluna_valor]].sum().nlargest(10, coluna_valor)   #Top 10 categorias mais vendidas
-        vendas_mensais = data.resample("MS")[[coluna_valor]].sum()
-        crescimento_perc = vendas_mensais[[coluna_valor]].pct_change() *100
-        ticket_medio_categoria = data.groupby(coluna_categoria)[[coluna_valor]].mean().nlargest(10, coluna_valor) #Top 10 categorias com maior ticket médio
-        ticket_medio_mes = data.resample("MS")[[coluna_valor]].mean()
-        melhores_clientes = data.groupby(coluna_id)[[coluna_valor]].sum()
-        clientes_frequentes = data.groupby(coluna_id)[[coluna_valor]].count()
-        retencao_cliente = data.groupby(coluna_id)[coluna_valor].count() #Cálculo Retenção de Clientes Geral
-        taxa_retencao = retencao_cliente[retencao_cliente >1].count() / retencao_cliente.count()        
-        
-        #Retenção de Clientes Mensal
-        total_clientes = data.resample("MS")[coluna_id].nunique()                      
-        compras_por_cliente = data.groupby([pd.Grouper(freq="MS"), coluna_id]).size() #Calcula a quantidade de compras de cada cliente em cada mês.          
-        clientes_recorrentes = compras_por_cliente[compras_por_cliente > 1].groupby(level=0).count() #Identifica os clientes que fizeram mais de uma compra no mesmo mês.        
-        taxa_recompra = (clientes_recorrentes / total_clientes).fillna(0) #Calcula a taxa de recompra: Dividir o número de clientes recorrentes pelo total de clientes (por mês)
-        clv = data.groupby(coluna_id)[[coluna_valor]].sum().mean()
-
-
-        #Divisão dos Dados entre treino e teste        
-        proporcao_treino = int(0.85 * vendas.shape[0])
-        vendas[coluna_valor].dropna(inplace=True)
-        treino = vendas.loc[: proporcao_treino, :]
-        teste = vendas.loc[proporcao_treino:, :]
+ARQUIVO_EXEMPLO = "superstore_final_dataset.csv"
+PREVISAO_ANTECIPADA = os.environ.get("ANALISEDADOS_PREVISAO_ANTECIPADA", "1") != "0" # A Projeção é calculada em segundo plano ao abrir as demais páginas
+COLUNAS_EXEMPLO = ["Order_Date", "Customer_ID", "Category", "Sales"]
+PASTA_PARTICOES = os.environ.get("ANALISEDADOS_PASTA_PARTICOES", "") # Pasta de dados particionados sugerida na barra lateral
+AQUECIMENTO = os.environ.get("ANALISEDADOS_AQUECIMENTO", "1") != "0" # Bibliotecas de gráficos e de previsão importadas em segundo plano após a primeira renderização
+NOMES_GRANULARIDADES = {"Mensal": ("Mensais", "por Mês"), "Semanal": ("Semanais", "por Semana"), "Diária": ("Diárias", "por Dia")} # Títulos das séries temporais
 
-        
-        #Treinamento do Modelo ARIMA        
-        modelo_arima = auto_arima(treino[coluna_valor], start_p=0, start_q=0, d=None, max_d=5, max_q=7, D=0,            #Hiper-parâmetros generalistas
-                           seasonal=True, trace=False, stepwise=True, start_P=0, start_Q=0, max_D=7, max_Q=5, m=12)
-        
-        
-        #Avaliação do Modelo
-        previsoes_teste = modelo_arima.predict(len(teste))        
-        mape = mean_absolute_percentage_error(teste[coluna_valor], previsoes_teste)
-        previsoes_arima = modelo_arima.predict(n_periods=meses_prever, return_conf_int=False)
 
-        
-        #Geração do gráfico de Previsão
-        data_grafico = pd.date_range(teste[coluna_data].max() + pd.DateOffset(months=1), periods=meses_prever, freq="MS")
-        fig_arima = px.line(x=data_grafico, y=previsoes_arima, color_discrete_sequence=["#0550DD"], markers=True,
-                             title=f"Previsões do Modelo para o período selecionado de {meses_prever} meses")
-
-        x_arima = np.arange(len(data_grafico)) # Índices numéricos para os meses
-        coef = np.polyfit(x_arima, previsoes_arima, 1) # Ajuste polinomial (grau 1 para tendência)
-        poly_arima = np.poly1d(coef)
-        y_fit_arima = poly_arima(x_arima)
-        
-        fig_arima.update_layout(xaxis_title=f"Erro percentual do Modelo: {mape*100:.2f}%", yaxis_title="Valor de Vendas Previsto")
-        fig_arima.update_traces(text=previsoes_arima, hovertemplate="Mês: %{x}<br>Valor Previsto: %{y}", 
-                                line=dict(color="dodgerblue"), marker=dict(color="darkorange"))
-        
-        fig_arima.add_scatter(x=data_grafico, y=y_fit_arima, mode='lines', name='Tendência<br>Prevista', 
-                              line=dict(dash='dash', color="white")) # Adição da linha de tendência
-        
+#Impressão digital dos dados de exemplo (calculada uma única vez por processo enquanto o arquivo não for alterado)
+@st.cache_resource(max_entries=1, show_spinner=False)
+def impressao_exemplo(modificacao):
+    return identificador_dados(hash_conteudo(Path(ARQUIVO_EXEMPLO).read_bytes()))
 
-        #Geração do Gráfico de comparação        
-        vendas_compar = vendas.sort_values(coluna_data, ascending=False).iloc[:meses_prever,:]
-        fig_compar = px.line(x=vendas_compar[coluna_data], y=vendas_compar[coluna_valor], 
-                             markers=True, title="Valores Históricos do período anterior")
-        
-        x = np.arange(len(vendas_compar)) #Índices numéricos para os meses
-        y = vendas_compar[coluna_valor].values # Valores de Vendas
-        coef = np.polyfit(x, y, 1) # Ajuste polinomial (grau 1 para tendência)
-        poly = np.poly1d(coef)
-        y_fit = poly(x)
 
-        
-        fig_compar.update_layout(xaxis_title="Mês", yaxis_title="Valor das Vendas")
-        fig_compar.update_traces(text=vendas_compar[coluna_valor], textposition="top center", hovertemplate="Mês: %{x}<br>Valor: %{y} ",
-                                 line=dict(color="dodgerblue"), marker=dict(color="darkorange"))
-        fig_compar.add_scatter(x=vendas_compar[coluna_data], y=y_fit, mode="lines", name="Tendência", line=dict(color="white", dash="dash")) # Adição da linha de tendência
+#Impressão digital do arquivo: o conteúdo é hasheado uma única vez, na chegada do upload, e o identificador resultante
+#é a chave de todos os caches abaixo (o Streamlit não precisa mais hashear o arquivo nem o DataFrame a cada interação)
+def impressao_arquivo(uploaded_file):
+    if uploaded_file is None:
+        return impressao_exemplo(Path(ARQUIVO_EXEMPLO).stat().st_mtime_ns)
+    impressoes = st.session_state.setdefault("impressoes_arquivos", {})
+    if uploaded_file.file_id not in impressoes:
+        impressoes[uploaded_file.file_id] = identificador_dados(hash_conteudo(uploaded_file.getvalue()))
+    return impressoes[uploaded_file.file_id]
+
+
+#Impressões digitais da base e dos arquivos anexados: cada anexo gera um novo identificador a partir do anterior
+#Retorna o identificador da base e, para cada anexo, o identificador acumulado, o do próprio arquivo e o upload
+def impressoes_uploads(uploaded_file, anexos):
+    id_base = impressao_arquivo(uploaded_file)
+    etapas, id_atual = [], id_base
+    for anexo in anexos:
+        id_anexo = impressao_arquivo(anexo)
+        id_atual = identificador_anexo(id_atual, id_anexo)
+        etapas.append((id_atual, id_anexo, anexo))
+    ativos = {arquivo.file_id for arquivo in [uploaded_file, *anexos] if arquivo is not None}
+    impressoes = st.session_state.get("impressoes_arquivos", {})
+    for file_id in set(impressoes) - ativos: # Apenas os uploads atuais são mantidos na sessão
+        del impressoes[file_id]
+    return id_base, etapas
+
+
+#Função de Leitura do Cabeçalho (apenas os nomes das colunas, para o mapeamento na barra lateral)
+@st.cache_data(show_spinner=False)
+def leitor_cabecalho(id_dados, _uploaded_file):
+    marcar_cache(False) # O corpo das funções em cache só executa quando o resultado não está armazenado
+    if _uploaded_file is None:
+        return COLUNAS_EXEMPLO
+    return ler_cabecalho(_uploaded_file.getvalue())
+
+
+#Função de Carregamento dos dados (somente as quatro colunas mapeadas, com tipos compactos e cache em Parquet)
+#Arquivos acima do limite de streaming são lidos em blocos e consolidados diretamente no cubo mensal
+#O resultado recebe o identificador e a versão do conjunto de dados. As linhas não ficam em memória: são carregadas
+#(do cache em Parquet) apenas quando a base precisa ser construída, e os caches guardam somente o cubo e os agregados
+#No backend SQL o arquivo é convertido em blocos para Parquet (qualquer tamanho) e o resultado é apenas a fonte das consultas
+def carregador_dados(id_dados, uploaded_file, coluna_data, coluna_id, coluna_categoria, coluna_valor):
+    if BACKEND == "duckdb":
+        caminho, codificacao = conversor_parquet(Path(ARQUIVO_EXEMPLO) if uploaded_file is None else uploaded_file,
+                                                 coluna_data, coluna_id, coluna_categoria, coluna_valor, hash_arquivo=id_dados[0])
+        if codificacao == "latin-1" and uploaded_file is not None:
+            st.error("Erro ao aplicar codificação UTF-8 ao conjunto de dados." \
+            " Utilizando a codificação latin-1... Escolha corretamente as colunas no dataframe e tente novamente.")
+        return dict(fonte_sql([caminho], coluna_data, coluna_id, coluna_categoria, coluna_valor), id_dados=id_dados[0], versao_dados=id_dados[1])
+
+    if uploaded_file is not None and uploaded_file.size > LIMITE_STREAMING:
+        data = carregador_streaming(uploaded_file, coluna_data, coluna_id, coluna_categoria, coluna_valor)
+        data.update(id_dados=id_dados[0], versao_dados=id_dados[1])
+        return data
+
+    conteudo = Path(ARQUIVO_EXEMPLO).read_bytes() if uploaded_file is None else uploaded_file.getvalue()
+    data, codificacao = carregador_colunar(conteudo, coluna_data, coluna_id, coluna_categoria, coluna_valor, hash_arquivo=id_dados[0])
+    if codificacao == "latin-1" and uploaded_file is not None:
+        st.error("Erro ao aplicar codificação UTF-8 ao conjunto de dados." \
+        " Utilizando a codificação latin-1... Escolha corretamente as colunas no dataframe e tente novamente.")
+    
+    data.attrs.update(id_dados=id_dados[0], versao_dados=id_dados[1])
+    return data
 
-        
 
-        return total_vendas, vendas_por_categoria, vendas_mensais, crescimento_perc, ticket_medio_categoria, \
-                            ticket_medio_mes, melhores_clientes, clientes_frequentes, taxa_retencao, taxa_recompra, clv, fig_arima, fig_compar, maiores_valores, data_copy
-    
-    #Segunda Função Aninhada(Geração dos Gráficos)
-    def gerador_graficos(total_vendas, vendas_por_categoria, vendas_mensais, crescimento_perc,ticket_medio_categoria, ticket_medio_mes, melhores_clientes, 
-                          clientes_frequentes, taxa_retencao, taxa_recompra, clv, fig_arima, fig_compar, maiores_valores, data_copy): #Cálculos necessários para o gerador de gráficos
-
-        #Gráfico de Vendas por Categoria
-        categoria_mais_vendida = vendas_por_categoria[vendas_por_categoria[coluna_valor]== vendas_por_categoria[coluna_valor].max()]
-        fig = px.bar(vendas_por_categoria, vendas_por_categoria.index, vendas_por_categoria[coluna_valor],  color=vendas_por_categoria[coluna_valor], color_continuous_scale="Greens",
-                     title=f"{categoria_mais_vendida.index[0]} é a categoria com maior soma de vendas com um total de {categoria_mais_vendida[coluna_valor].iloc[0]:,.2f} ")
-        
-        fig.update_layout(xaxis_title="Categoria", yaxis_title="Total Vendido em cada categoria", template="plotly_dark")
+#Função de Resumo das partições (cada arquivo é resumido uma única vez por versão) e resumo mensal do conjunto particionado
+@memorizar(max_entradas=4)
+def resumidor_particoes(id_dados, _particoes, coluna_data, coluna_id, coluna_categoria, coluna_valor):
+    resumos = resumos_particoes(_particoes, coluna_data, coluna_id, coluna_categoria, coluna_valor)
+    return resumos, resumo_mensal(resumos, coluna_data, coluna_categoria, coluna_valor)
 
-        fig.update_traces(text=vendas_por_categoria[coluna_valor].apply(lambda x: f"R$ {x:,.2f}"), textposition="none", hovertemplate="Vendas por Categoria: R$%{y}<br>Categoria: %{x} ")
-                
 
-        #Gráfico de Vendas Totais
-        fig2 = go.Figure(go.Indicator(mode="gauge+number", 
-                                      value=total_vendas,
-                                      title="Vendas Totais",
-                                      align="center",
-                                      gauge={"axis": {"range": [0, 1.25 * total_vendas]}}))
-        
-        fig2.add_annotation(x=0.5, y=-0.2, text="Total Vendido:  R${:,.2f}".format(total_vendas), 
-                                showarrow=False, font=dict(size=19, color="white"))
-        
-        
-        mapeamento_meses = {1: "Janeiro", 2: "Fevereiro", 3: "Março", 4: "Abril", 5: "Maio", 6: "Junho", 7: 
-                            "Julho", 8: "Agosto", 9: "Setembro", 10: "Outubro", 11: "Novembro", 12: "Dezembro"} #Dicionário para mapeamento dos meses
-        
-        # Preparação dos dados
-        crescimento_perc = crescimento_perc.sort_index(ascending=False).iloc[:12,:]
-        x = np.arange(len(crescimento_perc))  # Criando índices numéricos para os meses
-        y = crescimento_perc[coluna_valor].values  # Valores de crescimento percentual
+#Função de Carregamento das partições que cobrem o período selecionado (como carregador_dados, apenas ao construir a base)
+def carregador_particoes(id_dados, particoes, coluna_data, coluna_id, coluna_categoria, coluna_valor):
+    data = carregar_particoes(particoes, coluna_data, coluna_id, coluna_categoria, coluna_valor)
+    data.attrs.update(id_dados=id_dados[0], versao_dados=id_dados[1])
+    return data
 
-        melhor_porc = crescimento_perc[crescimento_perc[coluna_valor]== crescimento_perc[coluna_valor].max()]
-        pior_porc = crescimento_perc[crescimento_perc[coluna_valor]== crescimento_perc[coluna_valor].min()]
-        
-        # Criar gráfico principal
-        fig3 = px.line(crescimento_perc, x=crescimento_perc.index, y=crescimento_perc[coluna_valor], markers=True, color_discrete_sequence=["#1c83e1"],
-                    title=f"O mês de {mapeamento_meses[melhor_porc.index.month[0]]} de {melhor_porc.index.year[0]} apresentou um crescimento percentual nas vendas de {melhor_porc[coluna_valor].iloc[0]:,.2f}%")
 
+#Leitura das linhas de um arquivo ou das partições (carregador_dados ou carregador_particoes com os seus argumentos)
+def carregar_linhas(carregar):
+    with estagio("carregamento"):
+        return carregar()
 
-        # Ajuste polinomial (grau 1 para tendência)
-        coef = np.polyfit(x, y, 1)
-        poly = np.poly1d(coef)
 
-        # Geração de pontos para a linha de tendência
-        x_fit = x  # Mantendo a escala original
-        y_fit = poly(x_fit)  # Aplicando a função polinomial
+#Função de Preparação da Base (uma vez por conjunto de dados e mapeamento de colunas, compartilhada entre as sessões
+#e, pelo armazenamento persistente, entre as réplicas da aplicação que usam o mesmo backend)
+@memorizar(max_entradas=4)
+def preparador_base(id_dados, _carregar, coluna_data, coluna_id, coluna_categoria, coluna_valor, _resumo_mensal=None):
+    return resultado_persistente("bases", chave_armazenamento(id_dados, coluna_data, coluna_id, coluna_categoria, coluna_valor, BACKEND),
+                                 lambda: preparar_base(carregar_linhas(_carregar), coluna_data, coluna_id, coluna_categoria, coluna_valor, _resumo_mensal))
 
 
-        fig3.update_layout(yaxis_title="Variação Percentual(%)", 
-                        xaxis_title=f"{mapeamento_meses[pior_porc.index.month[0]]} de {pior_porc.index.year[0]} foi o mês com pior variação percentual: {pior_porc[coluna_valor].iloc[0]:,.2f}%")
+#Função de Anexação de novos dados à base anterior (chaveada pelo identificador acumulado: cada anexo é processado uma única vez)
+@memorizar(max_entradas=4)
+def anexador_base(id_dados, _base, _carregar, coluna_data, coluna_id, coluna_categoria, coluna_valor):
+    return resultado_persistente("bases", chave_armazenamento(id_dados, coluna_data, coluna_id, coluna_categoria, coluna_valor, BACKEND),
+                                 lambda: anexar_base(_base, carregar_linhas(_carregar), coluna_data, coluna_id, coluna_categoria, coluna_valor))
 
-        fig3.update_traces(text=crescimento_perc[coluna_valor], hovertemplate="Variação Percentual nas Vendas: %{y}%<br>Mês: %{x}",
-                           marker=dict(color="#f7fbff"))
 
-        # Adicionar linha de tendência polinomial corrigida
-        fig3.add_scatter(x=crescimento_perc.index, y=y_fit, mode='lines', name="Tendência", line=dict(dash="dash", color="#f7fbff")) # Adição da linha de tendência
+#Função de Preparação dos Dados do período selecionado (fatia do cubo), compartilhada por todas as páginas
+#Com arquivos anexados, a base original e cada anexo já processados são reaproveitados e apenas os novos anexos são combinados
+#Com dados particionados, a base contém apenas as partições do período e as séries de treinamento vêm do resumo mensal
+@memorizar(max_entradas=16)
+def preparador_dados(id_dados, _id_base, _carregar, _anexos, coluna_data, coluna_id, coluna_categoria, coluna_valor, datas, _resumo_mensal=None):
+    base = preparador_base(_id_base, _carregar, coluna_data, coluna_id, coluna_categoria, coluna_valor, _resumo_mensal)
+    for id_etapa, carregar_anexo in _anexos:
+        base = anexador_base(id_etapa, base, carregar_anexo, coluna_data, coluna_id, coluna_categoria, coluna_valor)
+    return preparar_periodo(base, coluna_data, coluna_id, coluna_categoria, coluna_valor, datas)
 
 
-        
-        #Gráfico de Vendas Mensais
-        vendas_mensais = vendas_mensais.sort_index(ascending=False).iloc[:12,:]
-        melhor_mes = vendas_mensais[vendas_mensais[coluna_valor]== vendas_mensais[coluna_valor].max()]
-        pior_mes = vendas_mensais[vendas_mensais[coluna_valor]== vendas_mensais[coluna_valor].min()]
-        fig4 = px.bar(vendas_mensais, vendas_mensais.index, vendas_mensais[coluna_valor], color_continuous_scale="Blues", color=vendas_mensais[coluna_valor],
-            title=f"O mês de {mapeamento_meses[melhor_mes.index.month[0]]} de {melhor_mes.index.year[0]} foi o melhor mês com um total de R${melhor_mes[coluna_valor].iloc[0]:,.2f} vendido")
-                      
-        
-        fig4.update_layout(yaxis_title="Total Mensal em Vendas", xaxis={"tickangle": 0}, 
-                    xaxis_title=f"{mapeamento_meses[pior_mes.index.month[0]]} de {pior_mes.index.year[0]} foi o mês com o menor total de vendas: R${pior_mes[coluna_valor].iloc[0]:,.2f} ") 
+#Função de Leitura de uma página pré-calculada (chaveada pela pasta e pela data de modificação do snapshot)
+@memorizar(max_entradas=16)
+def leitor_snapshot(pasta, modificacao):
+    return carregar_pagina(pasta)
 
-        fig4.update_traces(text=vendas_mensais[coluna_valor], textposition="none", hovertemplate="Vendas Totais: R$%{y}<br>Mês: %{x} ")
-        
 
-        #Gráfico de Ticket Médio por Categoria        
-        maior_ticket_cat = ticket_medio_categoria[ticket_medio_categoria[coluna_valor]== ticket_medio_categoria[coluna_valor].max()]
-        ticket_medio_categoria = ticket_medio_categoria.sort_values(coluna_valor, ascending=True)
-        fig5 = px.bar(ticket_medio_categoria, y=ticket_medio_categoria.index, x=ticket_medio_categoria[coluna_valor], color=ticket_medio_categoria[coluna_valor],
-                        title=f"O maior ticket médio foi da categoria {maior_ticket_cat.index[0]} com um valor de R${maior_ticket_cat[coluna_valor].iloc[0]:,.2f}")
-        fig5.update_layout(xaxis_title="Valor do Ticket", yaxis_title="Categoria")
-        fig5.update_traces(text=ticket_medio_categoria[coluna_valor].apply(lambda x: f"R$ {x:,.2f}"), textposition="inside", hovertemplate="Ticket Médio por Categoria: %{text}<br>Categoria: %{y}")
-        
-        #Gráfico de Ticket Médio por Mês        
-        ticket_medio_mes = ticket_medio_mes.sort_index(ascending=False).iloc[:12,:]
-        maior_ticket_mes = ticket_medio_mes[ticket_medio_mes[coluna_valor]== ticket_medio_mes[coluna_valor].max()]
-        menor_ticket_mes = ticket_medio_mes[ticket_medio_mes[coluna_valor]== ticket_medio_mes[coluna_valor].min()]
-        fig6 = px.bar(ticket_medio_mes, ticket_medio_mes.index, ticket_medio_mes[coluna_valor], color=ticket_medio_mes[coluna_valor],
-            title=f"{mapeamento_meses[maior_ticket_mes.index.month[0]]} de {maior_ticket_mes.index.year[0]} apresentou o maior ticket médio com um valor de {maior_ticket_mes[coluna_valor].iloc[0]:.2f}")
-        fig6.update_layout(yaxis_title="Valor do Ticket", 
-                    xaxis_title=f"{mapeamento_meses[menor_ticket_mes.index.month[0]]} de {menor_ticket_mes.index.year[0]} foi o mês com o menor ticket médio: {menor_ticket_mes[coluna_valor].iloc[0]:,.2f}")
-        fig6.update_traces(text=ticket_medio_mes[coluna_valor].apply(lambda x: f"R$ {x:,.2f}"), textposition="none", hovertemplate="Valor do Ticket: %{text}<br>Mês: %{x} ")
-
-        #Gráfico de Melhores Clientes
-        melhores_clientes = melhores_clientes.sort_values(coluna_valor, ascending=False).iloc[:maiores_valores,:].reset_index()
-        melhor_cliente = melhores_clientes[melhores_clientes[coluna_valor]== melhores_clientes[coluna_valor].max()]
-        fig7 = px.bar(melhores_clientes, melhores_clientes[coluna_id].apply(lambda x: "(" + x + ")"), melhores_clientes[coluna_valor],
-                       color=melhores_clientes[coluna_valor], color_continuous_scale="Greens",
-                      title=f"ID do Melhor Cliente: {melhor_cliente[coluna_id].iloc[0]}<br>Valor Total Gasto {melhor_cliente[coluna_valor].iloc[0]} ")
-        fig7.update_layout(xaxis_title="ID dos Melhores Clientes", yaxis_title="Valor Gasto")
-        fig7.update_traces(text=melhores_clientes[coluna_valor].apply(lambda x: f"R$ {x:,.2f}"), textposition="none", hovertemplate="Gastos do Cliente: R$%{text}<br>ID do Cliente: %{x}")
+#Função de Leitura de uma página do armazenamento persistente (calculada por esta ou por outra réplica da aplicação)
+@memorizar(max_entradas=16)
+def leitor_pagina(chave, modificacao):
+    return ler_resultado("paginas", chave)
 
-        
-        #Gráfico de Clientes Mais Frequentes
-        clientes_frequentes = clientes_frequentes.sort_values(coluna_valor, ascending=False).iloc[:maiores_valores,:].reset_index()
-        cliente_mais_frequente = clientes_frequentes[clientes_frequentes[coluna_valor]== clientes_frequentes[coluna_valor].max()]
-        fig8 = px.bar(clientes_frequentes, clientes_frequentes[coluna_id].apply(lambda x: "(" + x + ")"), 
-                      clientes_frequentes[coluna_valor], color=clientes_frequentes[coluna_valor],  color_continuous_scale="Greens",
-                      title=f"ID do Cliente mais frequente: {cliente_mais_frequente[coluna_id].iloc[0]}<br>Compras Realizadas: {cliente_mais_frequente[coluna_valor].iloc[0]} ")
-        fig8.update_layout(xaxis_title="Clientes Mais Frequentes", yaxis_title="Quantidade de Compras realizadas")
-        fig8.update_traces(text=clientes_frequentes[coluna_valor], textposition="auto", hovertemplate="Número de Compras do Cliente: %{y}<br>ID do Cliente: %{x} ")
-
-
-        #Gráfico de Retenção de Clientes
-        cor = "red" if taxa_retencao <0.2 else "green"
-        fig9 = go.Figure(go.Indicator(mode="gauge+number", 
-                                    value= taxa_retencao*100,
-                                    title={"text": f"Taxa de Recorrência de Clientes: {taxa_retencao*100:.2f}% "},
-                                    gauge={"axis": {"range": [0, 100]},
-                                           "bar": {"color": cor}}))
-        fig9.add_annotation(x=0.5, y=-0.2, 
-                            text=f"Aproximadamente {round(taxa_retencao*10)} de cada 10 clientes voltaram a comprar",
-                            showarrow=False, font=dict(size=25, color=cor))
-        
-        taxa_recompra = taxa_recompra*100
-        maior_recorrencia = taxa_recompra[taxa_recompra.values== taxa_recompra.values.max()]
-        menor_recorrencia = taxa_recompra[taxa_recompra.values== taxa_recompra.values.min()]
-        fig10 = px.line(taxa_recompra, x=taxa_recompra.index, y=taxa_recompra.values, color_discrete_sequence=[cor])
-        fig10.update_layout(xaxis_title=f"{mapeamento_meses[menor_recorrencia.index.month[0]]} de {menor_recorrencia.index.year[0]} apresentou a menor taxa de recorrência: {menor_recorrencia.values[0]:.2f}%",
-            yaxis_title="Taxa de Recorrência(%)", title=f"No mês de {mapeamento_meses[maior_recorrencia.index.month[0]]} de {maior_recorrencia.index.year[0]} houve uma taxa de recompra de {maior_recorrencia.values[0]:.2f}%")
-        fig10.update_traces(text=taxa_recompra.apply(lambda x: f"{x:.2f}%"), textposition="bottom center", hovertemplate="Taxa de Recompra: %{text}<br>Mês: %{x}")
-        
-        return fig, fig2, fig3, fig4, fig5, fig6, fig7, fig8, fig9, fig10, clv, fig_arima, fig_compar, data_copy
-    
-    
-    total_vendas, vendas_por_categoria, vendas_mensais, crescimento_perc, ticket_medio_categoria, ticket_medio_mes, \
-            melhores_clientes, clientes_frequentes, taxa_retencao, taxa_recompra, clv, fig_arima, fig_compar, maiores_valores, data_copy = gerador_calculos(data)
-        
-    return gerador_graficos(total_vendas, vendas_por_categoria, vendas_mensais, crescimento_perc,
-                          ticket_medio_categoria, ticket_medio_mes, melhores_clientes, clientes_frequentes, taxa_retencao, taxa_recompra, clv, fig_arima, fig_compar, maiores_valores, data_copy)
-    
 
 #COnfiguração da barra lateral
 with st.sidebar:    
@@ -283,14 +165,36 @@ with st.sidebar:
     try:
         uploaded_file = st.file_uploader(":blue[Selecionar arquivo]", type="csv", help="Se nenhum arquivo for selecionado, \
                                                     \n a aplicação usará dados de exemplo")
-        dados = carregador_dados(uploaded_file)  #dados brutos
+        arquivos_anexos = st.file_uploader(":blue[Anexar novos dados]", type="csv", accept_multiple_files=True,
+                                           help="Arquivos com as novas vendas (mesmas colunas), combinados ao arquivo selecionado \
+                                           \n sem reprocessar o histórico. Anexe-os na ordem em que foram exportados")
+        pasta_particoes = st.text_input(":blue[Pasta de dados particionados]", PASTA_PARTICOES, help="Pasta local com um arquivo CSV ou Parquet \
+                                        por período (por exemplo, um por mês). Apenas as partições do período selecionado são carregadas. \
+                                        \n Quando informada, substitui o arquivo selecionado e os anexos")
+        with estagio("impressao_arquivo"):
+            if pasta_particoes: # Apenas os nomes, tamanhos e datas de modificação das partições são lidos
+                particoes = listar_particoes(pasta_particoes)
+                id_base = id_dados = identificador_particoes(particoes)
+                etapas_anexos = []
+            else:
+                id_base, etapas_anexos = impressoes_uploads(uploaded_file, arquivos_anexos or []) # Único hash do conteúdo por upload
+                id_dados = etapas_anexos[-1][0] if etapas_anexos else id_base
+        with estagio("leitura_cabecalho", cache="acerto"):
+            if pasta_particoes:
+                colunas_arquivo = cabecalho_particoes(particoes)
+            else:
+                colunas_arquivo = leitor_cabecalho(id_base, uploaded_file)  #Apenas o cabeçalho é lido antes do mapeamento das colunas
     except Exception as error:
-        st.error("Erro ao carregar o arquivo. Por favor selecione um conjunto de dados compatível e atualize corretamente as colunas\
+        if pasta_particoes: # Pasta inexistente, sem partições ou com arquivos ilegíveis: nada a processar até que seja corrigida
+            st.error(f"Erro ao ler as partições: {error}")
+            st.stop()
+        else:
+            st.error("Erro ao carregar o arquivo. Por favor selecione um conjunto de dados compatível e atualize corretamente as colunas\
                     de data, id do cliente , categoria e valor no seu arquivo CSV.")
     with st.expander("Selecionar o tipo de visualização", expanded=True):
         visualizacao = st.radio("Selecione o tipo de análise", ["Vendas por Categoria", "Vendas por Mês", "TickedMédio", "Clientes Engajados",
                                                                 "Taxa de Recorrência", "Projeção"], help="Selecione o tipo de análise que gostaria de visualizar")        
-    if dados.shape[1]<4: 
+    if len(colunas_arquivo)<4: 
         st.error("Por Favor selecione um conjunto de dados válidos. O conjunto de dados deve conter "
                     "colunas de \'data, id do cliente, categoria e valor\'")      #Mensagem de erro se conjunto de dados carregado for incompatível        
     st.markdown(":blue[**Gostaria de personalizar as visualizações?**]", help="Selecione as configurações abaixo para personalizar \
@@ -298,16 +202,39 @@ with st.sidebar:
     with st.expander("Configurações adicionais"):        
         datas = st.date_input("Insira 1 ou 2 datas para filtrar nos gráficos", [], help="Escolha uma única data se quiser inserir apenas a data inicial,\
                               \n ou duas se quiser filtrar data inicial e final, respectivamente.")
-        maiores_valores = st.slider("Selecione o número de clientes que deseja exibir nos gráficos(Clientes Engajados)", 2, 20, 10, 1)                
+        maiores_valores = st.slider("Selecione o número de clientes que deseja exibir nos gráficos(Clientes Engajados)", 2, MAX_CLIENTES_EXIBIDOS, 10, 1)                
         meses_prever = st.slider("Selecione o número de Meses que deseja prever(Projeção)", min_value=2, max_value=12, value=12, step=1)            
+        granularidade = st.radio("Granularidade das séries temporais", list(GRANULARIDADES), horizontal=True,
+                                 help="Vendas, crescimento, ticket médio e recompra por mês (últimos 12 meses), por semana ou por dia\
+                                 \n (todo o período selecionado, reduzido a pontos suficientes para a largura do gráfico)")
     st.markdown(":blue[**Fez o upload de um arquivo?**]", help="Se você fez o upload de um arquivo. Clique abaixo \
                 \n para selecionar as  colunas necessárias para as análises, \
                     \n caso contrário a aplicação pode apresentar um ERRO", unsafe_allow_html=False)
     with st.expander("Clique aqui!", expanded=False):
-        coluna_data = st.selectbox("Selecione a coluna de data", dados.columns, index=0)    
-        coluna_id = st.selectbox("Selecione a coluna de identificação do cliente", dados.columns, index=1)
-        coluna_categoria = st.selectbox("Selecione a coluna de categoria", dados.columns, index=2)
-        coluna_valor = st.selectbox("Selecione a coluna de Valor", dados.columns, index=3)
+        coluna_data = st.selectbox("Selecione a coluna de data", colunas_arquivo, index=0)    
+        coluna_id = st.selectbox("Selecione a coluna de identificação do cliente", colunas_arquivo, index=1)
+        coluna_categoria = st.selectbox("Selecione a coluna de categoria", colunas_arquivo, index=2)
+        coluna_valor = st.selectbox("Selecione a coluna de Valor", colunas_arquivo, index=3)
+    try:
+        resumo_particoes = None
+        with estagio("selecao_dados"): # As linhas só são carregadas se a base não estiver nos caches (preparador_base)
+            if pasta_particoes: # Apenas as partições que cobrem o período selecionado são carregadas
+                resumos, resumo_particoes = resumidor_particoes(id_dados, particoes, coluna_data, coluna_id, coluna_categoria, coluna_valor)
+                selecionadas = particoes_periodo(particoes, resumos, datas)
+                id_base = identificador_anexo(id_dados, identificador_particoes(selecionadas))
+                carregar_dados = partial(carregador_particoes, id_base, selecionadas, coluna_data, coluna_id, coluna_categoria, coluna_valor)
+                anotar(particoes=f"{len(selecionadas)} de {len(particoes)}")
+                anexos = [] # Novos dados são novas partições na pasta
+            else:
+                carregar_dados = partial(carregador_dados, id_base, uploaded_file, coluna_data, coluna_id, coluna_categoria, coluna_valor)  #dados brutos (apenas as colunas mapeadas)
+                anexos = [(id_etapa, partial(carregador_dados, id_anexo, anexo, coluna_data, coluna_id, coluna_categoria, coluna_valor)) # Apenas as novas vendas
+                          for id_etapa, id_anexo, anexo in etapas_anexos]
+    except Exception as error:
+        if pasta_particoes: # Colunas incompatíveis ou nenhuma partição no período selecionado
+            st.error(f"Erro ao carregar as partições: {error}")
+        else:
+            st.error("Erro ao carregar o arquivo. Por favor selecione um conjunto de dados compatível e atualize corretamente as colunas\
+                    de data, id do cliente , categoria e valor no seu arquivo CSV.")
 
     st.markdown(""" 
             <style>.footer {
@@ -355,16 +282,59 @@ with st.sidebar:
         """, unsafe_allow_html=True) # Informações do desenvolvedor
     
     processar = st.button(":blue[Processar os dados]" )
+    painel_desempenho = st.expander("Desempenho", expanded=False) # Preenchido ao final da execução com as medições dos estágios
+
+if AQUECIMENTO: # A barra lateral já foi enviada ao navegador; uma única tarefa por processo (o registro reaproveita a tarefa concluída)
+    iniciar_tarefa("aquecimento", aquecer_importacoes)
 
 if processar:
     try:
         if len(datas)==2 and datas[1] <= datas[0]: # Erro se a data inicial for maior que a data final
                 raise ValueError("A data inicial deve ser menor que a data final")
         progress = st.progress(50, "Aguarde... Gerando Cálculos e gráficos")    
-        fig, fig2, fig3, fig4, fig5, fig6, fig7, fig8, fig9, fig10, clv, grafico_arima, fig_compar, data = gerador_de_calculos_e_graficos(dados, coluna_data, coluna_id, 
-                                                                                                                                    coluna_categoria, coluna_valor, datas, meses_prever, maiores_valores)
+        pasta = pasta_pagina(id_dados, (coluna_data, coluna_id, coluna_categoria, coluna_valor), datas, chave_pagina(visualizacao, maiores_valores, meses_prever, granularidade))
+        pagina = None
+        if (pasta / "dados.pkl").exists():
+            pagina = leitor_snapshot(pasta, (pasta / "dados.pkl").stat().st_mtime_ns)
+            pagina = pagina if pagina_completa(pagina, visualizacao) else None
+        chave_resultado = chave_armazenamento(id_dados, (coluna_data, coluna_id, coluna_categoria, coluna_valor), chave_periodo(datas),
+                                              chave_pagina(visualizacao, maiores_valores, meses_prever, granularidade))
+        caminho = caminho_resultado("paginas", chave_resultado)
+        if pagina is None and caminho.exists():
+            pagina = leitor_pagina(chave_resultado, caminho.stat().st_mtime_ns)
+            pagina = pagina if pagina_completa(pagina, visualizacao) else None
+        if pagina is not None: # Página pré-calculada em linha de comando (precalcular.py) ou por outra réplica da aplicação
+            graficos, agregados, resumo, vendas = pagina["graficos"], pagina["agregados"], pagina["resumo"], pagina["vendas"]
+        else:
+            preparado = preparador_dados(id_dados, id_base, carregar_dados, anexos, coluna_data, coluna_id, coluna_categoria, coluna_valor, tuple(datas), resumo_particoes)
+            with estagio("pagina", visualizacao=visualizacao):
+                if visualizacao == "Projeção": # Tarefa em segundo plano compartilhada entre as sessões (pode ter sido iniciada por outra página)
+                    tarefa = iniciar_tarefa(chave_resultado, gerador_pagina, visualizacao, preparado, maiores_valores, meses_prever, granularidade)
+                    while not tarefa["futuro"].done():
+                        progress.progress(50 + int(49 * tarefa["progresso"]), descricao_progresso(tarefa, "Aguarde... Treinando o modelo de previsão"))
+                        time.sleep(0.5)
+                    resultado = resultado_tarefa(tarefa)
+                    if resultado is AUSENTE: # Descartado pelo orçamento de memória: os caches dos agregados e do modelo tornam o cálculo rápido
+                        resultado = gerador_pagina(visualizacao, preparado, maiores_valores, meses_prever, granularidade)
+                    graficos, agregados = resultado
+                    incorporar_medicoes(tarefa["medicoes"]) # Busca do ARIMA e seleção do modelo, medidas na tarefa
+                else:
+                    graficos, agregados = gerador_pagina(visualizacao, preparado, maiores_valores, meses_prever, granularidade) # Apenas a página selecionada é calculada
+            resumo = preparado["fatia"]["resumo"] # Período, número de vendas e valores nulos calculados junto ao cubo (sem cópia das linhas)
+            vendas = preparado["vendas"]
+            with estagio("gravacao_pagina"):
+                gravar_resultado("paginas", chave_resultado, {"graficos": graficos, "agregados": agregados, "resumo": resumo, "vendas": vendas})
+
+            pagina_projecao = chave_pagina("Projeção", maiores_valores, meses_prever)
+            chave_projecao = chave_armazenamento(id_dados, (coluna_data, coluna_id, coluna_categoria, coluna_valor), chave_periodo(datas), pagina_projecao)
+            if PREVISAO_ANTECIPADA and visualizacao != "Projeção" and not caminho_resultado("paginas", chave_projecao).exists() \
+               and not (pasta_pagina(id_dados, (coluna_data, coluna_id, coluna_categoria, coluna_valor), datas, pagina_projecao) / "dados.pkl").exists():
+                iniciar_tarefa(chave_projecao, gerador_pagina, "Projeção", preparado, maiores_valores, meses_prever) # Pronta quando a Projeção for aberta
             
         progress.progress(100, "Cálculos e Gráficos Gerados...")
+        granularidade_exibida = granularidade if agregados.get("periodos") is not None else "Mensal"
+        if "periodos" in agregados and granularidade_exibida != granularidade: # Cubo sem as linhas (arquivo lido em modo streaming)
+            st.info("Este conjunto de dados foi processado em blocos e contém apenas os totais mensais: as séries temporais são exibidas por mês")
         
         
         col1, col2 = st.columns([0.6,0.4], gap="medium")
@@ -373,18 +343,13 @@ if processar:
         if visualizacao=="Vendas por Categoria":
             with col1:
                 st.subheader("Vendas totais por categoria")
-                st.plotly_chart(fig, use_container_width=True, theme="streamlit" )
+                st.plotly_chart(graficos["fig"], use_container_width=True, theme="streamlit" )
 
-                df_nulos = dados.loc[:, [coluna_data, coluna_id, coluna_categoria, coluna_valor]] # Verificação e remoção de valores nulos 
-                if df_nulos.isnull().values.any(): # Verifica se existem valores nulos no dataframe
-                    nulos = df_nulos.isnull().sum().sum() # Soma todos os valores nulos para exibição na aplicação
-                    data = data.reset_index().dropna() # Remove valores nulos do dataframe para evitar erros nos gráficos
-                    data = data.set_index(coluna_data) # Reconfiguração do índice do dataframe com a coluna de data
-                    
+                nulos = resumo["nulos"] # Valores nulos nas colunas mapeadas, contados durante a construção do cubo
 
                 st.markdown(f""":green[**Descrição:**] *O gráfico acima mostra o total vendido em cada categoria no período selecionado.\
-                            \nExibindo resultados nos gráficos desde a data inicial de ***{(data.index.date.min()).strftime("%d-%m-%Y")}***
-                            até a data final de* ***{(data.index.date.max()).strftime("%d-%m-%Y")}.***""")
+                            \nExibindo resultados nos gráficos desde a data inicial de ***{resumo["data_inicial"].strftime("%d-%m-%Y")}***
+                            até a data final de* ***{resumo["data_final"].strftime("%d-%m-%Y")}.***""")
                 st.markdown("<hr style='border:1px solid green'>", unsafe_allow_html=True)                
                 st.markdown(""":green[**Informação:**] *Para garantir uma visualização mais robusta dos dados filtre as datas com um período
                         de pelo menos 4 meses para obter uma visualização personalizada e dinâmica dos dados. Caso contrário
@@ -396,26 +361,23 @@ if processar:
 
             with col2:
                 st.subheader("Vendas Totais")
-                st.plotly_chart(fig2, use_container_width=True)            
+                st.plotly_chart(graficos["fig2"], use_container_width=True)            
                 st.markdown(f":green[***Informação:***] *O gráfico acima mostra o total em vendas no período selecionado.\
-                            \nTotal de vendas concretizadas no período: <span style='font-size: 20px'>{len(data)}</span> vendas.*", unsafe_allow_html=True)                
+                            \nTotal de vendas concretizadas no período: <span style='font-size: 20px'>{resumo['n_vendas']}</span> vendas.*", unsafe_allow_html=True)                
                 
-                if df_nulos.isnull().values.any(): # Exibição de valores nulos na aplicação para maior transparência
+                if nulos > 0: # Exibição de valores nulos na aplicação para maior transparência
                     st.warning(f"Foram detectados {nulos} valores nulos no conjunto de dados. Esses valores serão desconsiderados nas análises. ")
 
                 st.markdown("<hr style='border:1px solid green'>", unsafe_allow_html=True)            
                 if len(datas) >0: # Se filtros de datas forem aplicados
-                    dados_agrupados = data.copy()  # Trabalhar com uma cópia  
-                    dados_agrupados = dados_agrupados.resample("MS")[coluna_valor].sum()  # Totais somados mensalmente
+                    dados_agrupados = agregados["vendas_mensais"][coluna_valor]  # Totais somados mensalmente
                     soma_periodo_atual = dados_agrupados.sum()  # Soma total do período atual
                     
                     # Ajuste da data inicial dos meses anteriores
                     inicio_periodo_anterior = dados_agrupados.index.min() - pd.DateOffset(months=len(dados_agrupados))
 
                     # Filtragem do período anterior
-                    dados_completos = dados.dropna().copy()
-                    dados_completos[coluna_data] = pd.to_datetime(dados_completos[coluna_data], format='mixed')
-                    dados_completos = dados_completos.set_index(coluna_data)[coluna_valor].resample("MS").sum()                
+                    dados_completos = vendas.set_index(coluna_data)[coluna_valor] # Série mensal completa (não filtrada)
                     periodo_anterior = dados_completos.loc[
                         (dados_completos.index >= inicio_periodo_anterior) & (dados_completos.index < dados_agrupados.index.min())
                     ]
@@ -451,7 +413,7 @@ if processar:
             col1, col2 = st.columns(2, gap="large")
             with col1:            
                 st.subheader("Variação Percentual das Vendas")          
-                st.plotly_chart(fig3, use_container_width=True)            
+                st.plotly_chart(graficos["fig3"], use_container_width=True)            
                 st.markdown("*O gráfico acima exibe o crescimento percentual das Vendas*")
                 st.markdown("<hr style='border:1px solid #1c83e1'>", unsafe_allow_html=True)
                 st.markdown(":blue[**Dica:**]  *Analise a variação percentual nas vendas de acordo com o mês anterior \
@@ -459,9 +421,9 @@ if processar:
                 Insira o número de meses ao lado para um visão mais detalhada se necessário*")
 
             with col2:
-                st.subheader("Vendas Mensais")  
-                st.plotly_chart(fig4, use_container_width=True)            
-                st.markdown("*O gráfico acima exibe o total de Vendas Mensais*")
+                st.subheader(f"Vendas {NOMES_GRANULARIDADES[granularidade_exibida][0]}")  
+                st.plotly_chart(graficos["fig4"], use_container_width=True)            
+                st.markdown(f"*O gráfico acima exibe o total de Vendas {NOMES_GRANULARIDADES[granularidade_exibida][0]}*")
                 st.markdown("<hr style='border:1px solid #1c83e1'>", unsafe_allow_html=True)
                 st.markdown(":blue[**Informação:**] *Analise o gráfico acima para obter uma visão totalizada das vendas de cada mês \
                             e veja a relação com a variação percentual das vendas ao lado \
@@ -474,16 +436,16 @@ if processar:
             col1, col2 = st.columns(2, gap="medium")
             with col1:
                 st.subheader("Ticket Médio por Categoria")
-                st.plotly_chart(fig5, use_container_width=True)
+                st.plotly_chart(graficos["fig5"], use_container_width=True)
                 st.markdown("*O gráfico acima mostra o ticket médio por categoria*")
                 st.markdown("<hr style='border:1px solid #1c83e1'>", unsafe_allow_html=True)            
                 st.markdown(":blue[**Descrição:**] *Veja quanto cada venda em determinada categoria \
                             representa em média.*")
 
             with col2:
-                st.subheader("Ticket Médio por Mês")
-                st.plotly_chart(fig6, use_container_width=True)
-                st.markdown("*O gráfico acima mostra o ticket Médio por Mês*")
+                st.subheader(f"Ticket Médio {NOMES_GRANULARIDADES[granularidade_exibida][1]}")
+                st.plotly_chart(graficos["fig6"], use_container_width=True)
+                st.markdown(f"*O gráfico acima mostra o ticket Médio {NOMES_GRANULARIDADES[granularidade_exibida][1]}*")
                 st.markdown("<hr style='border:1px solid #1c83e1'>", unsafe_allow_html=True)            
                 st.markdown(":blue[**Descrição:**] *Veja o quanto o valor médio de cada venda \
                             pode variar de um mês para o outro*")
@@ -493,7 +455,7 @@ if processar:
             col1, col2 = st.columns(2, gap="medium")
             with col1:
                 st.subheader("*Clientes com Maiores Gastos*")
-                st.plotly_chart(fig7, use_container_width=True)
+                st.plotly_chart(graficos["fig7"], use_container_width=True)
                 st.markdown("*O gráfico acima exibe os clientes com os maiores gastos*")
                 st.markdown("<hr style='border:1px solid green'>", unsafe_allow_html=True)            
                 st.markdown(":green[**Descrição:**] *Veja os clientes com maiores gastos \
@@ -502,7 +464,7 @@ if processar:
 
             with col2:
                 st.subheader("**Clientes Mais Frequentes**")
-                st.plotly_chart(fig8, use_container_width=True)        
+                st.plotly_chart(graficos["fig8"], use_container_width=True)        
                 st.markdown("*O gráfico acima exibe os clientes com maior número de compras*")
                 st.markdown("<hr style='border:1px solid green'>", unsafe_allow_html=True)            
                 st.markdown(":green[**Descrição:**] *Veja com que frequência os melhores clientes compraram na empresa \
@@ -513,24 +475,33 @@ if processar:
             col1, col2 = st.columns(2)
             with col1:
                 st.subheader("*Clientes Recorrentes*")
-                st.plotly_chart(fig9, use_container_width=True)
+                st.plotly_chart(graficos["fig9"], use_container_width=True)
                 st.markdown("<hr style='border:1px solid white'>", unsafe_allow_html=True)
                 st.markdown(":green[**Descrição:**] *O gráfico acima mostra a proporção de clientes que voltaram a comprar durante o período selecionado*")            
-                st.markdown(f"*Valor Médio Vitalício do Cliente(CLV):* <span style='font-size: 25px; font-weight:bold; color: green'>R${clv.iloc[0]:,.2f}</span>", unsafe_allow_html=True)
+                st.markdown(f"*Valor Médio Vitalício do Cliente(CLV):* <span style='font-size: 25px; font-weight:bold; color: green'>R${agregados['clv'].iloc[0]:,.2f}</span>", unsafe_allow_html=True)
                 st.markdown(":green[**Informação:**] *CLV é o valor médio que um cliente gasta durante todo o seu tempo \
                             como cliente da empresa. Observe que esse valor é calculado considerando todas as compras dos clientes \
                             dentro do período selecionado e pode apresentar uma variação significativa \
                             de acordo com o período selecionado*")
 
             with col2:
-                st.subheader("*Taxa de Recorrência Mensal*")
-                st.plotly_chart(fig10, use_container_width=True)
+                st.subheader(f"*Taxa de Recorrência {granularidade_exibida}*")
+                st.plotly_chart(graficos["fig10"], use_container_width=True)
                 st.markdown("<hr style='border:1px solid white'>", unsafe_allow_html=True)
                 st.markdown(":green[**Descrição:**] *O gráfico acima mostra a proporção de clientes com compras recorrentes em um mesmo mês \
                             Altas taxas de recompra indicam que os clientes tendem a ser mais fiéis à empresa realizando mais de uma compra \
                             no mesmo mês enquanto taxas menores indicam baixo engajamento mensal dos clientes. \
                             Observe também que o engajamento tende a diminuir de forma exponencial à medida que \
                             o número de clientes da empresa aumenta*")
+
+            st.markdown("<hr style='border:1px solid white'>", unsafe_allow_html=True)
+            st.subheader("*Retenção por Coorte de Clientes*")
+            st.plotly_chart(graficos["fig12"], use_container_width=True)
+            st.markdown(":green[**Descrição:**] *Cada linha agrupa os clientes pelo mês da sua primeira compra dentro do período selecionado \
+                        (entre parênteses, a quantidade de novos clientes) e cada coluna mostra a proporção desses clientes que voltou a comprar \
+                        após o número de meses indicado. Coortes com retenção mais alta nos primeiros meses indicam aquisições de melhor qualidade, \
+                        enquanto quedas rápidas indicam clientes que compram uma única vez. Observe que clientes que já compravam antes do \
+                        período selecionado são considerados novos no seu primeiro mês dentro do período*")
                 
 
         #Visualização da sexta Página
@@ -538,7 +509,7 @@ if processar:
             col1, col2 = st.columns(2)
             with col1:
                 st.subheader("*Vendas do período anterior*")
-                st.plotly_chart(fig_compar, use_container_width=True)
+                st.plotly_chart(graficos["fig_compar"], use_container_width=True)
                 st.markdown(f"*O gráfico acima mostra as vendas do período anterior ao período previsto de **{meses_prever}** meses*")
                 st.markdown("<hr style='border:1px solid #1E60FF'>", unsafe_allow_html=True)                
                 st.markdown(":blue[**Informação:**] *É importante que você analize as previsões do modelo e as compare com os dados disponíveis, \
@@ -548,19 +519,74 @@ if processar:
             
             with col2:
                 st.subheader("*Previsões para o período selecionado*")
-                st.plotly_chart(grafico_arima, use_container_width=True)                
+                st.plotly_chart(graficos["fig_arima"], use_container_width=True)                
                 st.markdown(f"*O gráfico acima mostra as previsões do modelo para o período selecionado de **{meses_prever}** meses*")
+                selecao = agregados.get("selecao_modelo") # Ausente em snapshots gravados por versões anteriores
+                if selecao is not None:
+                    st.markdown(f"*Modelo selecionado: **{selecao['motor']}**, o de menor erro percentual entre os modelos avaliados \
+                                em {selecao['tempo_s']:.2f}s*")
+                    st.dataframe(selecao["avaliacoes"], hide_index=True, use_container_width=True)
                 st.markdown("<hr style='border:1px solid #1E60FF'>", unsafe_allow_html=True)
                 st.markdown(":blue[**Informação:**] *Note que este modelo foi construído para ser um modelo generalista que se adapta aos dados \
                             da melhor maneira possível, porém à depender da qualidade e quantidade dos dados disponíveis as previsões \
                             podem ter uma certa variação. Por isso é importante se atentar para o erro percentual do modelo \
                             que está disponibilizado abaixo do gráfico com as previsões*")
+
+            st.markdown("<hr style='border:1px solid #1E60FF'>", unsafe_allow_html=True)
+            col3, col4 = st.columns([0.6,0.4], gap="medium")
+            with col3:
+                st.subheader("*Previsões por Categoria*")
+                st.plotly_chart(graficos["fig11"], use_container_width=True)
+                st.markdown(f"*O gráfico acima mostra as previsões de cada categoria para o período selecionado de **{meses_prever}** meses*")
+            with col4:
+                st.subheader("*Modelos por Categoria*")
+                st.dataframe(agregados["tabela_categorias"], use_container_width=True)
+                st.markdown(":blue[**Informação:**] *Cada categoria possui seu próprio modelo, do mesmo tipo do modelo selecionado para as vendas totais. \
+                            O erro percentual é calculado no mesmo período de teste do modelo geral e ajuda a identificar \
+                            as categorias com previsões mais confiáveis*")
+
+            st.markdown("<hr style='border:1px solid #1E60FF'>", unsafe_allow_html=True)
+            st.subheader("*Precisão por Horizonte de Previsão*")
+            if agregados.get("aviso_validacao"): # Páginas pré-calculadas por versões anteriores não têm o aviso
+                st.info(agregados["aviso_validacao"])
+            st.plotly_chart(graficos["fig13"], use_container_width=True)
+            st.markdown(":blue[**Informação:**] *O modelo selecionado é reajustado em várias datas de origem do histórico, cada uma utilizando \
+                        apenas os meses anteriores a ela, e as suas previsões são comparadas às vendas que de fato ocorreram. As barras mostram \
+                        o erro percentual médio (MAPE) para cada número de meses à frente, a linha laranja o erro percentual simétrico (sMAPE) \
+                        e a linha tracejada o MASE, que compara o erro do modelo ao de repetir as vendas do ano anterior (valores abaixo de 1 \
+                        indicam que o modelo supera essa referência). Essa avaliação é mais confiável que o erro de um único período de teste \
+                        e mostra até quantos meses à frente as previsões merecem confiança*")
     except Exception as error:
         st.warning("Atenção. É extremamente importante que você selecione corretamente as colunas do dataframe na barra lateral caso você\
                    tenha feito o upload de um arquivo. Também é importante limpar os filtros de data pois a inserção de datas inexistentes\
                    no conjunto de dados pode gerar dataframes vazios e, consequentemente, erros na aplicação .")
         st.error(f"Erro ao processar os dados inseridos. Por favor, verifique a compatibilidade do dataframe\
                  com a aplicação e tente novamente. Erro técnico encontrado: {error}")
+
+
+#Painel de Desempenho: tempo de relógio, CPU, pico de memória residente durante o estágio e cache de cada estágio desta execução
+with painel_desempenho:
+    tabela_desempenho = pd.DataFrame([{"Estágio": "\u00a0\u00a0" * medicao["nivel"] + medicao["estagio"], "Tempo (s)": medicao.get("tempo_s"),
+                                       "CPU (s)": medicao.get("cpu_s"), "Pico RSS (MB)": medicao.get("rss_pico_mb"),
+                                       "Acréscimo RSS (MB)": medicao.get("rss_acrescimo_mb"), "Cache": medicao.get("cache", "-")}
+                                      for medicao in medicoes])
+    st.dataframe(tabela_desempenho, hide_index=True, use_container_width=True)
+    for medicao in medicoes:
+        if medicao.get("candidatos"): # Busca do ARIMA: cada modelo candidato avaliado e o seu tempo de ajuste
+            st.markdown(f"*Busca do ARIMA: {len(medicao['candidatos'])} modelos avaliados em {medicao.get('tempo_s', 0):.2f}s "
+                        f"({medicao.get('especulados', 0)} ajustes especulativos)*")
+            st.dataframe(pd.DataFrame(medicao["candidatos"]), hide_index=True, use_container_width=True)
+        if medicao.get("motores"): # Seleção do modelo de previsão: erro e tempo de ajuste de cada motor avaliado
+            st.markdown(f"*Seleção do modelo de previsão: {len(medicao['motores'])} motores avaliados, vencedor {medicao.get('motor')}*")
+            st.dataframe(pd.DataFrame(medicao["motores"]), hide_index=True, use_container_width=True)
+    memoria = estatisticas_memoria() # Caches em memória do processo (compartilhados por todas as sessões)
+    st.markdown(f"*Cache em memória: {memoria['total_mb']:.1f} de {memoria['limite_mb']:.0f} MB*")
+    st.dataframe(pd.DataFrame([{"Cache": cache["cache"], "Entradas": cache["entradas"], "Memória (MB)": cache["mb"], "Acertos": cache["acertos"],
+                                "Falhas": cache["falhas"], "Descartes": cache["descartes"]} for cache in memoria["caches"]]),
+                 hide_index=True, use_container_width=True)
+if processar:
+    gravar_log(medicoes, id_dados=id_dados[0], versao_dados=id_dados[1], visualizacao=visualizacao, datas=[str(data) for data in datas],
+               memoria=estatisticas_memoria())
                 
 
 
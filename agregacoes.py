@@ -0,0 +1,464 @@
+import pandas as pd
+import numpy as np
+
+
+
+#Motor de Agregação: as chaves (mês, categoria e cliente) são codificadas em inteiros uma única vez por conjunto de dados
+#e consolidadas em um cubo mensal (mês x categoria x cliente). Todas as métricas do dashboard são obtidas com np.bincount
+#sobre uma fatia do cubo, portanto o filtro de datas escala com o número de meses e não com o número de vendas.
+#O cubo também pode ser construído bloco a bloco (modo streaming), sem manter as linhas em memória
+
+
+#Função de Codificação das chaves (única passagem sobre os dados completos, indexados e ordenados por data)
+def codificador_chaves(data, coluna_id, coluna_categoria, coluna_valor):
+    valores = data[coluna_valor].to_numpy(dtype="float64")
+    validos = ~np.isnan(valores) # Valores nulos são desconsiderados nas somas, contagens e médias (mesmo comportamento do pandas)
+
+    cod_categoria, categorias = pd.factorize(data[coluna_categoria], sort=True) # Categorias nulas recebem o código -1
+    cod_cliente, clientes = pd.factorize(data[coluna_id], sort=True) # Identificações nulas também recebem o código -1 (não são clientes)
+    clientes = np.asarray(clientes) # Apenas os rótulos únicos são materializados; as linhas carregam somente os códigos inteiros
+
+    return compactar_codigos({"datas": data.index.to_numpy(), "nome_datas": data.index.name,
+                              "mes": data.index.year.to_numpy() * 12 + data.index.month.to_numpy() - 1, # Mês ordinal de cada venda
+                              "valores": np.where(validos, valores, 0.0), "validos": validos,
+                              "categoria": cod_categoria, "categorias": pd.Index(categorias, name=coluna_categoria),
+                              "cliente": cod_cliente, "clientes": pd.Index(clientes, name=coluna_id),
+                              "coluna_valor": coluna_valor})
+
+
+#Os códigos por linha ficam no cubo (filtro de datas exato nos meses de borda e séries diárias) com inteiros de 32 bits:
+#meses ordinais e posições de rótulos cabem neles, e as células montadas a partir das linhas voltam a 64 bits
+TIPOS_CODIGOS = {"mes": "int32", "categoria": "int32", "cliente": "int32"}
+
+
+def compactar_codigos(codigos):
+    return dict(codigos, **{chave: codigos[chave].astype(tipo, copy=False) for chave, tipo in TIPOS_CODIGOS.items()})
+
+
+#Células no formato do cubo a partir de um intervalo de linhas (cada linha é uma célula com uma única venda)
+def celulas_linhas(codigos, inicio, fim):
+    valores = codigos["valores"][inicio:fim]
+    return {"mes": codigos["mes"][inicio:fim].astype("int64"), "categoria": codigos["categoria"][inicio:fim].astype("int64"),
+            "cliente": codigos["cliente"][inicio:fim].astype("int64"),
+            "soma": valores, "contagem": codigos["validos"][inicio:fim].astype("int64"), "soma_quadrados": valores ** 2,
+            "linhas": np.ones(fim - inicio, dtype="int64")}
+
+
+#Presença mensal dos clientes (mês, cliente e número de linhas) a partir de células do cubo ou de linhas
+def presenca_mensal(celulas, n_clientes):
+    if len(celulas["mes"]) == 0:
+        return {"mes": np.array([], dtype="int64"), "cliente": np.array([], dtype="int64"), "linhas": np.array([], dtype="int64")}
+    mes_min = celulas["mes"].min()
+    chaves = (celulas["mes"] - mes_min) * (n_clientes + 1) + (celulas["cliente"] + 1) # Chave combinada (mês, cliente) sem MultiIndex
+    pares, inverso = np.unique(chaves, return_inverse=True)
+    return {"mes": pares // (n_clientes + 1) + mes_min, "cliente": pares % (n_clientes + 1) - 1,
+            "linhas": np.bincount(inverso, weights=celulas["linhas"]).astype("int64")}
+
+
+#Agregação de células (ou linhas) por (mês, categoria, cliente): soma, contagem, soma dos quadrados e número de linhas, ordenadas por mês
+#Células de partes diferentes dos dados podem ser concatenadas e agregadas novamente, o que torna o cubo combinável
+def agregar_celulas(celulas, n_categorias, n_clientes):
+    mes_min = celulas["mes"].min() if len(celulas["mes"]) else 0
+    chaves = ((celulas["mes"] - mes_min) * (n_categorias + 1) + (celulas["categoria"] + 1)) * (n_clientes + 1) + (celulas["cliente"] + 1)
+    unicas, inverso = np.unique(chaves, return_inverse=True) # Chaves ordenadas: as células ficam ordenadas por mês
+    resto = unicas // (n_clientes + 1)
+    agregadas = {"mes": resto // (n_categorias + 1) + mes_min, "categoria": resto % (n_categorias + 1) - 1, "cliente": unicas % (n_clientes + 1) - 1}
+    for medida in ("soma", "contagem", "soma_quadrados", "linhas"):
+        agregadas[medida] = np.bincount(inverso, weights=celulas[medida], minlength=len(unicas))
+    for medida in ("contagem", "linhas"):
+        agregadas[medida] = agregadas[medida].astype("int64")
+    return agregadas
+
+
+#Função de Construção do Cubo Mensal a partir das linhas codificadas
+def construtor_cubo(codigos, nulos=0):
+    n_categorias, n_clientes = len(codigos["categorias"]), len(codigos["clientes"])
+    celulas = agregar_celulas(celulas_linhas(codigos, 0, len(codigos["mes"])), n_categorias, n_clientes)
+    return {"celulas": celulas, "presenca": presenca_mensal(celulas, n_clientes), "codigos": codigos, "nulos": nulos,
+            "categorias": codigos["categorias"], "clientes": codigos["clientes"], "coluna_valor": codigos["coluna_valor"], "nome_datas": codigos["nome_datas"]}
+
+
+#Modo Streaming: cada bloco do arquivo é codificado com códigos globais e consolidado em células parciais do cubo,
+#que são combinadas periodicamente. A memória fica limitada ao número de clientes e meses, e não ao número de linhas
+LIMITE_CELULAS_PENDENTES = 2_000_000 # Células parciais acumuladas antes de uma nova consolidação
+
+
+def novo_acumulador(coluna_data, coluna_id, coluna_categoria, coluna_valor):
+    return {"colunas": (coluna_data, coluna_id, coluna_categoria, coluna_valor), "rotulos_categorias": {}, "rotulos_clientes": {},
+            "partes": [], "pendentes": 0, "datas_meses": [], "nulos": 0}
+
+
+#Códigos globais (estáveis entre blocos) para os rótulos de um bloco; apenas os valores únicos do bloco passam pelo dicionário
+def codigos_globais(rotulos, serie):
+    codigos, unicos = pd.factorize(serie)
+    if len(unicos) == 0:
+        return codigos.astype("int64")
+    mapa = np.array([rotulos.setdefault(rotulo, len(rotulos)) for rotulo in unicos], dtype="int64")
+    return np.where(codigos >= 0, mapa[codigos], -1)
+
+
+def consolidar_acumulador(acumulador):
+    n_categorias, n_clientes = len(acumulador["rotulos_categorias"]), len(acumulador["rotulos_clientes"])
+    acumulador["partes"] = [agregar_celulas(concatenar(acumulador["partes"]), n_categorias, n_clientes)]
+    datas_meses = pd.concat(acumulador["datas_meses"])
+    acumulador["datas_meses"] = [datas_meses.groupby(level=0).agg({"min": "min", "max": "max"})]
+    acumulador["pendentes"] = len(acumulador["partes"][0]["mes"])
+
+
+#Incorporação de um bloco (datas já convertidas) às agregações parciais
+def acumular_bloco(acumulador, bloco):
+    coluna_data, coluna_id, coluna_categoria, coluna_valor = acumulador["colunas"]
+    acumulador["nulos"] += int(bloco.isnull().sum().sum())
+    bloco = bloco[bloco[coluna_data].notna()]
+    datas = pd.DatetimeIndex(bloco[coluna_data])
+    valores = bloco[coluna_valor].to_numpy(dtype="float64")
+    validos = ~np.isnan(valores)
+    valores = np.where(validos, valores, 0.0)
+
+    linhas = {"mes": datas.year.to_numpy() * 12 + datas.month.to_numpy() - 1,
+              "categoria": codigos_globais(acumulador["rotulos_categorias"], bloco[coluna_categoria]),
+              "cliente": codigos_globais(acumulador["rotulos_clientes"], bloco[coluna_id]),
+              "soma": valores, "contagem": validos.astype("int64"), "soma_quadrados": valores ** 2, "linhas": np.ones(len(valores), dtype="int64")}
+    acumulador["partes"].append(agregar_celulas(linhas, len(acumulador["rotulos_categorias"]), len(acumulador["rotulos_clientes"])))
+    acumulador["datas_meses"].append(pd.Series(datas).groupby(linhas["mes"]).agg(["min", "max"])) # Primeira e última venda de cada mês
+    acumulador["pendentes"] += len(acumulador["partes"][-1]["mes"])
+    if acumulador["pendentes"] > LIMITE_CELULAS_PENDENTES:
+        consolidar_acumulador(acumulador)
+
+
+#Reordenação dos códigos globais na ordem alfabética dos rótulos (mesma ordem do modo em memória)
+def ordenar_rotulos(rotulos, nome):
+    rotulos = pd.Index(list(rotulos), dtype="object", name=nome)
+    ordem = rotulos.argsort()
+    posto = np.empty(len(ordem), dtype="int64")
+    posto[ordem] = np.arange(len(ordem))
+    return rotulos[ordem], posto
+
+
+#Finalização do modo streaming: cubo equivalente ao construído em memória, sem as linhas
+def finalizar_acumulador(acumulador):
+    coluna_data, coluna_id, coluna_categoria, coluna_valor = acumulador["colunas"]
+    if not acumulador["partes"]:
+        raise ValueError("Nenhuma venda com data válida foi encontrada no arquivo")
+    consolidar_acumulador(acumulador)
+    categorias, posto_categorias = ordenar_rotulos(acumulador["rotulos_categorias"], coluna_categoria)
+    clientes, posto_clientes = ordenar_rotulos(acumulador["rotulos_clientes"], coluna_id)
+
+    celulas = acumulador["partes"][0]
+    celulas["categoria"] = np.where(celulas["categoria"] >= 0, posto_categorias[np.maximum(celulas["categoria"], 0)], -1)
+    celulas["cliente"] = np.where(celulas["cliente"] >= 0, posto_clientes[np.maximum(celulas["cliente"], 0)], -1)
+    celulas = agregar_celulas(celulas, len(categorias), len(clientes))
+
+    return {"celulas": celulas, "presenca": presenca_mensal(celulas, len(clientes)), "codigos": None, "nulos": acumulador["nulos"],
+            "categorias": categorias, "clientes": clientes, "coluna_valor": coluna_valor, "nome_datas": coluna_data,
+            "datas_meses": acumulador["datas_meses"][0]}
+
+
+#Concatenação de células ou presenças de partes distintas do período
+def concatenar(partes):
+    return {chave: np.concatenate([parte[chave] for parte in partes]) for chave in partes[0]}
+
+
+#Modo Incremental: o cubo de um arquivo com novas vendas (delta) é combinado ao cubo já construído, sem reprocessar o histórico
+#Os rótulos dos dois cubos são unificados (mantendo a ordem alfabética) e apenas os códigos são remapeados
+CHAVES_LINHAS = ("datas", "mes", "valores", "validos", "categoria", "cliente") # Arrays por linha dos códigos (modo em memória)
+
+
+def unificar_rotulos(rotulos, novos):
+    rotulos, novos = rotulos.astype("object"), novos.astype("object") # Categorias carregadas como "category" podem ter conjuntos diferentes
+    uniao = rotulos.append(novos).unique()
+    try:
+        uniao = uniao.sort_values()
+    except TypeError: # Rótulos de tipos não comparáveis: mantém a ordem de chegada
+        pass
+    return pd.Index(uniao, dtype="object", name=rotulos.name), uniao.get_indexer(rotulos), uniao.get_indexer(novos)
+
+
+def remapear(codigos, mapa):
+    return np.where(codigos >= 0, mapa[np.maximum(codigos, 0)], -1) if len(mapa) else codigos
+
+
+#Primeira e última venda de cada mês (no modo em memória são obtidas das linhas)
+def datas_meses_cubo(cubo):
+    if cubo["codigos"] is None:
+        return cubo["datas_meses"]
+    return pd.Series(cubo["codigos"]["datas"]).groupby(cubo["codigos"]["mes"]).agg(["min", "max"])
+
+
+def combinar_cubos(cubo, delta):
+    categorias, mapa_categorias, mapa_categorias_delta = unificar_rotulos(cubo["categorias"], delta["categorias"])
+    clientes, mapa_clientes, mapa_clientes_delta = unificar_rotulos(cubo["clientes"], delta["clientes"])
+
+    partes_celulas, partes_presenca = [], []
+    for parte, mapa_cat, mapa_cli in ((cubo, mapa_categorias, mapa_clientes), (delta, mapa_categorias_delta, mapa_clientes_delta)):
+        partes_celulas.append(dict(parte["celulas"], categoria=remapear(parte["celulas"]["categoria"], mapa_cat), cliente=remapear(parte["celulas"]["cliente"], mapa_cli)))
+        partes_presenca.append(dict(parte["presenca"], cliente=remapear(parte["presenca"]["cliente"], mapa_cli)))
+    celulas, presenca = concatenar(partes_celulas), concatenar(partes_presenca)
+    if len(cubo["celulas"]["mes"]) and len(delta["celulas"]["mes"]) and delta["celulas"]["mes"].min() <= cubo["celulas"]["mes"].max():
+        celulas = agregar_celulas(celulas, len(categorias), len(clientes)) # Meses em comum: as células e presenças são somadas
+        presenca = presenca_mensal(presenca, len(clientes))
+    # Caso contrário (apenas meses novos, o caso usual) as partes já estão ordenadas por mês e são apenas concatenadas
+
+    combinado = {"celulas": celulas, "presenca": presenca, "codigos": None, "nulos": cubo["nulos"] + delta["nulos"],
+                 "categorias": categorias, "clientes": clientes, "coluna_valor": cubo["coluna_valor"], "nome_datas": cubo["nome_datas"]}
+    if cubo["codigos"] is not None and delta["codigos"] is not None: # As linhas são mantidas para o filtro de datas exato nos meses de borda
+        partes = [dict(parte["codigos"], categoria=remapear(parte["codigos"]["categoria"], mapa_cat), cliente=remapear(parte["codigos"]["cliente"], mapa_cli))
+                  for parte, mapa_cat, mapa_cli in ((cubo, mapa_categorias, mapa_clientes), (delta, mapa_categorias_delta, mapa_clientes_delta))]
+        codigos = concatenar([{chave: parte[chave] for chave in CHAVES_LINHAS} for parte in partes])
+        if len(partes[1]["datas"]) and len(partes[0]["datas"]) and partes[1]["datas"].min() < partes[0]["datas"].max():
+            ordem = np.argsort(codigos["datas"], kind="stable") # Delta com vendas anteriores às já carregadas
+            codigos = {chave: valores[ordem] for chave, valores in codigos.items()}
+        codigos.update(nome_datas=cubo["nome_datas"], categorias=categorias, clientes=clientes, coluna_valor=cubo["coluna_valor"])
+        combinado["codigos"] = compactar_codigos(codigos)
+    else: # Ao menos uma das partes foi lida em modo streaming: o filtro de datas passa a ser mensal
+        datas_meses = pd.concat([datas_meses_cubo(cubo), datas_meses_cubo(delta)])
+        combinado["datas_meses"] = datas_meses.groupby(level=0).agg({"min": "min", "max": "max"})
+    return combinado
+
+
+#Intervalo de linhas dentro do período selecionado (datas inicial e final inclusivas, como no filtro original)
+def limites_periodo(codigos, datas):
+    inicio, fim = 0, len(codigos["datas"])
+    if len(datas) >= 1:
+        inicio = np.searchsorted(codigos["datas"], np.datetime64(pd.Timestamp(datas[0])), side="left")
+    if len(datas) == 2:
+        fim = np.searchsorted(codigos["datas"], np.datetime64(pd.Timestamp(datas[1])), side="right")
+    return inicio, max(fim, inicio)
+
+
+#Meses do período a partir das linhas: meses completos vêm do cubo e os meses de borda, parcialmente cobertos pelo filtro, vêm das linhas
+def meses_periodo_linhas(codigos, datas):
+    inicio, fim = limites_periodo(codigos, datas)
+    if inicio == fim:
+        raise ValueError("Nenhuma venda encontrada no período selecionado")
+
+    mes = codigos["mes"]
+    mes_inicio, mes_fim = int(mes[inicio]), int(mes[fim - 1])
+    primeiro_completo = mes_inicio if np.searchsorted(mes, mes_inicio, side="left") == inicio else mes_inicio + 1
+    ultimo_completo = mes_fim if np.searchsorted(mes, mes_fim, side="right") == fim else mes_fim - 1
+
+    partes_linhas = []
+    if primeiro_completo > ultimo_completo:
+        partes_linhas.append((inicio, fim)) # Nenhum mês completo no período: apenas as linhas são utilizadas
+    else:
+        if primeiro_completo > mes_inicio:
+            partes_linhas.append((inicio, np.searchsorted(mes, primeiro_completo, side="left")))
+        if ultimo_completo < mes_fim:
+            partes_linhas.append((np.searchsorted(mes, ultimo_completo, side="right"), fim))
+
+    datas_limite = (pd.Timestamp(codigos["datas"][inicio]), pd.Timestamp(codigos["datas"][fim - 1]))
+    return mes_inicio, mes_fim, primeiro_completo, ultimo_completo, partes_linhas, datas_limite
+
+
+#Meses do período sem as linhas (modo streaming): o filtro de datas é aplicado na granularidade mensal
+def meses_periodo_agregados(cubo, datas):
+    datas_meses = cubo["datas_meses"]
+    mes_datas = [pd.Timestamp(data).year * 12 + pd.Timestamp(data).month - 1 for data in datas]
+    selecao = (datas_meses.index >= (mes_datas[0] if len(mes_datas) >= 1 else datas_meses.index.min())) & \
+              (datas_meses.index <= (mes_datas[1] if len(mes_datas) == 2 else datas_meses.index.max()))
+    if not selecao.any():
+        raise ValueError("Nenhuma venda encontrada no período selecionado")
+    mes_inicio, mes_fim = datas_meses.index[selecao].min(), datas_meses.index[selecao].max()
+    datas_limite = (datas_meses.loc[mes_inicio, "min"], datas_meses.loc[mes_fim, "max"])
+    return mes_inicio, mes_fim, mes_inicio, mes_fim, [], datas_limite
+
+
+#Função de Fatiamento do Cubo para o período selecionado
+def fatiador_cubo(cubo, datas=()):
+    codigos = cubo["codigos"]
+    if codigos is None:
+        mes_inicio, mes_fim, primeiro_completo, ultimo_completo, partes_linhas, datas_limite = meses_periodo_agregados(cubo, datas)
+    else:
+        mes_inicio, mes_fim, primeiro_completo, ultimo_completo, partes_linhas, datas_limite = meses_periodo_linhas(codigos, datas)
+
+    celulas, presencas = [], []
+    if primeiro_completo <= ultimo_completo:
+        a = np.searchsorted(cubo["celulas"]["mes"], primeiro_completo, side="left")
+        b = np.searchsorted(cubo["celulas"]["mes"], ultimo_completo, side="right")
+        celulas.append({chave: valores[a:b] for chave, valores in cubo["celulas"].items()})
+        a = np.searchsorted(cubo["presenca"]["mes"], primeiro_completo, side="left")
+        b = np.searchsorted(cubo["presenca"]["mes"], ultimo_completo, side="right")
+        presencas.append({chave: valores[a:b] for chave, valores in cubo["presenca"].items()})
+    for a, b in partes_linhas:
+        celulas.append(celulas_linhas(codigos, a, b))
+        presencas.append(presenca_mensal(celulas[-1], len(cubo["clientes"])))
+
+    celulas, presenca = concatenar(celulas), concatenar(presencas)
+    celulas["mes"] = celulas["mes"] - mes_inicio # Meses relativos ao início do período
+    presenca["mes"] = presenca["mes"] - mes_inicio
+    meses = pd.date_range(pd.Timestamp(year=mes_inicio // 12, month=mes_inicio % 12 + 1, day=1), periods=mes_fim - mes_inicio + 1, freq="MS", name=cubo["nome_datas"])
+
+    resumo = {"data_inicial": datas_limite[0], "data_final": datas_limite[1], "n_vendas": int(celulas["contagem"].sum()), "nulos": cubo["nulos"]}
+    return {"celulas": celulas, "presenca": presenca, "meses": meses, "resumo": resumo,
+            "categorias": cubo["categorias"], "clientes": cubo["clientes"], "coluna_valor": cubo["coluna_valor"]}
+
+
+#Fatias Diárias e Semanais: mesma estrutura da fatia mensal, em que "mes" é a posição do dia ou da semana no período,
+#de modo que metricas_mensais e metricas_recompra são reaproveitadas sem alteração. São construídas a partir das linhas
+#(cubos em memória) ou de uma consulta SQL; cubos sem linhas (modo streaming) só têm a granularidade mensal
+PASSOS_PERIODO = {"D": np.timedelta64(1, "D"), "W": np.timedelta64(7, "D")}
+
+
+#Início do dia ou da semana (segunda-feira, como no ISO 8601) de cada data
+def inicio_periodos(datas, granularidade):
+    dias = np.asarray(datas).astype("datetime64[D]")
+    if granularidade == "W":
+        dias = dias - (dias.astype("int64") + 3) % 7 # 01/01/1970 foi uma quinta-feira
+    return dias
+
+
+def fatia_periodos(inicios, cliente, soma, contagem, linhas, clientes, granularidade, nome_datas, coluna_valor):
+    primeiro = inicios.min()
+    posicao = ((inicios - primeiro) // PASSOS_PERIODO[granularidade]).astype("int64")
+    celulas = {"mes": posicao, "cliente": cliente, "soma": soma, "contagem": contagem, "linhas": linhas}
+    periodos = pd.date_range(primeiro, periods=posicao.max() + 1, freq=pd.Timedelta(PASSOS_PERIODO[granularidade]), name=nome_datas)
+    return {"celulas": celulas, "presenca": presenca_mensal(celulas, len(clientes)), "meses": periodos, "clientes": clientes, "coluna_valor": coluna_valor}
+
+
+def fatiador_periodos(cubo, datas, granularidade):
+    codigos = cubo["codigos"]
+    if codigos is None:
+        return None
+    inicio, fim = limites_periodo(codigos, datas)
+    if inicio == fim:
+        raise ValueError("Nenhuma venda encontrada no período selecionado")
+    celulas = celulas_linhas(codigos, inicio, fim)
+    return fatia_periodos(inicio_periodos(codigos["datas"][inicio:fim], granularidade), celulas["cliente"], celulas["soma"], celulas["contagem"],
+                          celulas["linhas"], cubo["clientes"], granularidade, cubo["nome_datas"], cubo["coluna_valor"])
+
+
+#Soma, contagem e número de linhas por código (base de todas as métricas); códigos negativos (nulos) são ignorados
+def somas_contagens(fatia, chave, tamanho):
+    celulas = fatia["celulas"]
+    selecao = celulas[chave] >= 0
+    codigos = celulas[chave][selecao]
+    return tuple(np.bincount(codigos, weights=celulas[medida][selecao], minlength=tamanho) for medida in ("soma", "contagem", "linhas"))
+
+
+MAX_CLIENTES_EXIBIDOS = 20 # Maior quantidade de clientes selecionável nos gráficos (Clientes Engajados)
+
+
+#Seleção parcial dos n maiores valores (sem ordenar todos os clientes): np.partition encontra o limite e apenas os candidatos
+#são ordenados, em ordem decrescente e com empates na ordem dos rótulos
+def indices_maiores(valores, n):
+    if n < len(valores):
+        limite = np.partition(valores, len(valores) - n)[len(valores) - n]
+        candidatos = np.flatnonzero(valores >= limite)
+    else:
+        candidatos = np.arange(len(valores))
+    return candidatos[np.lexsort((candidatos, -valores[candidatos]))][:n]
+
+
+def media(soma, contagem):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(contagem > 0, soma / np.maximum(contagem, 1), np.nan)
+
+
+#Total de Vendas do período
+def metricas_totais(fatia):
+    return {"total_vendas": fatia["celulas"]["soma"].sum()}
+
+
+#Métricas Mensais: vendas, crescimento percentual e ticket médio por mês
+def metricas_mensais(fatia):
+    soma, contagem, _ = somas_contagens(fatia, "mes", len(fatia["meses"]))
+    return tabelas_mensais(soma, contagem, fatia["meses"], fatia["coluna_valor"])
+
+
+#Tabelas mensais a partir da soma e da contagem de cada mês (compartilhadas com o backend SQL)
+def tabelas_mensais(soma, contagem, meses, coluna_valor):
+    vendas_mensais = pd.DataFrame({coluna_valor: soma}, index=meses)
+    crescimento_perc = vendas_mensais[[coluna_valor]].pct_change() *100
+    ticket_medio_mes = pd.DataFrame({coluna_valor: media(soma, contagem)}, index=meses)
+    return {"vendas_mensais": vendas_mensais, "crescimento_perc": crescimento_perc, "ticket_medio_mes": ticket_medio_mes}
+
+
+#Métricas por Categoria: Top 10 categorias por soma de vendas e por ticket médio
+def metricas_categorias(fatia):
+    coluna_valor, categorias = fatia["coluna_valor"], fatia["categorias"]
+    soma, contagem, linhas = somas_contagens(fatia, "categoria", len(categorias))
+    presentes = linhas > 0 # Apenas categorias com vendas no período
+    vendas_por_categoria = pd.DataFrame({coluna_valor: soma[presentes]}, index=categorias[presentes]).nlargest(10, coluna_valor)   #Top 10 categorias mais vendidas
+    ticket_medio_categoria = pd.DataFrame({coluna_valor: media(soma, contagem)[presentes]}, index=categorias[presentes]).nlargest(10, coluna_valor) #Top 10 categorias com maior ticket médio
+    return {"vendas_por_categoria": vendas_por_categoria, "ticket_medio_categoria": ticket_medio_categoria}
+
+
+#Métricas por Cliente: gastos, frequência, taxa de retenção geral e CLV
+def metricas_clientes(fatia):
+    coluna_valor, clientes = fatia["coluna_valor"], fatia["clientes"]
+    soma, contagem, linhas = somas_contagens(fatia, "cliente", len(clientes))
+    presentes = np.flatnonzero(linhas > 0) # Apenas clientes com compras no período
+    #Apenas os clientes exibidos nos gráficos (já ordenados) são mantidos e apenas os seus rótulos são consultados
+    melhores = presentes[indices_maiores(soma[presentes], MAX_CLIENTES_EXIBIDOS)]
+    frequentes = presentes[indices_maiores(contagem[presentes], MAX_CLIENTES_EXIBIDOS)]
+    melhores_clientes = pd.DataFrame({coluna_valor: soma[melhores]}, index=clientes[melhores])
+    clientes_frequentes = pd.DataFrame({coluna_valor: contagem[frequentes].astype("int64")}, index=clientes[frequentes])
+    taxa_retencao = np.count_nonzero(contagem[presentes] > 1) / len(presentes) if len(presentes) else np.nan #Cálculo Retenção de Clientes Geral
+    clv = pd.Series({coluna_valor: soma[presentes].mean() if len(presentes) else np.nan})
+    return {"melhores_clientes": melhores_clientes, "clientes_frequentes": clientes_frequentes, "taxa_retencao": taxa_retencao, "clv": clv}
+
+
+#Taxa de Recompra Mensal: proporção de clientes com mais de uma compra no mesmo mês
+def metricas_recompra(fatia):
+    presenca, meses = fatia["presenca"], fatia["meses"]
+    identificados = presenca["cliente"] >= 0
+    total_clientes = np.bincount(presenca["mes"][identificados], minlength=len(meses))
+    clientes_recorrentes = np.bincount(presenca["mes"][identificados & (presenca["linhas"] > 1)], minlength=len(meses)) #Identifica os clientes que fizeram mais de uma compra no mesmo mês.
+    return tabela_recompra(total_clientes, clientes_recorrentes, meses)
+
+
+def tabela_recompra(total_clientes, clientes_recorrentes, meses):
+    taxa_recompra = pd.Series(np.nan_to_num(media(clientes_recorrentes, total_clientes)), index=meses) #Divide o número de clientes recorrentes pelo total de clientes (por mês)
+    return {"taxa_recompra": taxa_recompra}
+
+
+#Retenção por Coorte de aquisição: clientes ativos em cada mês desde a primeira compra no período, por mês da primeira compra
+#Cada par (mês, cliente) da presença mensal é único, portanto a matriz é um único bincount sobre a chave (coorte, meses desde a aquisição)
+def metricas_coortes(fatia):
+    presenca, meses = fatia["presenca"], fatia["meses"]
+    n_meses = len(meses)
+    selecao = presenca["cliente"] >= 0
+    ordem = np.argsort(presenca["mes"][selecao], kind="stable") # Já chegam quase ordenadas por mês (apenas os meses de borda ficam ao final)
+    mes, cliente = presenca["mes"][selecao][ordem], presenca["cliente"][selecao][ordem]
+
+    limites = np.searchsorted(mes, np.arange(n_meses + 1))
+    primeira_compra = np.full(len(fatia["clientes"]), -1, dtype="int64")
+    for m in range(n_meses - 1, -1, -1): # Do último para o primeiro mês: cada cliente termina com o mês da sua primeira compra
+        primeira_compra[cliente[limites[m]:limites[m + 1]]] = m
+    coorte = primeira_compra[cliente]
+    ativos = np.bincount(coorte * n_meses + (mes - coorte), minlength=n_meses * n_meses).reshape(n_meses, n_meses)
+    return tabelas_coortes(ativos, meses)
+
+
+#Retenção e tamanho das coortes a partir da matriz de clientes ativos (coorte x meses desde a aquisição)
+def tabelas_coortes(ativos, meses):
+    n_meses = len(meses)
+    tamanho = ativos[:, 0]
+    observados = np.add.outer(np.arange(n_meses), np.arange(n_meses)) < n_meses # Meses após o fim do período ficam vazios
+    retencao = np.where(observados, media(ativos, tamanho[:, None]), np.nan)
+    manter = tamanho > 0
+    retencao_coortes = pd.DataFrame(retencao[manter], index=meses[manter], columns=pd.RangeIndex(n_meses, name="Meses desde a aquisição"))
+    return {"retencao_coortes": retencao_coortes, "tamanho_coortes": pd.Series(tamanho[manter], index=meses[manter])}
+
+
+#Séries Mensais por grupo (categoria ou cliente): matriz meses x grupos em uma única passada de bincount
+#Sem códigos informados são usados todos os grupos com vendas no período; meses sem vendas do grupo ficam com zero
+def series_mensais(fatia, chave, rotulos, codigos=None):
+    celulas, n_meses = fatia["celulas"], len(fatia["meses"])
+    selecao = celulas[chave] >= 0
+    if codigos is None:
+        codigos = np.flatnonzero(np.bincount(celulas[chave][selecao], weights=celulas["linhas"][selecao], minlength=len(rotulos)) > 0)
+    posicao = np.full(len(rotulos), -1)
+    posicao[codigos] = np.arange(len(codigos))
+    grupos = posicao[celulas[chave][selecao]]
+    manter = grupos >= 0
+    soma = np.bincount(grupos[manter] * n_meses + celulas["mes"][selecao][manter], weights=celulas["soma"][selecao][manter], minlength=len(codigos) * n_meses)
+    return pd.DataFrame(soma.reshape(len(codigos), n_meses).T, index=fatia["meses"], columns=rotulos[codigos])
+
+
+#Pacote completo de métricas do dashboard
+def calcular_metricas(fatia):
+    metricas = {}
+    for calcular in (metricas_totais, metricas_mensais, metricas_categorias, metricas_clientes, metricas_recompra):
+        metricas.update(calcular(fatia))
+    return metricas
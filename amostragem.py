@@ -0,0 +1,52 @@
+import os
+import numpy as np
+
+
+
+#Redução de Séries Temporais para os gráficos: séries diárias ou semanais de vários anos têm milhares de pontos, que travam
+#o navegador no desenho em SVG e aumentam a mensagem enviada pelo websocket. Antes de montar o gráfico, cada série é reduzida
+#no servidor a no máximo PONTOS_GRAFICO pontos (aproximadamente a largura do gráfico em pixels), preservando a forma da curva:
+#LTTB (Largest-Triangle-Three-Buckets) para linhas e mínimo/máximo por intervalo para totais, que mantém os picos e os vales
+
+PONTOS_GRAFICO = int(os.environ.get("ANALISEDADOS_PONTOS_GRAFICO", 1200)) # Pontos enviados ao navegador por série
+LIMITE_SVG = 500 # Séries com mais pontos são desenhadas em WebGL (Scattergl)
+
+
+#LTTB: o primeiro e o último pontos são mantidos e, em cada intervalo intermediário, é escolhido o ponto que forma o maior
+#triângulo com o ponto escolhido no intervalo anterior e com a média do intervalo seguinte
+def lttb(x, y, n):
+    if n >= len(x) or n < 3:
+        return np.arange(len(x))
+    posicoes = np.asarray(x, dtype="float64")
+    limites = np.linspace(1, len(x) - 1, n - 1).astype("int64") # n - 2 intervalos entre o primeiro e o último pontos
+    indices = np.empty(n, dtype="int64")
+    indices[0], indices[-1] = 0, len(x) - 1
+    for i in range(n - 2):
+        a, b = limites[i], limites[i + 1]
+        c, d = b, limites[i + 2] if i + 2 < n - 1 else len(x)
+        media_x, media_y = posicoes[c:d].mean(), y[c:d].mean()
+        anterior = indices[i]
+        areas = np.abs((posicoes[anterior] - media_x) * (y[a:b] - y[anterior]) - (posicoes[anterior] - posicoes[a:b]) * (media_y - y[anterior]))
+        indices[i + 1] = a + np.argmax(areas)
+    return indices
+
+
+#Mínimo e máximo de cada intervalo (no máximo dois pontos por intervalo, na ordem do tempo), em uma única ordenação
+def minimo_maximo(x, y, n):
+    if n >= len(x) or n < 2:
+        return np.arange(len(x))
+    intervalos = np.repeat(np.arange(n // 2), np.diff(np.linspace(0, len(x), n // 2 + 1).astype("int64")))
+    ordem = np.lexsort((y, intervalos)) # Dentro de cada intervalo, do menor para o maior valor
+    inicios = np.searchsorted(intervalos[ordem], np.arange(n // 2))
+    fins = np.append(inicios[1:], len(x)) - 1
+    return np.unique(np.concatenate([ordem[inicios], ordem[fins]]))
+
+
+#Redução de uma série (eixo x em datas ou números): pontos nulos ou infinitos são descartados antes da redução
+def reduzir_serie(x, y, metodo="lttb", n=PONTOS_GRAFICO):
+    x, y = np.asarray(x), np.asarray(y, dtype="float64")
+    validos = np.isfinite(y)
+    x, y = x[validos], y[validos]
+    posicoes = x.astype("datetime64[ns]").astype("int64") if np.issubdtype(x.dtype, np.datetime64) else x
+    indices = lttb(posicoes, y, n) if metodo == "lttb" else minimo_maximo(posicoes, y, n)
+    return x[indices], y[indices]
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+from pathlib import Path
+
+
+
+#Armazenamento Persistente de Resultados: bases preparadas, modelos ajustados, previsões e páginas (agregados e gráficos)
+#são gravados em disco, chaveados pela impressão digital dos dados, pelo mapeamento de colunas e pelos parâmetros,
+#e ficam disponíveis para todas as réplicas da aplicação que compartilham a pasta e após reinicializações.
+#A pasta é a mesma dos arquivos Parquet dos uploads e todo o seu conteúdo obedece a um limite de tamanho, com descarte
+#dos arquivos usados há mais tempo (LRU). A escrita é atômica e a leitura tolera arquivos removidos por outro processo
+
+PASTA_ARMAZENAMENTO = Path(os.environ.get("ANALISEDADOS_CACHE", ".cache_dados")) # Pasta compartilhada entre os processos da aplicação
+LIMITE_ARMAZENAMENTO = int(os.environ.get("ANALISEDADOS_LIMITE_CACHE_MB", 2048)) << 20 # Tamanho máximo da pasta (Parquet e resultados)
+PERSISTIR_RESULTADOS = os.environ.get("ANALISEDADOS_PERSISTIR_RESULTADOS", "1") != "0" # "0" desativa a leitura e a gravação de resultados
+VERSAO_RESULTADOS = 3 # Incrementar sempre que o formato de algum resultado persistido mudar
+IDADE_TEMPORARIOS = 3600 # Arquivos temporários mais antigos que isso (em segundos) são restos de escritas interrompidas
+INTERVALO_VARREDURA = 60 # Segundos entre varreduras completas da pasta (incorporam as escritas e os descartes das demais réplicas)
+
+_tamanhos = {} # Pasta -> {"bytes": tamanho estimado, "varredura": horário da última varredura completa}
+_trava = threading.Lock()
+
+
+#Temporário exclusivo do processo e da thread: escritas simultâneas do mesmo arquivo nunca compartilham o temporário
+def caminho_temporario(caminho):
+    return caminho.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+#Escrita atômica: leitores concorrentes nunca veem um arquivo incompleto. Retorna o tamanho gravado em bytes
+def escrever_arquivo(caminho, conteudo):
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    temporario = caminho_temporario(caminho)
+    try:
+        temporario.write_bytes(conteudo)
+        os.replace(temporario, caminho)
+    except Exception:
+        temporario.unlink(missing_ok=True)
+        raise
+    return len(conteudo)
+
+
+#Chave estável entre processos (o hash() do Python muda a cada execução)
+def chave_armazenamento(*partes):
+    return hashlib.sha1(repr((VERSAO_RESULTADOS,) + partes).encode()).hexdigest()
+
+
+def caminho_resultado(tipo, chave):
+    return PASTA_ARMAZENAMENTO / "resultados" / tipo / f"{chave}.pkl"
+
+
+#Registro do uso de um arquivo para o descarte LRU: o horário de acesso é atualizado e o de modificação preservado,
+#pois é ele que identifica a versão do arquivo nos caches em memória
+def marcar_uso(caminho):
+    try:
+        os.utime(caminho, (time.time(), caminho.stat().st_mtime))
+    except OSError:
+        pass
+
+
+def ler_resultado(tipo, chave):
+    if not PERSISTIR_RESULTADOS:
+        return None
+    caminho = caminho_resultado(tipo, chave)
+    try:
+        with open(caminho, "rb") as arquivo:
+            resultado = pickle.load(arquivo)
+    except FileNotFoundError:
+        return None
+    except Exception: # Arquivo corrompido ou gravado por uma versão incompatível
+        caminho.unlink(missing_ok=True)
+        return None
+    marcar_uso(caminho)
+    return resultado
+
+
+def gravar_resultado(tipo, chave, resultado):
+    if not PERSISTIR_RESULTADOS:
+        return
+    try:
+        tamanho = escrever_arquivo(caminho_resultado(tipo, chave), pickle.dumps(resultado, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return # Resultado não serializável ou pasta sem permissão de escrita: continua disponível apenas em memória
+    limitar_armazenamento(acrescimo=tamanho)
+
+
+#Descarte LRU: remove os arquivos usados há mais tempo até que a pasta volte ao limite de tamanho
+#Vários processos podem executar o descarte ao mesmo tempo; arquivos já removidos por outro processo são ignorados
+#Após cada escrita (acrescimo em bytes) o tamanho estimado da pasta é apenas atualizado; ela só é percorrida quando a
+#estimativa passa do limite, quando não há estimativa ou a cada INTERVALO_VARREDURA segundos
+def limitar_armazenamento(pasta=None, limite=None, acrescimo=None):
+    pasta, limite = Path(pasta or PASTA_ARMAZENAMENTO), LIMITE_ARMAZENAMENTO if limite is None else limite
+    arquivos, total, agora = [], 0, time.time()
+    with _trava:
+        estimativa = _tamanhos.get(pasta)
+        if acrescimo is not None and estimativa is not None and agora - estimativa["varredura"] < INTERVALO_VARREDURA:
+            estimativa["bytes"] += acrescimo
+            if estimativa["bytes"] <= limite:
+                return
+    for raiz, _, nomes in os.walk(pasta):
+        for nome in nomes:
+            caminho = Path(raiz) / nome
+            try:
+                estado = caminho.stat()
+            except OSError:
+                continue
+            if nome.endswith(".tmp"):
+                if agora - estado.st_mtime > IDADE_TEMPORARIOS:
+                    caminho.unlink(missing_ok=True)
+                continue # Escrita em andamento em outro processo
+            arquivos.append((max(estado.st_atime, estado.st_mtime), estado.st_size, caminho))
+            total += estado.st_size
+    if total > limite:
+        for _, tamanho, caminho in sorted(arquivos, key=lambda arquivo: arquivo[0]):
+            try:
+                caminho.unlink()
+            except OSError: # Já removido por outro processo ou em uso (Windows)
+                continue
+            total -= tamanho
+            if total <= limite:
+                break
+    with _trava:
+        _tamanhos[pasta] = {"bytes": total, "varredura": agora}
@@ -0,0 +1,270 @@
+import argparse
+import ast
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import plotly.express as px
+from pathlib import Path
+import armazenamento
+import ingestao
+import snapshots
+from ingestao import LIMITE_STREAMING, carregador_colunar, carregador_streaming, converter_datas, detectar_codificacao
+from paineis import AGREGADOS, GRANULARIDADES, MODULOS_TARDIOS, PAGINAS, divisao_treino_teste, gerador_previsao, gerador_previsao_lote, gerador_validacao, impressao_serie, preparar_base, preparar_periodo, treinador_modelo
+
+
+
+#Suíte de Benchmark: mede tempo e pico de memória de cada estágio do pipeline (carregamento, conversão das datas,
+#preparação do cubo, fatias, cada agregado, seleção do modelo de previsão e cada gráfico) em dados sintéticos de tamanhos crescentes
+#e nos arquivos de exemplo, grava o resultado em JSON e o compara com um resultado de referência:
+#    python benchmark.py --linhas 10000 100000 1000000 --saida resultados.json
+#    python benchmark.py --linhas 10000 100000 1000000 --baseline resultados.json
+#A inicialização a frio (importação dos módulos e primeira renderização) é medida em processos novos, no conjunto "inicializacao"
+
+COLUNAS_SINTETICAS = ("Order_Date", "Customer_ID", "Category", "Sales")
+ARQUIVOS_EXEMPLO = {"superstore_final_dataset.csv": ("Order_Date", "Customer_ID", "Category", "Sales"),
+                    "ecommerce_product_sales.csv": ("Sale Date", "Sale ID", "Category", "Total Sales"),
+                    "ecommerce_sales_analysis.csv": ("sales_month_1", "product_id", "category", "price")} # Sem coluna de data: registra onde o pipeline falha
+AGREGADOS_PREVISAO = ("previsao", "previsao_categorias", "validacao") # Medidos separadamente, após a seleção do modelo de previsão
+GRAFICOS_PERIODOS = ("fig3", "fig4", "fig6", "fig10") # Gráficos das séries temporais, medidos também nas granularidades semanal e diária
+TOLERANCIA = 0.25 # Aumento relativo de tempo ou memória considerado regressão
+LIMIAR_TEMPO = 0.05 # Diferenças absolutas menores que 50ms são tratadas como ruído
+LIMIAR_MEMORIA = 5.0 # Diferenças absolutas menores que 5MB são tratadas como ruído
+ARQUIVO_APLICACAO = Path(__file__).parent / "AnaliseDados.py"
+CODIGO_IMPORTACAO = "import time; inicio = time.perf_counter(); import {modulos}; print(time.perf_counter() - inicio)"
+CODIGO_IMPORTACAO_TARDIA = "import {modulos}; import time; inicio = time.perf_counter(); import {tardios}; print(time.perf_counter() - inicio)"
+CODIGO_RENDERIZACAO = ("from streamlit.testing.v1 import AppTest; import time; aplicacao = AppTest.from_file({arquivo!r}, default_timeout=600); "
+                       "inicio = time.perf_counter(); aplicacao.run(); print(time.perf_counter() - inicio)")
+
+
+#Gerador de transações sintéticas no esquema da aplicação (data, cliente, categoria e valor), gravado em blocos
+#para permitir arquivos de dezenas de milhões de linhas sem materializá-los em memória
+def gerar_transacoes(caminho, n_linhas, n_clientes=50_000, n_categorias=20, anos=4, semente=0, linhas_por_bloco=1_000_000):
+    rng = np.random.default_rng(semente)
+    dias = pd.date_range("2015-01-01", periods=anos * 365, freq="D").strftime("%d/%m/%Y").to_numpy() # Formato brasileiro, como no upload típico
+    clientes = np.char.add("C-", np.arange(n_clientes).astype(str))
+    categorias = np.char.add("Categoria ", np.arange(n_categorias).astype(str))
+    pesos_categorias = rng.dirichlet(np.ones(n_categorias)) # Categorias com participações diferentes
+
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        arquivo.write(",".join(COLUNAS_SINTETICAS) + "\n")
+        for inicio in range(0, n_linhas, linhas_por_bloco):
+            n = min(linhas_por_bloco, n_linhas - inicio)
+            bloco = pd.DataFrame({"Order_Date": dias[rng.integers(0, len(dias), n)],
+                                  "Customer_ID": clientes[np.minimum(rng.zipf(1.3, n) - 1, n_clientes - 1)], # Poucos clientes concentram muitas compras
+                                  "Category": categorias[rng.choice(n_categorias, n, p=pesos_categorias)],
+                                  "Sales": rng.lognormal(4, 1, n).round(2)})
+            bloco.to_csv(arquivo, header=False, index=False)
+    return caminho
+
+
+#Medição de um estágio: tempo de relógio e pico de memória alocada pelo Python e pelo NumPy durante a execução
+def medir(resultados, estagio, funcao, *args):
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+        memoria_inicial = tracemalloc.get_traced_memory()[0]
+    inicio = time.perf_counter()
+    try:
+        retorno = funcao(*args)
+    except Exception as erro:
+        resultados[estagio] = {"erro": f"{type(erro).__name__}: {erro}"}
+        raise
+    resultados[estagio] = {"tempo_s": round(time.perf_counter() - inicio, 4)}
+    if tracemalloc.is_tracing():
+        resultados[estagio]["pico_mb"] = round((tracemalloc.get_traced_memory()[1] - memoria_inicial) / 2**20, 2)
+    return retorno
+
+
+#Execução de todos os estágios para um arquivo (os caches em disco e em memória são isolados para medir execuções a frio)
+def executar_estagios(caminho, colunas, arima=True, maiores_valores=10, meses_prever=12):
+    resultados = {}
+    coluna_data, coluna_id, coluna_categoria, coluna_valor = colunas
+    for memorizada in (treinador_modelo, gerador_previsao, gerador_previsao_lote, gerador_validacao):
+        memorizada.clear()
+    try:
+        if caminho.stat().st_size > LIMITE_STREAMING:
+            data = medir(resultados, "carregamento_streaming", carregador_streaming, caminho, *colunas)
+        else:
+            conteudo = caminho.read_bytes()
+            data, _ = medir(resultados, "carregamento", carregador_colunar, conteudo, *colunas)
+            medir(resultados, "carregamento_cache", carregador_colunar, conteudo, *colunas) # Segunda leitura: cache em Parquet
+            datas_brutas = pd.read_csv(caminho, usecols=[coluna_data], encoding=detectar_codificacao(conteudo))[coluna_data]
+            medir(resultados, "conversao_datas", converter_datas, datas_brutas)
+
+        base = medir(resultados, "preparacao_base", preparar_base, data, *colunas)
+        meses = base["vendas"][coluna_data]
+        periodo = (meses.iloc[len(meses) // 4].date(), meses.iloc[3 * len(meses) // 4].date()) # Metade central do período
+        medir(resultados, "fatia_filtrada", preparar_periodo, base, *colunas, periodo)
+        preparado = medir(resultados, "fatia_completa", preparar_periodo, base, *colunas, ())
+
+        parametros = dict(preparado["colunas"], maiores_valores=maiores_valores, meses_prever=meses_prever, granularidade="Mensal")
+        agregados = {}
+        for nome, (funcao, _) in AGREGADOS.items():
+            if nome not in AGREGADOS_PREVISAO:
+                agregados.update(medir(resultados, f"agregado_{nome}", funcao, preparado, parametros))
+        if arima:
+            vendas = preparado["vendas"]
+            medir(resultados, "selecao_modelo", treinador_modelo, impressao_serie(vendas), *divisao_treino_teste(vendas, coluna_valor))
+            for nome in AGREGADOS_PREVISAO: # Reutilizam o modelo agregado ajustado acima
+                agregados.update(medir(resultados, f"agregado_{nome}", AGREGADOS[nome][0], preparado, parametros))
+
+        for pagina in PAGINAS.values():
+            if arima or not set(pagina["agregados"]) & set(AGREGADOS_PREVISAO):
+                for nome, gerar in pagina["graficos"].items():
+                    medir(resultados, f"grafico_{nome}", gerar, agregados, parametros)
+        graficos = {nome: gerar for pagina in PAGINAS.values() for nome, gerar in pagina["graficos"].items()}
+        for granularidade, codigo in GRANULARIDADES.items():
+            if codigo is not None: # Séries de todo o período, reduzidas para o gráfico (estágios com sufixo _d e _w)
+                parametros_periodos = dict(parametros, granularidade=granularidade)
+                periodos = medir(resultados, f"agregado_periodos_{codigo.lower()}", AGREGADOS["periodos"][0], preparado, parametros_periodos)
+                for nome in GRAFICOS_PERIODOS:
+                    medir(resultados, f"grafico_{nome}_{codigo.lower()}", graficos[nome], dict(agregados, **periodos), parametros_periodos)
+    except Exception as erro:
+        if not any("erro" in medida for medida in resultados.values()): # Falha fora de um estágio medido
+            resultados["execucao"] = {"erro": f"{type(erro).__name__}: {erro}"}
+    return resultados
+
+
+def executar(args):
+    with tempfile.TemporaryDirectory() as pasta_temporaria:
+        ingestao.PASTA_CACHE = armazenamento.PASTA_ARMAZENAMENTO = Path(pasta_temporaria) / "cache" # Nenhum cache de execuções anteriores é reaproveitado
+        armazenamento.PERSISTIR_RESULTADOS = False # Cada repetição mede o cálculo, e não a leitura de resultados gravados pela anterior
+        snapshots.PASTA_SNAPSHOTS = Path(pasta_temporaria) / "snapshots"
+        conjuntos = {}
+        if not args.sem_exemplos:
+            for arquivo, colunas in ARQUIVOS_EXEMPLO.items():
+                conjuntos[arquivo] = (Path(__file__).parent / arquivo, colunas)
+        for n_linhas in args.linhas:
+            caminho = Path(pasta_temporaria) / f"sintetico_{n_linhas}.csv"
+            print(f"Gerando {n_linhas:,} transações sintéticas...", file=sys.stderr)
+            conjuntos[f"sintetico_{n_linhas}"] = (gerar_transacoes(caminho, n_linhas, args.clientes, args.categorias, semente=args.semente), COLUNAS_SINTETICAS)
+
+        px.bar(x=[0], y=[0]).to_dict() # Aquecimento: o primeiro gráfico do processo inicializa os templates do Plotly
+        resultado = {"metadados": {"python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+                                   "plataforma": platform.platform(), "cpus": os.cpu_count(), "memoria": args.memoria,
+                                   "data": time.strftime("%Y-%m-%d %H:%M:%S")}, "conjuntos": {}}
+        for nome, (caminho, colunas) in conjuntos.items():
+            print(f"Executando {nome}...", file=sys.stderr)
+            repeticoes = [executar_estagios(caminho, colunas, arima=not args.sem_arima) for _ in range(args.repeticoes)]
+            if args.memoria: # Passagem separada: o tracemalloc deixa as alocações de objetos Python várias vezes mais lentas
+                tracemalloc.start()
+                repeticoes.append(executar_estagios(caminho, colunas, arima=not args.sem_arima))
+                tracemalloc.stop()
+            resultado["conjuntos"][nome] = {"linhas": sum(1 for _ in open(caminho, "rb")) - 1, "estagios": combinar_repeticoes(repeticoes)}
+        if args.inicializacao:
+            print("Medindo a inicialização...", file=sys.stderr)
+            resultado["conjuntos"]["inicializacao"] = {"linhas": 0, "estagios": medir_inicializacao(args.repeticoes)}
+    return resultado
+
+
+#Inicialização a frio: cada medida é feita em um processo novo, como em uma nova réplica da aplicação, com a pasta de
+#armazenamento vazia e sem o aquecimento e a Projeção antecipada (que disputariam a CPU com a medida)
+#Importação dos módulos da aplicação, primeira renderização da página inicial e importação das bibliotecas adiadas
+def modulos_aplicacao():
+    arvore = ast.parse(ARQUIVO_APLICACAO.read_text(encoding="utf-8"))
+    modulos = {no.module for no in arvore.body if isinstance(no, ast.ImportFrom)}
+    modulos.update(apelido.name for no in arvore.body if isinstance(no, ast.Import) for apelido in no.names)
+    return ", ".join(sorted(modulos))
+
+
+def tempo_processo(codigo):
+    with tempfile.TemporaryDirectory() as pasta_temporaria:
+        ambiente = dict(os.environ, ANALISEDADOS_CACHE=str(Path(pasta_temporaria) / "cache"), ANALISEDADOS_SNAPSHOTS=str(Path(pasta_temporaria) / "snapshots"),
+                        ANALISEDADOS_AQUECIMENTO="0", ANALISEDADOS_PREVISAO_ANTECIPADA="0")
+        saida = subprocess.run([sys.executable, "-c", codigo], cwd=ARQUIVO_APLICACAO.parent, env=ambiente, capture_output=True, text=True)
+    if saida.returncode != 0:
+        raise RuntimeError(saida.stderr.strip().splitlines()[-1] if saida.stderr.strip() else f"código de saída {saida.returncode}")
+    return float(saida.stdout.strip().splitlines()[-1])
+
+
+def medir_inicializacao(repeticoes):
+    modulos = modulos_aplicacao()
+    medidas = {"importacao_modulos": CODIGO_IMPORTACAO.format(modulos=modulos),
+               "primeira_renderizacao": CODIGO_RENDERIZACAO.format(arquivo=str(ARQUIVO_APLICACAO)),
+               "importacao_previsao": CODIGO_IMPORTACAO_TARDIA.format(modulos=modulos, tardios=", ".join(MODULOS_TARDIOS))}
+    estagios = {}
+    for estagio, codigo in medidas.items():
+        try:
+            estagios[estagio] = {"tempo_s": round(min(tempo_processo(codigo) for _ in range(repeticoes)), 4)}
+        except Exception as erro:
+            estagios[estagio] = {"erro": f"{type(erro).__name__}: {erro}"}
+    return estagios
+
+
+#Menor tempo entre as repetições cronometradas e pico de memória da passagem com o tracemalloc (sempre a última)
+def combinar_repeticoes(repeticoes):
+    estagios = {}
+    for resultados in repeticoes:
+        for estagio, medida in resultados.items():
+            atual = estagios.setdefault(estagio, {chave: valor for chave, valor in medida.items() if chave != "pico_mb"})
+            if "pico_mb" in medida and "tempo_s" in atual:
+                atual["pico_mb"] = medida["pico_mb"]
+            elif "tempo_s" in medida and "tempo_s" in atual:
+                atual["tempo_s"] = min(atual["tempo_s"], medida["tempo_s"])
+    return estagios
+
+
+#Tabela estágio x conjunto (curvas de escala: o mesmo estágio em conjuntos de tamanhos crescentes)
+def imprimir_tabela(resultado):
+    tabela = pd.DataFrame({nome: {estagio: medida.get("tempo_s", "erro") for estagio, medida in conjunto["estagios"].items()}
+                           for nome, conjunto in resultado["conjuntos"].items()})
+    with pd.option_context("display.max_rows", None, "display.max_columns", None, "display.width", 200):
+        print(tabela.fillna("-"))
+
+
+#Comparação com um resultado de referência: retorna as regressões de tempo e de memória acima da tolerância
+def comparar(resultado, referencia, tolerancia=TOLERANCIA):
+    regressoes = []
+    for nome, conjunto in resultado["conjuntos"].items():
+        estagios_referencia = referencia["conjuntos"].get(nome, {}).get("estagios", {})
+        for estagio, medida in conjunto["estagios"].items():
+            anterior = estagios_referencia.get(estagio, {})
+            if "erro" in medida and "erro" not in anterior and anterior:
+                regressoes.append(f"{nome}/{estagio}: passou a falhar ({medida['erro']})")
+            for chave, limiar in (("tempo_s", LIMIAR_TEMPO), ("pico_mb", LIMIAR_MEMORIA)):
+                if chave in medida and chave in anterior and medida[chave] - anterior[chave] > limiar \
+                        and medida[chave] > anterior[chave] * (1 + tolerancia):
+                    regressoes.append(f"{nome}/{estagio}: {chave} {anterior[chave]} -> {medida[chave]} ({medida[chave] / max(anterior[chave], 1e-9):.2f}x)")
+    return regressoes
+
+
+def argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Mede tempo e memória de cada estágio da aplicação em dados sintéticos e nos arquivos de exemplo.")
+    parser.add_argument("--linhas", type=int, nargs="*", default=[10_000, 100_000, 1_000_000], help="Tamanhos dos conjuntos sintéticos (10 mil a 50 milhões de linhas)")
+    parser.add_argument("--clientes", type=int, default=50_000, help="Número de clientes distintos dos dados sintéticos")
+    parser.add_argument("--categorias", type=int, default=20, help="Número de categorias distintas dos dados sintéticos")
+    parser.add_argument("--semente", type=int, default=0, help="Semente do gerador de dados sintéticos")
+    parser.add_argument("--repeticoes", type=int, default=1, help="Repetições de cada conjunto (menor tempo é mantido)")
+    parser.add_argument("--sem-exemplos", action="store_true", help="Não executa os arquivos de exemplo")
+    parser.add_argument("--sem-arima", action="store_true", help="Não mede a seleção do modelo de previsão e as previsões")
+    parser.add_argument("--sem-inicializacao", dest="inicializacao", action="store_false", help="Não mede a importação dos módulos e a primeira renderização")
+    parser.add_argument("--sem-memoria", dest="memoria", action="store_false", help="Não executa a passagem adicional de medição de memória")
+    parser.add_argument("--saida", type=Path, help="Arquivo JSON para gravar o resultado")
+    parser.add_argument("--baseline", type=Path, help="Resultado de referência para comparação")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA, help="Aumento relativo considerado regressão")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = argumentos(argv)
+    resultado = executar(args)
+    imprimir_tabela(resultado)
+    if args.saida:
+        args.saida.write_text(json.dumps(resultado, indent=2, ensure_ascii=False))
+    if args.baseline:
+        referencia = json.loads(args.baseline.read_text())
+        regressoes = comparar(resultado, referencia, args.tolerancia)
+        for regressao in regressoes:
+            print("REGRESSÃO", regressao)
+        return 1 if regressoes else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
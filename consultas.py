@@ -0,0 +1,240 @@
+import os
+import re
+import threading
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from agregacoes import MAX_CLIENTES_EXIBIDOS, PASSOS_PERIODO, metricas_categorias, metricas_clientes, metricas_coortes, metricas_mensais, metricas_recompra, metricas_totais, tabela_recompra, tabelas_coortes, tabelas_mensais
+from armazenamento import marcar_uso
+
+
+
+#Backend SQL (DuckDB, opcional): os dados carregados ficam em arquivos Parquet consultados por um banco DuckDB embutido no processo,
+#sem manter as linhas em memória. O filtro de datas e todas as agregações são executados em SQL, com leitura colunar e em várias
+#threads: a fatia do período guarda apenas as condições da consulta, e cada métrica (mensais, top 10 de categorias, clientes,
+#recompra e coortes) é uma consulta que retorna somente a tabela final, sem transferir células ou clientes para o Python.
+#Os resultados têm o mesmo formato e os mesmos valores do backend pandas (paridade verificada por paridade.py e pelos testes)
+
+BACKENDS = ("pandas", "duckdb")
+BACKEND = os.environ.get("ANALISEDADOS_BACKEND", "pandas") # "duckdb" ativa o backend SQL (requer o pacote duckdb)
+THREADS_SQL = int(os.environ.get("ANALISEDADOS_THREADS_SQL", 0)) # Threads do DuckDB (0 = uma por núcleo, o padrão do DuckDB)
+
+if BACKEND not in BACKENDS:
+    raise ValueError(f"ANALISEDADOS_BACKEND inválido: {BACKEND} (use {' ou '.join(BACKENDS)})")
+
+_conexao = None
+_trava_conexao = threading.Lock()
+_cursores = threading.local()
+
+
+#Conexão do processo (banco em memória, criado sob demanda) e um cursor por thread: cada sessão do Streamlit e cada tarefa
+#em segundo plano consulta o mesmo banco sem compartilhar o estado das consultas
+def cursor_sql():
+    global _conexao
+    cursor = getattr(_cursores, "cursor", None)
+    if cursor is not None:
+        return cursor
+    with _trava_conexao:
+        if _conexao is None:
+            try:
+                import duckdb
+            except ImportError:
+                raise RuntimeError("O backend SQL requer o pacote duckdb (pip install duckdb) ou ANALISEDADOS_BACKEND=pandas") from None
+            _conexao = duckdb.connect(config={"threads": THREADS_SQL} if THREADS_SQL > 0 else {})
+        _cursores.cursor = _conexao.cursor()
+    return _cursores.cursor
+
+
+def identificador(coluna):
+    return '"' + str(coluna).replace('"', '""') + '"'
+
+
+#Fonte de dados do backend SQL: arquivos Parquet (o arquivo convertido e os anexos, na ordem) e o mapeamento de colunas
+def fonte_sql(arquivos, coluna_data, coluna_id, coluna_categoria, coluna_valor):
+    return {"arquivos": [str(arquivo) for arquivo in arquivos], "coluna_data": coluna_data, "coluna_id": coluna_id,
+            "coluna_categoria": coluna_categoria, "coluna_valor": coluna_valor}
+
+
+def e_fonte_sql(data):
+    return isinstance(data, dict) and "arquivos" in data
+
+
+#Fonte acrescida de um arquivo com novas vendas: as consultas leem todos os arquivos (vendas repetidas são somadas, como no cubo)
+def combinar_fontes(fonte, delta):
+    return dict(fonte, arquivos=fonte["arquivos"] + delta["arquivos"])
+
+
+def consultar(fonte, sql, parametros=None):
+    for arquivo in fonte["arquivos"]: # Os arquivos em uso não são os primeiros descartados pelo limite do armazenamento
+        marcar_uso(Path(arquivo))
+    nomes = set(re.findall(r"\$(\w+)", sql)) # O DuckDB não aceita parâmetros que a consulta não utiliza
+    parametros = {nome: valor for nome, valor in dict(parametros or {}, arquivos=fonte["arquivos"]).items() if nome in nomes}
+    return cursor_sql().execute(sql, parametros).df()
+
+
+#Valores nulos nas colunas mapeadas (mesma contagem do backend pandas: colunas repetidas no mapeamento contam uma única vez)
+def nulos_sql(fonte):
+    colunas = dict.fromkeys([fonte["coluna_data"], fonte["coluna_id"], fonte["coluna_categoria"], fonte["coluna_valor"]])
+    contagens = " + ".join(f"count(*) - count({identificador(coluna)})" for coluna in colunas)
+    return int(consultar(fonte, f"SELECT {contagens} AS nulos FROM read_parquet($arquivos)")["nulos"].iloc[0])
+
+
+#Condições do período selecionado (datas inicial e final inclusivas, como no filtro do cubo) e os seus parâmetros
+def filtro_datas(fonte, datas):
+    data = identificador(fonte["coluna_data"])
+    condicoes, parametros = [f"{data} IS NOT NULL"], {}
+    if len(datas) >= 1:
+        condicoes.append(f"{data} >= $inicio")
+        parametros["inicio"] = pd.Timestamp(datas[0]).to_pydatetime()
+    if len(datas) == 2:
+        condicoes.append(f"{data} <= $fim")
+        parametros["fim"] = pd.Timestamp(datas[1]).to_pydatetime()
+    return " AND ".join(condicoes), parametros
+
+
+#Função de Fatiamento em SQL: apenas os limites do período são consultados; a posição de cada venda no período (mês relativo
+#ao início, como nas células de fatiador_cubo) é uma expressão SQL reaplicada pelas consultas das métricas
+def fatia_sql(fonte, datas=()):
+    data = identificador(fonte["coluna_data"])
+    condicoes, parametros = filtro_datas(fonte, datas)
+    mes = f"year({data}) * 12 + month({data}) - 1"
+    limites = consultar(fonte, f"""
+        SELECT min({mes}) AS mes_inicio, max({mes}) AS mes_fim, min({data}) AS inicio, max({data}) AS fim,
+               count({identificador(fonte["coluna_valor"])}) AS n_vendas
+        FROM read_parquet($arquivos) WHERE {condicoes}""", parametros).iloc[0]
+    if pd.isna(limites["inicio"]):
+        raise ValueError("Nenhuma venda encontrada no período selecionado")
+
+    mes_inicio, mes_fim = int(limites["mes_inicio"]), int(limites["mes_fim"])
+    meses = pd.date_range(pd.Timestamp(year=mes_inicio // 12, month=mes_inicio % 12 + 1, day=1), periods=mes_fim - mes_inicio + 1, freq="MS", name=fonte["coluna_data"])
+    resumo = {"data_inicial": pd.Timestamp(limites["inicio"]), "data_final": pd.Timestamp(limites["fim"]), "n_vendas": int(limites["n_vendas"]),
+              "nulos": fonte.get("nulos", 0)}
+    return {"fonte": fonte, "condicoes": condicoes, "parametros": dict(parametros, origem=mes_inicio), "posicao": f"{mes} - $origem",
+            "meses": meses, "resumo": resumo, "coluna_valor": fonte["coluna_valor"]}
+
+
+UNIDADES_SQL = {"D": "day", "W": "week"} # date_trunc('week') começa as semanas na segunda-feira, como inicio_periodos
+
+
+#Fatia diária ou semanal em SQL: mesma estrutura da fatia mensal, em que a posição é a do dia ou da semana no período
+def fatia_periodos_sql(fonte, datas, granularidade):
+    data = identificador(fonte["coluna_data"])
+    condicoes, parametros = filtro_datas(fonte, datas)
+    inicio = f"date_trunc('{UNIDADES_SQL[granularidade]}', {data})"
+    limites = consultar(fonte, f"SELECT min({inicio}) AS primeiro, max({inicio}) AS ultimo FROM read_parquet($arquivos) WHERE {condicoes}", parametros).iloc[0]
+    if pd.isna(limites["primeiro"]):
+        raise ValueError("Nenhuma venda encontrada no período selecionado")
+    primeiro, passo = pd.Timestamp(limites["primeiro"]), pd.Timedelta(PASSOS_PERIODO[granularidade])
+    periodos = pd.date_range(primeiro, pd.Timestamp(limites["ultimo"]), freq=passo, name=fonte["coluna_data"])
+    return {"fonte": fonte, "condicoes": condicoes, "parametros": dict(parametros, primeiro=primeiro.to_pydatetime()),
+            "posicao": f"date_diff('day', $primeiro, {inicio}) // {passo.days}", "meses": periodos, "coluna_valor": fonte["coluna_valor"]}
+
+
+def e_fatia_sql(fatia):
+    return "condicoes" in fatia
+
+
+#Consulta sobre as vendas da fatia: {vendas} é a leitura filtrada pelo período, {posicao} o mês (ou dia e semana) relativo ao
+#início e {valor}, {categoria} e {cliente} as colunas mapeadas
+def consultar_fatia(fatia, sql):
+    fonte = fatia["fonte"]
+    vendas = f"(SELECT * FROM read_parquet($arquivos) WHERE {fatia['condicoes']})"
+    return consultar(fonte, sql.format(vendas=vendas, posicao=fatia["posicao"], valor=identificador(fonte["coluna_valor"]),
+                                       categoria=identificador(fonte["coluna_categoria"]), cliente=identificador(fonte["coluna_id"])), fatia["parametros"])
+
+
+#Valores de cada posição do período (posições sem vendas ficam com zero)
+def por_posicao(tabela, coluna, n):
+    valores = np.zeros(n, dtype=tabela[coluna].dtype if len(tabela) else "float64")
+    valores[tabela["posicao"].to_numpy(dtype="int64")] = tabela[coluna].to_numpy()
+    return valores
+
+
+def metricas_totais_sql(fatia):
+    total = consultar_fatia(fatia, "SELECT coalesce(sum({valor}), 0) AS total FROM {vendas}")["total"].iloc[0]
+    return {"total_vendas": np.float64(total)}
+
+
+def metricas_mensais_sql(fatia):
+    mensais = consultar_fatia(fatia, "SELECT {posicao} AS posicao, coalesce(sum({valor}), 0) AS soma, count({valor}) AS contagem FROM {vendas} GROUP BY ALL")
+    n = len(fatia["meses"])
+    return tabelas_mensais(por_posicao(mensais, "soma", n).astype("float64"), por_posicao(mensais, "contagem", n).astype("int64"), fatia["meses"], fatia["coluna_valor"])
+
+
+#Top 10 categorias por soma e por ticket médio (empates na ordem dos rótulos, como o nlargest do backend pandas)
+def metricas_categorias_sql(fatia):
+    coluna_valor, coluna_categoria = fatia["coluna_valor"], fatia["fonte"]["coluna_categoria"]
+    categorias = consultar_fatia(fatia, """
+        SELECT categoria, soma, ticket, row_number() OVER (ORDER BY soma DESC, categoria) AS posicao_soma,
+               row_number() OVER (ORDER BY ticket DESC NULLS LAST, categoria) AS posicao_ticket
+        FROM (SELECT {categoria} AS categoria, coalesce(sum({valor}), 0) AS soma, sum({valor}) / count({valor}) AS ticket
+              FROM {vendas} WHERE {categoria} IS NOT NULL GROUP BY ALL)
+        QUALIFY posicao_soma <= 10 OR (posicao_ticket <= 10 AND ticket IS NOT NULL)""")
+    soma = categorias[categorias["posicao_soma"] <= 10].sort_values("posicao_soma")
+    ticket = categorias[(categorias["posicao_ticket"] <= 10) & categorias["ticket"].notna()].sort_values("posicao_ticket")
+    return {"vendas_por_categoria": pd.DataFrame({coluna_valor: soma["soma"].to_numpy(dtype="float64")}, index=pd.Index(soma["categoria"].to_numpy(), name=coluna_categoria)),
+            "ticket_medio_categoria": pd.DataFrame({coluna_valor: ticket["ticket"].to_numpy(dtype="float64")}, index=pd.Index(ticket["categoria"].to_numpy(), name=coluna_categoria))}
+
+
+#Clientes com mais gastos e mais compras, taxa de retenção geral e CLV: os totais por cliente ficam no DuckDB e apenas os
+#clientes exibidos (e as contagens de todos os clientes, calculadas como funções de janela) são transferidos
+def metricas_clientes_sql(fatia):
+    coluna_valor, coluna_id = fatia["coluna_valor"], fatia["fonte"]["coluna_id"]
+    clientes = consultar_fatia(fatia, f"""
+        SELECT cliente, soma, contagem, row_number() OVER (ORDER BY soma DESC, cliente) AS posicao_soma,
+               row_number() OVER (ORDER BY contagem DESC, cliente) AS posicao_contagem, count(*) OVER () AS n_clientes,
+               count(*) FILTER (WHERE contagem > 1) OVER () AS recorrentes, avg(soma) OVER () AS clv
+        FROM (SELECT {{cliente}} AS cliente, coalesce(sum({{valor}}), 0) AS soma, count({{valor}}) AS contagem
+              FROM {{vendas}} WHERE {{cliente}} IS NOT NULL GROUP BY ALL)
+        QUALIFY posicao_soma <= {MAX_CLIENTES_EXIBIDOS} OR posicao_contagem <= {MAX_CLIENTES_EXIBIDOS}""")
+    melhores = clientes[clientes["posicao_soma"] <= MAX_CLIENTES_EXIBIDOS].sort_values("posicao_soma")
+    frequentes = clientes[clientes["posicao_contagem"] <= MAX_CLIENTES_EXIBIDOS].sort_values("posicao_contagem")
+    n_clientes = int(clientes["n_clientes"].iloc[0]) if len(clientes) else 0
+    return {"melhores_clientes": pd.DataFrame({coluna_valor: melhores["soma"].to_numpy(dtype="float64")}, index=pd.Index(melhores["cliente"].to_numpy(), name=coluna_id)),
+            "clientes_frequentes": pd.DataFrame({coluna_valor: frequentes["contagem"].to_numpy(dtype="int64")}, index=pd.Index(frequentes["cliente"].to_numpy(), name=coluna_id)),
+            "taxa_retencao": int(clientes["recorrentes"].iloc[0]) / n_clientes if n_clientes else np.nan,
+            "clv": pd.Series({coluna_valor: float(clientes["clv"].iloc[0]) if n_clientes else np.nan})}
+
+
+#Clientes distintos e clientes com mais de uma compra em cada posição do período
+def metricas_recompra_sql(fatia):
+    recompra = consultar_fatia(fatia, """
+        SELECT posicao, count(*) AS clientes, count(*) FILTER (WHERE linhas > 1) AS recorrentes
+        FROM (SELECT {posicao} AS posicao, {cliente}, count(*) AS linhas FROM {vendas} WHERE {cliente} IS NOT NULL GROUP BY ALL)
+        GROUP BY posicao""")
+    n = len(fatia["meses"])
+    return tabela_recompra(por_posicao(recompra, "clientes", n).astype("int64"), por_posicao(recompra, "recorrentes", n).astype("int64"), fatia["meses"])
+
+
+#Clientes ativos por coorte (mês da primeira compra no período) e meses desde a aquisição
+def metricas_coortes_sql(fatia):
+    ativos = consultar_fatia(fatia, """
+        WITH presenca AS (SELECT DISTINCT {posicao} AS posicao, {cliente} AS cliente FROM {vendas} WHERE {cliente} IS NOT NULL)
+        SELECT coorte, posicao - coorte AS idade, count(*) AS ativos
+        FROM presenca JOIN (SELECT cliente, min(posicao) AS coorte FROM presenca GROUP BY cliente) USING (cliente)
+        GROUP BY ALL""")
+    n = len(fatia["meses"])
+    matriz = np.zeros((n, n), dtype="int64")
+    matriz[ativos["coorte"].to_numpy(dtype="int64"), ativos["idade"].to_numpy(dtype="int64")] = ativos["ativos"].to_numpy(dtype="int64")
+    return tabelas_coortes(matriz, fatia["meses"])
+
+
+#Séries mensais de cada categoria com vendas no período (matriz meses x categorias, como series_mensais)
+def series_categorias_sql(fatia):
+    celulas = consultar_fatia(fatia, """
+        SELECT {posicao} AS posicao, {categoria} AS categoria, coalesce(sum({valor}), 0) AS soma
+        FROM {vendas} WHERE {categoria} IS NOT NULL GROUP BY ALL""")
+    codigos, categorias = pd.factorize(celulas["categoria"], sort=True)
+    series = np.zeros((len(fatia["meses"]), len(categorias)))
+    series[celulas["posicao"].to_numpy(dtype="int64"), codigos] = celulas["soma"].to_numpy(dtype="float64")
+    return pd.DataFrame(series, index=fatia["meses"], columns=pd.Index(np.asarray(categorias), name=fatia["fonte"]["coluna_categoria"]))
+
+
+#Métrica do motor de agregação -> consulta equivalente do backend SQL
+METRICAS_SQL = {metricas_totais: metricas_totais_sql, metricas_mensais: metricas_mensais_sql, metricas_categorias: metricas_categorias_sql,
+                metricas_clientes: metricas_clientes_sql, metricas_recompra: metricas_recompra_sql, metricas_coortes: metricas_coortes_sql}
+
+
+#Métrica de uma fatia do cubo ou da fatia SQL
+def calcular_metrica(metrica, fatia):
+    return METRICAS_SQL[metrica](fatia) if e_fatia_sql(fatia) else metrica(fatia)
@@ -0,0 +1,282 @@
+import pandas as pd
+import codecs
+import hashlib
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from pathlib import Path
+from armazenamento import PASTA_ARMAZENAMENTO, caminho_temporario, limitar_armazenamento, marcar_uso
+from agregacoes import acumular_bloco, finalizar_acumulador, novo_acumulador
+
+
+
+#Pipeline de Ingestão Colunar: a codificação é detectada a partir de uma amostra, os bytes são lidos diretamente pelo pandas
+#(sem decodificar o arquivo inteiro em memória), apenas as quatro colunas mapeadas são carregadas e o resultado é persistido
+#em Parquet, indexado pelo hash do arquivo, para que novas execuções e reconexões carreguem os dados em milissegundos
+
+PASTA_CACHE = PASTA_ARMAZENAMENTO # Pasta dos arquivos Parquet gerados a partir dos uploads (sujeitos ao limite de tamanho do armazenamento)
+TAMANHO_AMOSTRA = 1 << 16 # 64KB são suficientes para identificar a codificação na grande maioria dos arquivos
+VERSAO_CACHE = 2 # Incrementar sempre que o formato dos dados persistidos mudar
+TAMANHO_AMOSTRA_DATAS = 2000 # Quantidade de valores distribuídos ao longo da coluna usados para detectar o formato das datas
+FORMATOS_DATA = ["%m/%d/%Y", "%d/%m/%Y", "%Y-%m-%d", "%m-%d-%Y", "%d-%m-%Y", "%Y/%m/%d", "%m/%d/%Y %H:%M", "%d/%m/%Y %H:%M",
+                 "%Y-%m-%d %H:%M:%S", "ISO8601"] # Em datas ambíguas o mês vem primeiro, como no format="mixed" usado antes da detecção
+UNIDADES_EPOCH = {"s": (1e8, 1e10), "ms": (1e11, 1e13)} # Faixas plausíveis para datas em segundos ou milissegundos desde 1970
+LIMITE_STREAMING = int(os.environ.get("ANALISEDADOS_LIMITE_STREAMING_MB", 100)) << 20 # Arquivos maiores são processados em blocos (modo streaming)
+TAMANHO_COPIA = 1 << 24 # Blocos de 16MB na cópia de um upload para o arquivo temporário
+LINHAS_POR_BLOCO = 500_000
+
+
+#Detecção da codificação a partir de uma amostra do início do arquivo
+def detectar_codificacao(conteudo):
+    amostra = conteudo[:TAMANHO_AMOSTRA]
+    if amostra.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(amostra, final=False) # Ignora caracteres multibyte cortados no final da amostra
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+#Formatos compatíveis com uma amostra distribuída ao longo da coluna, na ordem de prioridade (None se não houver datas)
+def formatos_compativeis(serie):
+    serie = serie.dropna()
+    amostra = serie.iloc[::max(len(serie) // TAMANHO_AMOSTRA_DATAS, 1)].unique()
+    if len(amostra) == 0:
+        return None
+    if pd.api.types.is_numeric_dtype(amostra):
+        return ["epoch_" + unidade for unidade, (minimo, maximo) in UNIDADES_EPOCH.items() if amostra.min() >= minimo and amostra.max() < maximo]
+    amostra = pd.Series(amostra, dtype="object").astype(str).str.strip()
+    return [formato for formato in FORMATOS_DATA if pd.to_datetime(amostra, format=formato, errors="coerce").notna().all()]
+
+
+#Detecção do formato das datas a partir de uma amostra distribuída ao longo da coluna
+def detectar_formato_data(serie):
+    compativeis = formatos_compativeis(serie)
+    return compativeis[0] if compativeis else None
+
+
+#Formato das datas de um arquivo lido em blocos: a amostra de cada bloco elimina os formatos incompatíveis e o formato é fixado
+#antes da conversão, com a evidência de todo o arquivo (um arquivo ordenado cujo primeiro bloco só tem dias até 12 não é
+#lido com o dia e o mês trocados nesse bloco). Apenas a coluna de datas é lida nesta passagem
+def detectar_formato_arquivo(fonte, coluna_data, codificacao, linhas_por_bloco):
+    compativeis = None
+    with pd.read_csv(fonte, usecols=[coluna_data], encoding=codificacao, chunksize=linhas_por_bloco) as leitor:
+        for bloco in leitor:
+            formatos = formatos_compativeis(bloco[coluna_data])
+            if formatos is not None:
+                compativeis = formatos if compativeis is None else [formato for formato in compativeis if formato in formatos]
+    if hasattr(fonte, "seek"):
+        fonte.seek(0)
+    return compativeis[0] if compativeis else None
+
+
+#Conversão vetorizada da coluna de datas com um formato já detectado (formato "mixed" apenas se nenhum formato for identificado)
+#Na leitura em blocos (estrito) valores fora do formato do arquivo são um erro: cada bloco teria a sua própria interpretação
+def converter_com_formato(serie, formato, estrito=False):
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    if formato is None:
+        return pd.to_datetime(serie, format="mixed")
+    if formato.startswith("epoch_"):
+        return pd.to_datetime(serie, unit=formato.split("_")[1])
+    try:
+        return pd.to_datetime(serie.astype(str).str.strip() if serie.dtype == object else serie, format=formato, cache=True)
+    except ValueError as erro: # Valores fora do padrão que não apareceram na amostra
+        if estrito:
+            raise ValueError(f"Datas fora do formato {formato} detectado no arquivo: {erro}") from None
+        return pd.to_datetime(serie, format="mixed")
+
+
+def converter_datas(serie):
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    return converter_com_formato(serie, detectar_formato_data(serie))
+
+
+#Leitura apenas do cabeçalho (nomes das colunas disponíveis para o mapeamento)
+def ler_cabecalho(conteudo, codificacao=None):
+    codificacao = codificacao or detectar_codificacao(conteudo)
+    return list(pd.read_csv(BytesIO(conteudo), nrows=0, encoding=codificacao).columns)
+
+
+#Leitura das colunas mapeadas com tipos compactos: identificação e categoria como "category" e valor como float64
+def ler_colunas(conteudo, coluna_data, coluna_id, coluna_categoria, coluna_valor, codificacao):
+    colunas = list(dict.fromkeys([coluna_data, coluna_id, coluna_categoria, coluna_valor])) # Remove colunas repetidas no mapeamento
+    tipos = {coluna_id: "category", coluna_categoria: "category"}
+    for coluna in (coluna_data, coluna_valor):
+        tipos.pop(coluna, None) # Datas e valores não podem ser categóricos, mesmo se mapeados junto com outra coluna
+    data = pd.read_csv(BytesIO(conteudo), usecols=colunas, dtype=tipos, encoding=codificacao)[colunas]
+    try:
+        data[coluna_data] = converter_datas(data[coluna_data]) # As datas são convertidas uma única vez e persistidas junto aos dados
+    except (ValueError, TypeError, OverflowError):
+        pass # Coluna ainda não mapeada corretamente: o erro é apresentado ao processar os dados
+    if pd.api.types.is_numeric_dtype(data[coluna_valor]):
+        data[coluna_valor] = data[coluna_valor].astype("float64") # Float64 mantém a precisão das somas em arquivos com milhões de linhas
+    return data
+
+
+#Hash do conteúdo do arquivo (chave do cache em disco)
+def hash_conteudo(conteudo):
+    return hashlib.sha1(conteudo).hexdigest()
+
+
+#Hash de um arquivo em disco lido em blocos (mesmo resultado de hash_conteudo, sem carregar o arquivo inteiro em memória)
+def hash_caminho(caminho, tamanho_bloco=1 << 20):
+    hash_arquivo = hashlib.sha1()
+    with open(caminho, "rb") as arquivo:
+        for bloco in iter(lambda: arquivo.read(tamanho_bloco), b""):
+            hash_arquivo.update(bloco)
+    return hash_arquivo.hexdigest()
+
+
+#Identificador estável do conjunto de dados: hash do conteúdo e versão do formato dos dados carregados
+#É a chave barata usada por todos os caches em memória no lugar do arquivo ou do DataFrame completo
+def identificador_dados(hash_arquivo):
+    return (hash_arquivo, VERSAO_CACHE)
+
+
+#Identificador de um conjunto de dados acrescido de um arquivo com novas vendas (depende da base e do anexo, na ordem)
+def identificador_anexo(id_dados, id_anexo):
+    return identificador_dados(hashlib.sha1(f"{id_dados[0]}+{id_anexo[0]}".encode()).hexdigest())
+
+
+#Arquivo Parquet do cache para o arquivo e o mapeamento de colunas (o sufixo distingue os arquivos gravados em blocos)
+def caminho_colunar(hash_arquivo, coluna_data, coluna_id, coluna_categoria, coluna_valor, sufixo=""):
+    chave_colunas = hashlib.sha1(repr((VERSAO_CACHE, coluna_data, coluna_id, coluna_categoria, coluna_valor)).encode()).hexdigest()[:12]
+    return PASTA_CACHE / f"{hash_arquivo}_{chave_colunas}{sufixo}.parquet"
+
+
+#Função de Carregamento Colunar com cache em Parquet
+def carregador_colunar(conteudo, coluna_data, coluna_id, coluna_categoria, coluna_valor, hash_arquivo=None):
+    caminho = caminho_colunar(hash_arquivo or hash_conteudo(conteudo), coluna_data, coluna_id, coluna_categoria, coluna_valor)
+    if caminho.exists():
+        try:
+            data = pd.read_parquet(caminho)
+            marcar_uso(caminho)
+            return data, None
+        except Exception:
+            caminho.unlink(missing_ok=True) # Arquivo corrompido ou incompatível: é recriado abaixo
+
+    if isinstance(conteudo, Path): # Arquivo em disco (partições): lido apenas quando não está no cache
+        conteudo = conteudo.read_bytes()
+    codificacao = detectar_codificacao(conteudo)
+    try:
+        data = ler_colunas(conteudo, coluna_data, coluna_id, coluna_categoria, coluna_valor, codificacao)
+    except UnicodeDecodeError: # A amostra parecia UTF-8, mas o restante do arquivo não é
+        codificacao = "latin-1"
+        data = ler_colunas(conteudo, coluna_data, coluna_id, coluna_categoria, coluna_valor, codificacao)
+
+    try:
+        PASTA_CACHE.mkdir(parents=True, exist_ok=True)
+        temporario = caminho_temporario(caminho)
+        data.to_parquet(temporario, index=False)
+        os.replace(temporario, caminho) # Escrita atômica: leitores concorrentes nunca veem um arquivo incompleto
+        limitar_armazenamento(PASTA_CACHE, acrescimo=caminho.stat().st_size)
+    except Exception:
+        pass # Sem permissão de escrita ou sem pyarrow: os dados continuam disponíveis em memória
+
+    return data, codificacao
+
+
+#Modo Streaming: o arquivo é lido em blocos e cada bloco é incorporado ao cubo mensal, sem materializar o DataFrame completo
+#A fonte pode ser um caminho, bytes ou um arquivo aberto (como o upload do Streamlit); o resultado é o cubo e não as linhas
+#Bytes e arquivos abertos são copiados em blocos para um arquivo temporário, lido do disco pelo pandas
+def carregador_streaming(fonte, coluna_data, coluna_id, coluna_categoria, coluna_valor, linhas_por_bloco=LINHAS_POR_BLOCO):
+    if isinstance(fonte, bytes):
+        fonte = BytesIO(fonte)
+    if not isinstance(fonte, (str, Path)):
+        with tempfile.NamedTemporaryFile(suffix=".csv", delete=False) as temporario:
+            fonte.seek(0)
+            shutil.copyfileobj(fonte, temporario, TAMANHO_COPIA)
+        try:
+            return carregador_streaming(temporario.name, coluna_data, coluna_id, coluna_categoria, coluna_valor, linhas_por_bloco)
+        finally:
+            os.unlink(temporario.name)
+
+    with open(fonte, "rb") as arquivo:
+        codificacao = detectar_codificacao(arquivo.read(TAMANHO_AMOSTRA))
+    try:
+        return acumulador_arquivo(fonte, coluna_data, coluna_id, coluna_categoria, coluna_valor, codificacao, linhas_por_bloco)
+    except UnicodeDecodeError: # A amostra parecia UTF-8, mas o restante do arquivo não é
+        return acumulador_arquivo(fonte, coluna_data, coluna_id, coluna_categoria, coluna_valor, "latin-1", linhas_por_bloco)
+
+
+def acumulador_arquivo(fonte, coluna_data, coluna_id, coluna_categoria, coluna_valor, codificacao, linhas_por_bloco):
+    colunas = list(dict.fromkeys([coluna_data, coluna_id, coluna_categoria, coluna_valor]))
+    tipos = {coluna_id: "category", coluna_categoria: "category"} # Apenas os rótulos únicos de cada bloco passam pelo dicionário de códigos
+    for coluna in (coluna_data, coluna_valor):
+        tipos.pop(coluna, None)
+
+    acumulador = novo_acumulador(coluna_data, coluna_id, coluna_categoria, coluna_valor)
+    formato = detectar_formato_arquivo(fonte, coluna_data, codificacao, linhas_por_bloco) # O mesmo formato para todos os blocos
+    with pd.read_csv(fonte, usecols=colunas, dtype=tipos, encoding=codificacao, chunksize=linhas_por_bloco) as leitor:
+        for bloco in leitor:
+            bloco[coluna_data] = converter_com_formato(bloco[coluna_data], formato, estrito=True)
+            acumular_bloco(acumulador, bloco)
+    return finalizar_acumulador(acumulador)
+
+
+#Conversão em blocos para Parquet (backend SQL): o arquivo é lido em blocos, com as mesmas regras de tipos e de datas do modo
+#streaming, e cada bloco é gravado como um grupo de linhas do Parquet consultado pelo DuckDB. A memória fica limitada ao bloco
+#e o arquivo convertido é reaproveitado, como o cache do carregamento colunar; retorna o caminho e a codificação utilizada
+def conversor_parquet(fonte, coluna_data, coluna_id, coluna_categoria, coluna_valor, hash_arquivo, linhas_por_bloco=LINHAS_POR_BLOCO):
+    caminho = caminho_colunar(hash_arquivo, coluna_data, coluna_id, coluna_categoria, coluna_valor, sufixo=".blocos")
+    if caminho.exists():
+        marcar_uso(caminho)
+        return caminho, None
+
+    if isinstance(fonte, bytes):
+        fonte = BytesIO(fonte)
+    if isinstance(fonte, (str, Path)):
+        with open(fonte, "rb") as arquivo:
+            codificacao = detectar_codificacao(arquivo.read(TAMANHO_AMOSTRA))
+    else:
+        codificacao = detectar_codificacao(fonte.read(TAMANHO_AMOSTRA))
+        fonte.seek(0)
+
+    PASTA_CACHE.mkdir(parents=True, exist_ok=True)
+    temporario = caminho_temporario(caminho)
+    try:
+        try:
+            gravar_blocos(fonte, temporario, coluna_data, coluna_id, coluna_categoria, coluna_valor, codificacao, linhas_por_bloco)
+        except UnicodeDecodeError: # A amostra parecia UTF-8, mas o restante do arquivo não é
+            if hasattr(fonte, "seek"):
+                fonte.seek(0)
+            codificacao = "latin-1"
+            gravar_blocos(fonte, temporario, coluna_data, coluna_id, coluna_categoria, coluna_valor, codificacao, linhas_por_bloco)
+    except Exception:
+        temporario.unlink(missing_ok=True)
+        raise
+    os.replace(temporario, caminho) # Escrita atômica: leitores concorrentes nunca veem um arquivo incompleto
+    limitar_armazenamento(PASTA_CACHE, acrescimo=caminho.stat().st_size)
+    return caminho, codificacao
+
+
+def gravar_blocos(fonte, caminho, coluna_data, coluna_id, coluna_categoria, coluna_valor, codificacao, linhas_por_bloco):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    colunas = list(dict.fromkeys([coluna_data, coluna_id, coluna_categoria, coluna_valor]))
+    tipos = {coluna_id: "category", coluna_categoria: "category"} # Rótulos repetidos são lidos uma única vez por bloco
+    for coluna in (coluna_data, coluna_valor):
+        tipos.pop(coluna, None)
+
+    escritor, formato = None, detectar_formato_arquivo(fonte, coluna_data, codificacao, linhas_por_bloco) # O mesmo formato para todos os blocos
+    try:
+        with pd.read_csv(fonte, usecols=colunas, dtype=tipos, encoding=codificacao, chunksize=linhas_por_bloco) as leitor:
+            for bloco in leitor:
+                bloco = bloco[colunas]
+                bloco[coluna_data] = converter_com_formato(bloco[coluna_data], formato, estrito=True)
+                if pd.api.types.is_numeric_dtype(bloco[coluna_valor]):
+                    bloco[coluna_valor] = bloco[coluna_valor].astype("float64")
+                tabela = pa.Table.from_pandas(bloco, preserve_index=False)
+                if escritor is None: # Esquema do primeiro bloco, com as colunas categóricas gravadas pelos seus valores
+                    esquema = pa.schema([campo.with_type(campo.type.value_type) if pa.types.is_dictionary(campo.type) else campo for campo in tabela.schema])
+                    escritor = pq.ParquetWriter(caminho, esquema)
+                escritor.write_table(tabela.cast(esquema))
+    finally:
+        if escritor is not None:
+            escritor.close()
+    if escritor is None:
+        raise ValueError("O arquivo não contém vendas")
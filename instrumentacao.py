@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+
+#Instrumentação dos Estágios: cada estágio (carregamento, conversão de datas, filtro, agregados, busca do ARIMA e gráficos)
+#registra tempo de relógio, tempo de CPU da thread, pico de memória residente durante o estágio e se foi atendido pelo cache
+#As medições ficam no contexto da execução atual (uma por sessão do Streamlit) e só são coletadas depois de iniciadas,
+#portanto fora da aplicação (linha de comando e benchmark) os estágios não têm custo
+
+LOG_DESEMPENHO = os.environ.get("ANALISEDADOS_LOG_DESEMPENHO") # Arquivo JSON-lines opcional com as medições de cada processamento
+INTERVALO_MEMORIA = float(os.environ.get("ANALISEDADOS_INTERVALO_MEMORIA", 0.01)) # Intervalo em segundos entre as leituras da memória residente
+
+_medicoes = ContextVar("medicoes_desempenho", default=None)
+_estagio_atual = ContextVar("estagio_desempenho", default=None)
+_trava_log = threading.Lock()
+_picos = {} # Maior memória residente lida desde o início de cada estágio em andamento (chave: id do registro)
+_trava_picos = threading.Lock()
+_amostrador = None
+
+
+#Memória residente atual do processo em bytes (None fora do Linux: o pico do processo desde o início, ru_maxrss, não
+#serve para atribuir a memória a um estágio)
+def memoria_atual():
+    try:
+        with open("/proc/self/statm", "rb") as arquivo:
+            return int(arquivo.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+#Leitura periódica da memória residente enquanto houver estágios em andamento (uma única thread para todas as sessões)
+def amostrar_memoria():
+    global _amostrador
+    while True:
+        memoria = memoria_atual()
+        with _trava_picos:
+            if not _picos:
+                _amostrador = None
+                return
+            for chave, pico in _picos.items():
+                if memoria is not None and memoria > pico:
+                    _picos[chave] = memoria
+        time.sleep(INTERVALO_MEMORIA)
+
+
+def iniciar_pico(registro):
+    global _amostrador
+    memoria = memoria_atual()
+    if memoria is None:
+        return None
+    with _trava_picos:
+        _picos[id(registro)] = memoria
+        if _amostrador is None:
+            _amostrador = threading.Thread(target=amostrar_memoria, name="amostrador_memoria", daemon=True)
+            _amostrador.start()
+    return memoria
+
+
+#Pico de memória residente em MB durante o estágio e acréscimo em relação ao início (a memória é do processo, portanto
+#estágios simultâneos de outras sessões também contribuem para o pico)
+def encerrar_pico(registro, inicial):
+    if inicial is None:
+        return None, None
+    memoria = memoria_atual()
+    with _trava_picos:
+        pico = max(_picos.pop(id(registro)), memoria or 0)
+    return round(pico / 2**20, 1), round((pico - inicial) / 2**20, 1)
+
+
+def iniciar_medicoes():
+    medicoes = []
+    _medicoes.set(medicoes)
+    _estagio_atual.set(None)
+    return medicoes
+
+
+@contextmanager
+def estagio(nome, **detalhes):
+    medicoes = _medicoes.get()
+    if medicoes is None:
+        yield None
+        return
+    pai = _estagio_atual.get()
+    registro = {"estagio": nome, "nivel": 0 if pai is None else pai["nivel"] + 1, **detalhes}
+    medicoes.append(registro) # Registrado na ordem de início, para exibir os estágios aninhados abaixo do estágio pai
+    contexto = _estagio_atual.set(registro)
+    memoria_inicial = iniciar_pico(registro)
+    inicio, inicio_cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield registro
+    except Exception as erro:
+        registro["erro"] = f"{type(erro).__name__}: {erro}"
+        raise
+    finally:
+        registro["tempo_s"] = round(time.perf_counter() - inicio, 4)
+        registro["cpu_s"] = round(time.thread_time() - inicio_cpu, 4)
+        registro["rss_pico_mb"], registro["rss_acrescimo_mb"] = encerrar_pico(registro, memoria_inicial)
+        _estagio_atual.reset(contexto)
+
+
+#Medições de uma tarefa em segundo plano, iniciadas apenas quando quem a criou está medindo (o contexto é copiado para a tarefa)
+def medicoes_tarefa():
+    return iniciar_medicoes() if _medicoes.get() is not None else None
+
+
+#Estágios medidos em outra thread (tarefas em segundo plano) incorporados abaixo do estágio atual desta execução
+def incorporar_medicoes(outras):
+    medicoes, pai = _medicoes.get(), _estagio_atual.get()
+    if medicoes is None or not outras:
+        return
+    nivel = 0 if pai is None else pai["nivel"] + 1
+    medicoes.extend(dict(registro, nivel=registro["nivel"] + nivel) for registro in list(outras))
+
+
+#Resultado do cache para o estágio atual: o corpo de uma função em cache só executa quando não há resultado armazenado
+def marcar_cache(acerto):
+    registro = _estagio_atual.get()
+    if registro is not None:
+        registro["cache"] = "acerto" if acerto else "falha"
+
+
+#Detalhes adicionais do estágio atual (anotar substitui o valor, registrar acrescenta a uma lista)
+def anotar(**detalhes):
+    registro = _estagio_atual.get()
+    if registro is not None:
+        registro.update(detalhes)
+
+
+def registrar(chave, valor):
+    registro = _estagio_atual.get()
+    if registro is not None:
+        registro.setdefault(chave, []).append(valor)
+
+
+#Gravação opcional das medições de um processamento em JSON-lines (uma linha por processamento)
+def gravar_log(medicoes, **contexto):
+    if not LOG_DESEMPENHO:
+        return
+    linha = json.dumps({"data": time.strftime("%Y-%m-%d %H:%M:%S"), "pid": os.getpid(), **contexto, "estagios": medicoes},
+                       ensure_ascii=False, default=str)
+    with _trava_log, open(LOG_DESEMPENHO, "a", encoding="utf-8") as arquivo:
+        arquivo.write(linha + "\n") # Uma única escrita em modo de acréscimo por linha
@@ -0,0 +1,162 @@
+import os
+import sys
+import threading
+import types
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+
+
+#Cache de Resultados em Memória: todos os caches do processo (bases, períodos preparados, páginas, modelos e previsões)
+#compartilham um único orçamento de memória. O tamanho de cada entrada é medido em bytes ao ser guardada (e novamente quando
+#o resultado cresce, como os agregados e gráficos acrescentados ao período preparado) e, acima do limite, as entradas são
+#descartadas pelo uso e pelo tamanho: entre as entradas usadas há mais tempo, a maior sai primeiro. Acertos, falhas,
+#descartes e bytes de cada cache ficam disponíveis em estatisticas_memoria (painel "Desempenho" e log de desempenho)
+
+LIMITE_MEMORIA = int(os.environ.get("ANALISEDADOS_LIMITE_MEMORIA_MB", 1024)) << 20 # Orçamento de todos os caches em memória
+JANELA_DESCARTE = 4 # Entradas usadas há mais tempo entre as quais a maior é descartada
+AUSENTE = object() # Resultado não encontrado (None é um resultado válido)
+
+_entradas = OrderedDict() # (cache, chave) -> {"resultado", "bytes"}, da entrada usada há mais tempo para a mais recente
+_contadores = {}
+_total = 0
+_trava = threading.RLock()
+
+
+#Tamanho aproximado de um objeto em bytes, percorrendo dicionários, listas, objetos e figuras do Plotly. Objetos alcançados
+#por mais de um caminho são contados uma única vez e os objetos em ignorar (resultados guardados por outros caches, como
+#a base referenciada pelos períodos preparados) não são contados
+def tamanho_objeto(objeto, ignorar=()):
+    vistos, pendentes, total = set(ignorar), [objeto], 0
+    while pendentes:
+        atual = pendentes.pop()
+        if id(atual) in vistos or isinstance(atual, (type, types.ModuleType, types.FunctionType, types.MethodType)):
+            continue
+        vistos.add(id(atual))
+        if isinstance(atual, (pd.DataFrame, pd.Series, pd.Index)):
+            total += int(np.sum(atual.memory_usage(deep=True))) # Inclui o índice e o conteúdo das colunas de texto
+        elif isinstance(atual, np.ndarray):
+            if isinstance(atual.base, np.ndarray): # Visão de outro array: a memória é a do array original
+                pendentes.append(atual.base)
+            else:
+                total += atual.nbytes + (sum(sys.getsizeof(item) for item in atual.flat) if atual.dtype == object else 0)
+        elif isinstance(atual, dict):
+            total += sys.getsizeof(atual)
+            pendentes.extend(list(atual.keys()) + list(atual.values())) # Cópias: o resultado pode ser ampliado por outra thread
+        elif isinstance(atual, (list, tuple, set, frozenset)):
+            total += sys.getsizeof(atual)
+            pendentes.extend(list(atual))
+        elif hasattr(atual, "to_plotly_json"): # Figuras do Plotly: dados e layout
+            total += sys.getsizeof(atual)
+            pendentes.append(atual.to_plotly_json())
+        else:
+            total += sys.getsizeof(atual)
+            if hasattr(atual, "__dict__"): # Modelos de previsão e demais objetos: atributos
+                pendentes.append(vars(atual))
+    return total
+
+
+def contadores(cache):
+    return _contadores.setdefault(cache, {"entradas": 0, "bytes": 0, "acertos": 0, "falhas": 0, "descartes": 0})
+
+
+#Leitura de uma entrada (a entrada passa a ser a usada mais recentemente); contar=False apenas consulta, sem afetar os contadores
+def ler_memoria(cache, chave, contar=True):
+    with _trava:
+        entrada = _entradas.get((cache, chave))
+        if entrada is not None:
+            _entradas.move_to_end((cache, chave))
+        if contar:
+            contadores(cache)["falhas" if entrada is None else "acertos"] += 1
+    return AUSENTE if entrada is None else entrada["resultado"]
+
+
+def remover_entrada(identificador, descarte=True):
+    global _total
+    entrada = _entradas.pop(identificador)
+    _total -= entrada["bytes"]
+    contagem = contadores(identificador[0])
+    contagem["entradas"] -= 1
+    contagem["bytes"] -= entrada["bytes"]
+    contagem["descartes"] += descarte
+
+
+#Descarte até o orçamento: entre as JANELA_DESCARTE entradas usadas há mais tempo, a maior é descartada primeiro
+#(uma página grande e esquecida sai antes de várias pequenas); a entrada protegida, recém-guardada, nunca é descartada
+def limitar_memoria(protegida=None, limite=None):
+    limite = LIMITE_MEMORIA if limite is None else limite
+    with _trava:
+        while _total > limite:
+            candidatas = []
+            for identificador, entrada in _entradas.items():
+                if identificador != protegida:
+                    candidatas.append((entrada["bytes"], identificador))
+                if len(candidatas) == JANELA_DESCARTE:
+                    break
+            if not candidatas:
+                break
+            remover_entrada(max(candidatas, key=lambda candidata: candidata[0])[1])
+
+
+def medir_entrada(identificador, resultado):
+    with _trava:
+        ignorar = {id(entrada["resultado"]) for outra, entrada in _entradas.items() if outra != identificador}
+    return tamanho_objeto(resultado, ignorar) # Medido fora da trava: as demais sessões continuam lendo os caches
+
+
+#Guarda um resultado medido em bytes; max_entradas limita também o número de entradas do cache (descarte LRU)
+#Resultados maiores que todo o orçamento não são guardados (contados como descartes)
+def guardar_memoria(cache, chave, resultado, max_entradas=None):
+    global _total
+    identificador = (cache, chave)
+    tamanho = medir_entrada(identificador, resultado)
+    with _trava:
+        if identificador in _entradas:
+            remover_entrada(identificador, descarte=False)
+        contagem = contadores(cache)
+        if tamanho > LIMITE_MEMORIA:
+            contagem["descartes"] += 1
+            return
+        _entradas[identificador] = {"resultado": resultado, "bytes": tamanho}
+        _total += tamanho
+        contagem["entradas"] += 1
+        contagem["bytes"] += tamanho
+        if max_entradas is not None and contagem["entradas"] > max_entradas:
+            for outro in [outro for outro in _entradas if outro[0] == cache][:contagem["entradas"] - max_entradas]:
+                remover_entrada(outro)
+        limitar_memoria(protegida=identificador)
+
+
+#Nova medição das entradas que guardam o resultado (agregados e gráficos acrescentados depois de guardado)
+def remedir_memoria(resultado):
+    global _total
+    with _trava:
+        identificadores = [identificador for identificador, entrada in _entradas.items() if entrada["resultado"] is resultado]
+    for identificador in identificadores:
+        tamanho = medir_entrada(identificador, resultado)
+        with _trava:
+            entrada = _entradas.get(identificador)
+            if entrada is None or entrada["resultado"] is not resultado: # Descartada ou substituída durante a medição
+                continue
+            if tamanho > LIMITE_MEMORIA: # Cresceu além de todo o orçamento
+                remover_entrada(identificador)
+                continue
+            _total += tamanho - entrada["bytes"]
+            contadores(identificador[0])["bytes"] += tamanho - entrada["bytes"]
+            entrada["bytes"] = tamanho
+            limitar_memoria(protegida=identificador)
+
+
+def descartar_memoria(cache):
+    with _trava:
+        for identificador in [identificador for identificador in _entradas if identificador[0] == cache]:
+            remover_entrada(identificador, descarte=False)
+
+
+#Contadores de cada cache e o uso total do orçamento (em MB)
+def estatisticas_memoria():
+    with _trava:
+        caches = [{"cache": cache, "entradas": contagem["entradas"], "mb": round(contagem["bytes"] / 2**20, 2), "acertos": contagem["acertos"],
+                   "falhas": contagem["falhas"], "descartes": contagem["descartes"]} for cache, contagem in sorted(_contadores.items())]
+        return {"limite_mb": round(LIMITE_MEMORIA / 2**20, 2), "total_mb": round(_total / 2**20, 2), "caches": caches}
@@ -0,0 +1,701 @@
+import pandas as pd
+import numpy as np
+import hashlib
+import importlib
+import inspect
+import threading
+from functools import wraps
+from ingestao import converter_datas
+from snapshots import carregar_modelo
+from armazenamento import chave_armazenamento, gravar_resultado, ler_resultado
+from instrumentacao import anotar, estagio, marcar_cache
+from memoria import AUSENTE, descartar_memoria, guardar_memoria, ler_memoria, remedir_memoria
+from consultas import calcular_metrica, combinar_fontes, e_fatia_sql, e_fonte_sql, fatia_periodos_sql, fatia_sql, nulos_sql, series_categorias_sql
+from agregacoes import codificador_chaves, combinar_cubos, construtor_cubo, fatiador_cubo, fatiador_periodos, metricas_categorias, metricas_clientes, metricas_coortes, metricas_mensais, metricas_recompra, metricas_totais, series_mensais
+
+
+
+#Motor dos Painéis: preparação dos dados, agregados, previsões, gráficos e registro das páginas, sem dependência do Streamlit
+#É utilizado pela aplicação, que adiciona os caches do Streamlit, e pelo pré-cálculo em linha de comando (precalcular.py)
+#As bibliotecas pesadas (Plotly, scikit-learn e pmdarima, que carrega statsmodels e scipy) são importadas dentro das funções
+#que as utilizam: a barra lateral é exibida sem esperar por elas e aquecer_importacoes as carrega em segundo plano
+
+
+#Cache LRU em memória com a mesma convenção do st.cache_resource: argumentos iniciados por "_" não fazem parte da chave
+#Funciona dentro e fora do Streamlit e é compartilhado por todas as sessões do processo. As entradas contam para o orçamento
+#de memória de todos os caches (memoria.py), além do limite de max_entradas por função
+#Com persistente=True os resultados também são gravados no armazenamento em disco, compartilhado entre processos e reinicializações
+def memorizar(max_entradas, persistente=False):
+    def decorador(funcao):
+        assinatura = inspect.signature(funcao)
+        cache = funcao.__name__
+
+        def chave(argumentos):
+            return tuple((nome, valor) for nome, valor in argumentos.items() if not nome.startswith("_"))
+
+        def ler_disco(chave_resultado):
+            if not persistente:
+                return None
+            resultado = ler_resultado(cache, chave_armazenamento(cache, chave_resultado))
+            if resultado is not None:
+                guardar_memoria(cache, chave_resultado, resultado, max_entradas)
+            return resultado
+
+        @wraps(funcao)
+        def memorizada(*args, **kwargs):
+            chave_chamada = chave(assinatura.bind(*args, **kwargs).arguments)
+            with estagio(cache): # Estágio próprio: o acerto ou a falha não se confunde com o do estágio que a chamou
+                resultado = ler_memoria(cache, chave_chamada)
+                if resultado is not AUSENTE:
+                    marcar_cache(True)
+                    return resultado
+                resultado = ler_disco(chave_chamada) # Calculado por outro processo ou antes de uma reinicialização
+                if resultado is not None:
+                    anotar(cache="disco")
+                    return resultado
+                marcar_cache(False)
+                resultado = funcao(*args, **kwargs)
+                guardar_memoria(cache, chave_chamada, resultado, max_entradas)
+                if persistente:
+                    gravar_resultado(cache, chave_armazenamento(cache, chave_chamada), resultado)
+                return resultado
+
+        #Consulta de um resultado já armazenado, sem executar a função (apenas os argumentos da chave são necessários)
+        def consultar(*args, **kwargs):
+            chave_consulta = chave(assinatura.bind_partial(*args, **kwargs).arguments)
+            resultado = ler_memoria(cache, chave_consulta, contar=False)
+            return ler_disco(chave_consulta) if resultado is AUSENTE else resultado
+
+        memorizada.clear = lambda: descartar_memoria(cache)
+        memorizada.consultar = consultar
+        return memorizada
+    return decorador
+
+
+#Resultado do armazenamento persistente ou, na ausência dele, calculado e gravado para os demais processos
+def resultado_persistente(tipo, chave, calcular, *args):
+    resultado = ler_resultado(tipo, chave)
+    if resultado is not None:
+        anotar(cache="disco")
+        return resultado
+    resultado = calcular(*args)
+    gravar_resultado(tipo, chave, resultado)
+    return resultado
+
+
+#Aquecimento: importação das bibliotecas de gráficos e de previsão em segundo plano, após a primeira renderização da aplicação
+#Uma chamada que precisar de um módulo ainda em importação aguarda o seu término (trava de importação do Python)
+MODULOS_TARDIOS = ("plotly.express", "plotly.graph_objects", "sklearn.metrics", "previsao", "validacao")
+
+
+def aquecer_importacoes():
+    for modulo in MODULOS_TARDIOS:
+        importlib.import_module(modulo)
+
+
+#Impressão digital da série mensal de vendas (chave barata para o cache de previsão)
+def impressao_serie(vendas):
+    valores = pd.util.hash_pandas_object(vendas, index=False).values # Hash vetorizado de cada linha da série mensal
+    return hashlib.sha1(valores.tobytes() + repr(list(vendas.columns)).encode()).hexdigest()
+
+
+#Divisão da série mensal em treino e teste (o mês de corte pertence aos dois conjuntos)
+def divisao_treino_teste(vendas, coluna_valor):
+    from previsao import corte_treino
+    corte = corte_treino(vendas.shape[0])
+    return vendas.loc[: corte, coluna_valor], vendas.loc[corte:, coluna_valor]
+
+
+#Função de Seleção do Modelo de Previsão (chaveada apenas pela impressão digital da série): o motor de menor MAPE no teste
+#dentro do orçamento de tempo (selecionar_motor). Após anexar novos dados, o modelo da série anterior é atualizado com as novas
+#observações e a seleção completa só é refeita quando o histórico de treino mudou ou o MAPE de validação piorou além do limite
+@memorizar(max_entradas=8, persistente=True)
+def treinador_modelo(impressao, _treino, _teste, _anterior=None):
+    from previsao import atualizar_modelo, selecionar_motor
+    with estagio("selecao_modelo"):
+        modelo = carregar_modelo(impressao) # Modelo pré-calculado em linha de comando, quando disponível
+        if isinstance(modelo, dict): # Modelos gravados por versões anteriores (objetos do pmdarima) são ignorados
+            anotar(origem="snapshot")
+            return modelo
+        if _anterior is not None:
+            impressao_anterior = impressao_serie(_anterior)
+            modelo_anterior = treinador_modelo.consultar(impressao_anterior)
+            if modelo_anterior is None:
+                modelo_anterior = carregar_modelo(impressao_anterior)
+            if isinstance(modelo_anterior, dict):
+                modelo = atualizar_modelo(modelo_anterior, *divisao_treino_teste(_anterior, _treino.name), _treino, _teste)
+                if modelo is not None:
+                    anotar(origem="atualizacao")
+                    return modelo
+        return selecionar_motor(_treino, _teste) # Motores baratos primeiro; a busca do SARIMA ajusta os candidatos em paralelo
+
+
+#Função de Previsão (cache LRU chaveado pela impressão digital da série mensal e pelo horizonte de previsão)
+#A série de treinamento é agregada antes do filtro de datas, portanto alterar datas ou clientes não re-treina o modelo
+@memorizar(max_entradas=32, persistente=True)
+def gerador_previsao(impressao, meses_prever, _vendas, coluna_data, coluna_valor, _anterior=None):
+    import plotly.express as px
+    from previsao import MOTORES, corte_treino, prever_modelo
+    from sklearn.metrics import mean_absolute_percentage_error
+    vendas = _vendas.copy()
+
+    #Divisão dos Dados entre treino e teste        
+    proporcao_treino = corte_treino(vendas.shape[0])
+    vendas[coluna_valor].dropna(inplace=True)
+    treino = vendas.loc[: proporcao_treino, :]
+    teste = vendas.loc[proporcao_treino:, :]
+
+    
+    #Seleção do Modelo de Previsão
+    modelo = treinador_modelo(impressao, treino[coluna_valor], teste[coluna_valor], _anterior)
+    
+    
+    #Avaliação do Modelo
+    previsoes_teste = prever_modelo(modelo, len(teste))
+    mape = mean_absolute_percentage_error(teste[coluna_valor], previsoes_teste)
+    previsoes_arima = prever_modelo(modelo, meses_prever)
+    avaliacoes = pd.DataFrame([{"Modelo": MOTORES[avaliacao["motor"]]["descricao"], "Erro percentual (%)": None if avaliacao["mape"] is None else round(avaliacao["mape"] * 100, 2),
+                                "Tempo (s)": avaliacao["tempo_s"], "Situação": avaliacao["situacao"]} for avaliacao in modelo["avaliacoes"]])
+    selecao = {"motor": MOTORES[modelo["motor"]]["descricao"], "tempo_s": modelo["tempo_s"], "avaliacoes": avaliacoes}
+
+    
+    #Geração do gráfico de Previsão
+    data_grafico = pd.date_range(teste[coluna_data].max() + pd.DateOffset(months=1), periods=meses_prever, freq="MS")
+    fig_arima = px.line(x=data_grafico, y=previsoes_arima, color_discrete_sequence=["#0550DD"], markers=True,
+                         title=f"Previsões do Modelo para o período selecionado de {meses_prever} meses")
+
+    x_arima = np.arange(len(data_grafico)) # Índices numéricos para os meses
+    coef = np.polyfit(x_arima, previsoes_arima, 1) # Ajuste polinomial (grau 1 para tendência)
+    poly_arima = np.poly1d(coef)
+    y_fit_arima = poly_arima(x_arima)
+    
+    fig_arima.update_layout(xaxis_title=f"Erro percentual do Modelo ({selecao['motor']}): {mape*100:.2f}%", yaxis_title="Valor de Vendas Previsto")
+    fig_arima.update_traces(text=previsoes_arima, hovertemplate="Mês: %{x}<br>Valor Previsto: %{y}", 
+                            line=dict(color="dodgerblue"), marker=dict(color="darkorange"))
+    
+    fig_arima.add_scatter(x=data_grafico, y=y_fit_arima, mode='lines', name='Tendência<br>Prevista', 
+                          line=dict(dash='dash', color="white")) # Adição da linha de tendência
+    
+
+    #Geração do Gráfico de comparação        
+    vendas_compar = vendas.sort_values(coluna_data, ascending=False).iloc[:meses_prever,:]
+    fig_compar = px.line(x=vendas_compar[coluna_data], y=vendas_compar[coluna_valor], 
+                         markers=True, title="Valores Históricos do período anterior")
+    
+    x = np.arange(len(vendas_compar)) #Índices numéricos para os meses
+    y = vendas_compar[coluna_valor].values # Valores de Vendas
+    coef = np.polyfit(x, y, 1) # Ajuste polinomial (grau 1 para tendência)
+    poly = np.poly1d(coef)
+    y_fit = poly(x)
+
+    
+    fig_compar.update_layout(xaxis_title="Mês", yaxis_title="Valor das Vendas")
+    fig_compar.update_traces(text=vendas_compar[coluna_valor], textposition="top center", hovertemplate="Mês: %{x}<br>Valor: %{y} ",
+                             line=dict(color="dodgerblue"), marker=dict(color="darkorange"))
+    fig_compar.add_scatter(x=vendas_compar[coluna_data], y=y_fit, mode="lines", name="Tendência", line=dict(color="white", dash="dash")) # Adição da linha de tendência
+
+    return fig_arima, fig_compar, selecao
+
+
+#Função de Previsão por Categoria (cache chaveado pelas impressões digitais das séries e pelo horizonte de previsão)
+#Todas as categorias são ajustadas em lote com o motor do modelo agregado (o SARIMA parte das ordens do modelo agregado)
+#e avaliadas com o mesmo corte treino/teste
+@memorizar(max_entradas=32, persistente=True)
+def gerador_previsao_lote(impressao, meses_prever, _series, _vendas, coluna_data, coluna_valor, _anterior=None):
+    from previsao import prever_lote
+    modelo_agregado = treinador_modelo(impressao_serie(_vendas), *divisao_treino_teste(_vendas, coluna_valor), _anterior) # Normalmente já treinado pela previsão agregada
+    lote = prever_lote(_series, modelo_agregado, meses_prever)
+
+    previsoes = lote["previsoes"]
+    previsoes.index = pd.date_range(_vendas[coluna_data].max() + pd.DateOffset(months=1), periods=meses_prever, freq="MS", name=coluna_data)
+    tabela = pd.DataFrame({"Modelo": lote["modelos"].fillna("-"), "Erro percentual (%)": (lote["mape"] * 100).round(2),
+                           "Total previsto": previsoes.sum().round(2)}).sort_values("Total previsto", ascending=False)
+    return previsoes, tabela
+
+
+#Função de Validação com Origem Móvel do modelo selecionado (cache chaveado pela impressão digital da série e pelo horizonte):
+#erros médios por horizonte de previsão sobre as origens mais recentes, mais estáveis que o erro do corte único treino/teste
+@memorizar(max_entradas=32, persistente=True)
+def gerador_validacao(impressao, meses_prever, _vendas, coluna_valor, _anterior=None):
+    from validacao import validar_origem_movel
+    modelo = treinador_modelo(impressao, *divisao_treino_teste(_vendas, coluna_valor), _anterior) # Normalmente já selecionado pela previsão agregada
+    return validar_origem_movel(_vendas[coluna_valor], modelo, meses_prever)
+
+
+#Dicionário para mapeamento dos meses
+mapeamento_meses = {1: "Janeiro", 2: "Fevereiro", 3: "Março", 4: "Abril", 5: "Maio", 6: "Junho", 7: 
+                    "Julho", 8: "Agosto", 9: "Setembro", 10: "Outubro", 11: "Novembro", 12: "Dezembro"}
+
+#Granularidades das séries temporais (opção da barra lateral: código da fatia, None = séries mensais do cubo) e rótulos dos períodos
+GRANULARIDADES = {"Mensal": None, "Semanal": "W", "Diária": "D"}
+ROTULOS_PERIODOS = {"W": ("na semana de", "Semana"), "D": ("no dia", "Dia")}
+
+#Função de Construção do Cubo mensal (mês x categoria x cliente) a partir dos dados carregados: conversão das datas e ordenação
+#No modo streaming os dados já chegam consolidados no cubo
+def construir_cubo(data, coluna_data, coluna_id, coluna_categoria, coluna_valor):
+    if not isinstance(data, pd.DataFrame):
+        return data
+    nulos = int(data.isnull().sum().sum())
+    data = data.set_index(coluna_data)
+    with estagio("conversao_datas"):
+        data.index = pd.DatetimeIndex(converter_datas(data.index.to_series()), name=coluna_data) # Normalmente as datas já chegam convertidas do carregamento
+        data = data.sort_index()
+    with estagio("construcao_cubo"):
+        return construtor_cubo(codificador_chaves(data, coluna_id, coluna_categoria, coluna_valor), nulos) # As linhas não são mantidas, apenas os códigos
+
+
+#Função de Preparação da Base (executada uma vez por conjunto de dados e mapeamento de colunas): cubo mensal usado por todos
+#os filtros de data, série de treinamento e séries por categoria
+#Em conjuntos particionados o cubo contém apenas as partições do período e as séries vêm do resumo mensal de todas as partições
+#No backend SQL a base guarda apenas a fonte (arquivos Parquet) e as séries, e cada período é consultado no DuckDB
+def preparar_base(data, coluna_data, coluna_id, coluna_categoria, coluna_valor, resumo_mensal=None):
+    if e_fonte_sql(data):
+        base = series_sql(data)
+    else:
+        base = series_base(construir_cubo(data, coluna_data, coluna_id, coluna_categoria, coluna_valor))
+    if resumo_mensal is not None:
+        base.update(vendas=resumo_mensal["vendas"], series_categorias=resumo_mensal["series_categorias"])
+    return base
+
+
+#Função de Anexação de novos dados (delta) a uma base já preparada: apenas as novas vendas são lidas e consolidadas
+#e o cubo resultante é combinado ao existente. A série anterior é mantida para que o modelo seja atualizado e não re-treinado
+def anexar_base(base, delta, coluna_data, coluna_id, coluna_categoria, coluna_valor):
+    if "fonte" in base: # Backend SQL: o arquivo convertido do anexo passa a ser consultado junto aos anteriores
+        return dict(series_sql(combinar_fontes(base["fonte"], delta)), anterior=base["vendas"])
+    cubo_delta = construir_cubo(delta, coluna_data, coluna_id, coluna_categoria, coluna_valor)
+    with estagio("combinacao_cubos"):
+        cubo = combinar_cubos(base["cubo"], cubo_delta)
+    return dict(series_base(cubo), anterior=base["vendas"])
+
+
+def series_base(cubo):
+    with estagio("series_base"):
+        series = series_fatia(fatiador_cubo(cubo))
+    return dict(series, cubo=cubo)
+
+
+def series_sql(fonte):
+    with estagio("series_base"):
+        fonte = dict(fonte, nulos=nulos_sql(fonte)) # Contados uma única vez por base, como no cubo
+        series = series_fatia(fatia_sql(fonte))
+    return dict(series, fonte=fonte)
+
+
+def series_fatia(fatia):
+    vendas = calcular_metrica(metricas_mensais, fatia)["vendas_mensais"].reset_index() # Os Dados para treinamento do modelo não serão filtrados
+    series_categorias = series_categorias_sql(fatia) if e_fatia_sql(fatia) else series_mensais(fatia, "categoria", fatia["categorias"]) # Séries mensais de cada categoria (previsão em lote)
+    return {"vendas": vendas, "series_categorias": series_categorias}
+
+
+#Função de Preparação dos Dados do período selecionado (fatia do cubo), compartilhada por todas as páginas
+def preparar_periodo(base, coluna_data, coluna_id, coluna_categoria, coluna_valor, datas):
+    with estagio("filtro_periodo"):
+        fatia = fatia_sql(base["fonte"], datas) if "fonte" in base else fatiador_cubo(base["cubo"], datas) # Filtra os meses se especificado
+
+    colunas = {"coluna_data": coluna_data, "coluna_id": coluna_id, "coluna_categoria": coluna_categoria, "coluna_valor": coluna_valor}
+    return {"vendas": base["vendas"], "series_categorias": base["series_categorias"], "anterior": base.get("anterior"), "fatia": fatia, "colunas": colunas,
+            "base": base, "datas": datas, "agregados": {}, "graficos": {}, # Agregados e gráficos são preenchidos sob demanda
+            "travas": {}, "trava": threading.Lock()}
+
+
+#Agregados calculados sob demanda (cada página declara no registro abaixo quais agregados utiliza)
+#Todos são obtidos do motor de agregação a partir da fatia do cubo mensal correspondente ao período selecionado (ou, no backend
+#SQL, das consultas equivalentes sobre a fatia SQL)
+def agregado_totais(preparado, parametros):
+    return calcular_metrica(metricas_totais, preparado["fatia"])
+
+
+def agregado_categorias(preparado, parametros):
+    return calcular_metrica(metricas_categorias, preparado["fatia"])
+
+
+def agregado_mensal(preparado, parametros):
+    return calcular_metrica(metricas_mensais, preparado["fatia"])
+
+
+def agregado_clientes(preparado, parametros):
+    return calcular_metrica(metricas_clientes, preparado["fatia"])
+
+
+def agregado_recompra(preparado, parametros):
+    return calcular_metrica(metricas_recompra, preparado["fatia"])
+
+
+def agregado_coortes(preparado, parametros):
+    return calcular_metrica(metricas_coortes, preparado["fatia"])
+
+
+#Séries diárias ou semanais do período (vendas, crescimento, ticket médio e recompra), calculadas das linhas ou em SQL
+#Na granularidade mensal, ou quando a base não tem as linhas (modo streaming), os gráficos usam as séries mensais
+def agregado_periodos(preparado, parametros):
+    granularidade, base = GRANULARIDADES[parametros["granularidade"]], preparado["base"]
+    if granularidade is None:
+        return {"periodos": None}
+    if "fonte" in base:
+        fatia = fatia_periodos_sql(base["fonte"], preparado["datas"], granularidade)
+    else:
+        fatia = fatiador_periodos(base["cubo"], preparado["datas"], granularidade)
+    if fatia is None:
+        return {"periodos": None}
+    mensais, coluna_valor = calcular_metrica(metricas_mensais, fatia), fatia["coluna_valor"]
+    return {"periodos": pd.DataFrame({"vendas": mensais["vendas_mensais"][coluna_valor], "crescimento": mensais["crescimento_perc"][coluna_valor],
+                                      "ticket_medio": mensais["ticket_medio_mes"][coluna_valor], "taxa_recompra": calcular_metrica(metricas_recompra, fatia)["taxa_recompra"]})}
+
+
+def agregado_previsao(preparado, parametros):
+    #Previsões e gráficos da Projeção (cache próprio, independente dos filtros de data e de clientes)
+    vendas = preparado["vendas"]
+    fig_arima, fig_compar, selecao = gerador_previsao(impressao_serie(vendas), parametros["meses_prever"], vendas, parametros["coluna_data"], parametros["coluna_valor"], preparado["anterior"])
+    return {"fig_arima": fig_arima, "fig_compar": fig_compar, "selecao_modelo": selecao}
+
+
+def agregado_validacao(preparado, parametros):
+    vendas = preparado["vendas"]
+    try:
+        return {"validacao": gerador_validacao(impressao_serie(vendas), parametros["meses_prever"], vendas, parametros["coluna_valor"], preparado["anterior"]),
+                "aviso_validacao": None}
+    except ValueError as erro: # Série curta demais para a origem móvel: tabela vazia e o motivo exibido no lugar do gráfico
+        vazia = pd.DataFrame({"MAPE": [], "sMAPE": [], "MASE": [], "Origens": []}, index=pd.RangeIndex(0, name="Horizonte (meses)"))
+        return {"validacao": vazia, "aviso_validacao": str(erro)}
+
+
+def agregado_previsao_categorias(preparado, parametros):
+    series, vendas = preparado["series_categorias"], preparado["vendas"]
+    previsoes, tabela = gerador_previsao_lote(impressao_serie(series), parametros["meses_prever"], series, vendas, parametros["coluna_data"], parametros["coluna_valor"], preparado["anterior"])
+    return {"previsoes_categorias": previsoes, "tabela_categorias": tabela}
+
+
+#Gráficos gerados sob demanda a partir dos agregados da página
+#Gráfico de uma série diária ou semanal: a série é reduzida no servidor (amostragem.py) e desenhada em WebGL quando densa,
+#o que mantém a mensagem enviada ao navegador limitada qualquer que seja o período. Títulos e tendência usam a série completa
+def grafico_periodos(serie, parametros, metodo, cor, eixo_y, titulo_maior, titulo_menor, hover, tendencia=False):
+    import plotly.graph_objects as go
+    from amostragem import LIMITE_SVG, reduzir_serie
+    granularidade = GRANULARIDADES[parametros["granularidade"]]
+    preposicao, nome_periodo = ROTULOS_PERIODOS[granularidade]
+    serie = serie.replace([np.inf, -np.inf], np.nan).dropna() # Crescimento a partir de períodos sem vendas e ticket de períodos vazios
+    fig = go.Figure()
+    if serie.empty:
+        fig.update_layout(title="Não há períodos suficientes para o gráfico no período selecionado", yaxis_title=eixo_y)
+        return fig
+
+    x, y = reduzir_serie(serie.index.to_numpy(), serie.to_numpy(), metodo)
+    traco = go.Scattergl if len(serie) > LIMITE_SVG else go.Scatter
+    fig.add_trace(traco(x=x, y=y, mode="lines" if len(x) > LIMITE_SVG else "lines+markers", line=dict(color=cor), name=eixo_y,
+                        hovertemplate=hover.replace("{periodo}", nome_periodo) + "<extra></extra>"))
+    if tendencia and len(serie) > 1: # A tendência linear só precisa dos extremos
+        dias = (serie.index - serie.index[0]).days.to_numpy()
+        reta = np.poly1d(np.polyfit(dias, serie.to_numpy(), 1))
+        fig.add_trace(traco(x=serie.index[[0, -1]], y=reta(dias[[0, -1]]), mode="lines", name="Tendência", line=dict(dash="dash", color="#f7fbff")))
+    maior, menor = serie.idxmax(), serie.idxmin()
+    fig.update_layout(title=titulo_maior.format(periodo=f"{preposicao} {maior:%d/%m/%Y}", valor=serie[maior]),
+                      xaxis_title=titulo_menor.format(periodo=f"{preposicao} {menor:%d/%m/%Y}", valor=serie[menor]), yaxis_title=eixo_y,
+                      showlegend=tendencia)
+    return fig
+
+
+def grafico_vendas_categoria(agregados, parametros):
+    import plotly.express as px
+    coluna_valor = parametros["coluna_valor"]
+    vendas_por_categoria = agregados["vendas_por_categoria"]
+    categoria_mais_vendida = vendas_por_categoria[vendas_por_categoria[coluna_valor]== vendas_por_categoria[coluna_valor].max()]
+    fig = px.bar(vendas_por_categoria, vendas_por_categoria.index, vendas_por_categoria[coluna_valor],  color=vendas_por_categoria[coluna_valor], color_continuous_scale="Greens",
+                 title=f"{categoria_mais_vendida.index[0]} é a categoria com maior soma de vendas com um total de {categoria_mais_vendida[coluna_valor].iloc[0]:,.2f} ")
+    
+    fig.update_layout(xaxis_title="Categoria", yaxis_title="Total Vendido em cada categoria", template="plotly_dark")
+
+    fig.update_traces(text=vendas_por_categoria[coluna_valor].apply(lambda x: f"R$ {x:,.2f}"), textposition="none", hovertemplate="Vendas por Categoria: R$%{y}<br>Categoria: %{x} ")
+    return fig
+
+
+def grafico_vendas_totais(agregados, parametros):
+    import plotly.graph_objects as go
+    total_vendas = agregados["total_vendas"]
+    fig2 = go.Figure(go.Indicator(mode="gauge+number", 
+                                  value=total_vendas,
+                                  title="Vendas Totais",
+                                  align="center",
+                                  gauge={"axis": {"range": [0, 1.25 * total_vendas]}}))
+    
+    fig2.add_annotation(x=0.5, y=-0.2, text="Total Vendido:  R${:,.2f}".format(total_vendas), 
+                            showarrow=False, font=dict(size=19, color="white"))
+    return fig2
+
+
+def grafico_crescimento(agregados, parametros):
+    import plotly.express as px
+    coluna_valor = parametros["coluna_valor"]
+    if agregados.get("periodos") is not None:
+        return grafico_periodos(agregados["periodos"]["crescimento"], parametros, "lttb", "#1c83e1", "Variação Percentual(%)",
+                                "Maior crescimento percentual nas vendas {periodo}: {valor:,.2f}%", "Pior variação percentual {periodo}: {valor:,.2f}%",
+                                "Variação Percentual nas Vendas: %{y:.2f}%<br>{periodo}: %{x|%d/%m/%Y}", tendencia=True)
+    # Preparação dos dados
+    crescimento_perc = agregados["crescimento_perc"].sort_index(ascending=False).iloc[:12,:]
+    x = np.arange(len(crescimento_perc))  # Criando índices numéricos para os meses
+    y = crescimento_perc[coluna_valor].values  # Valores de crescimento percentual
+
+    melhor_porc = crescimento_perc[crescimento_perc[coluna_valor]== crescimento_perc[coluna_valor].max()]
+    pior_porc = crescimento_perc[crescimento_perc[coluna_valor]== crescimento_perc[coluna_valor].min()]
+    
+    # Criar gráfico principal
+    fig3 = px.line(crescimento_perc, x=crescimento_perc.index, y=crescimento_perc[coluna_valor], markers=True, color_discrete_sequence=["#1c83e1"],
+                title=f"O mês de {mapeamento_meses[melhor_porc.index.month[0]]} de {melhor_porc.index.year[0]} apresentou um crescimento percentual nas vendas de {melhor_porc[coluna_valor].iloc[0]:,.2f}%")
+
+
+    # Ajuste polinomial (grau 1 para tendência)
+    coef = np.polyfit(x, y, 1)
+    poly = np.poly1d(coef)
+
+    # Geração de pontos para a linha de tendência
+    x_fit = x  # Mantendo a escala original
+    y_fit = poly(x_fit)  # Aplicando a função polinomial
+
+
+    fig3.update_layout(yaxis_title="Variação Percentual(%)", 
+                    xaxis_title=f"{mapeamento_meses[pior_porc.index.month[0]]} de {pior_porc.index.year[0]} foi o mês com pior variação percentual: {pior_porc[coluna_valor].iloc[0]:,.2f}%")
+
+    fig3.update_traces(text=crescimento_perc[coluna_valor], hovertemplate="Variação Percentual nas Vendas: %{y}%<br>Mês: %{x}",
+                       marker=dict(color="#f7fbff"))
+
+    # Adicionar linha de tendência polinomial corrigida
+    fig3.add_scatter(x=crescimento_perc.index, y=y_fit, mode='lines', name="Tendência", line=dict(dash="dash", color="#f7fbff")) # Adição da linha de tendência
+    return fig3
+
+
+def grafico_vendas_mensais(agregados, parametros):
+    import plotly.express as px
+    coluna_valor = parametros["coluna_valor"]
+    if agregados.get("periodos") is not None: # Mínimo e máximo por intervalo: os picos de vendas não desaparecem na redução
+        return grafico_periodos(agregados["periodos"]["vendas"], parametros, "minimo_maximo", "#1c83e1", "Total em Vendas",
+                                "Maior total de vendas {periodo}: R${valor:,.2f}", "Menor total de vendas {periodo}: R${valor:,.2f}",
+                                "Vendas Totais: R$%{y:,.2f}<br>{periodo}: %{x|%d/%m/%Y}")
+    vendas_mensais = agregados["vendas_mensais"].sort_index(ascending=False).iloc[:12,:]
+    melhor_mes = vendas_mensais[vendas_mensais[coluna_valor]== vendas_mensais[coluna_valor].max()]
+    pior_mes = vendas_mensais[vendas_mensais[coluna_valor]== vendas_mensais[coluna_valor].min()]
+    fig4 = px.bar(vendas_mensais, vendas_mensais.index, vendas_mensais[coluna_valor], color_continuous_scale="Blues", color=vendas_mensais[coluna_valor],
+        title=f"O mês de {mapeamento_meses[melhor_mes.index.month[0]]} de {melhor_mes.index.year[0]} foi o melhor mês com um total de R${melhor_mes[coluna_valor].iloc[0]:,.2f} vendido")
+                  
+    
+    fig4.update_layout(yaxis_title="Total Mensal em Vendas", xaxis={"tickangle": 0}, 
+                xaxis_title=f"{mapeamento_meses[pior_mes.index.month[0]]} de {pior_mes.index.year[0]} foi o mês com o menor total de vendas: R${pior_mes[coluna_valor].iloc[0]:,.2f} ") 
+
+    fig4.update_traces(text=vendas_mensais[coluna_valor], textposition="none", hovertemplate="Vendas Totais: R$%{y}<br>Mês: %{x} ")
+    return fig4
+
+
+def grafico_ticket_categoria(agregados, parametros):
+    import plotly.express as px
+    coluna_valor = parametros["coluna_valor"]
+    ticket_medio_categoria = agregados["ticket_medio_categoria"]
+    maior_ticket_cat = ticket_medio_categoria[ticket_medio_categoria[coluna_valor]== ticket_medio_categoria[coluna_valor].max()]
+    ticket_medio_categoria = ticket_medio_categoria.sort_values(coluna_valor, ascending=True)
+    fig5 = px.bar(ticket_medio_categoria, y=ticket_medio_categoria.index, x=ticket_medio_categoria[coluna_valor], color=ticket_medio_categoria[coluna_valor],
+                    title=f"O maior ticket médio foi da categoria {maior_ticket_cat.index[0]} com um valor de R${maior_ticket_cat[coluna_valor].iloc[0]:,.2f}")
+    fig5.update_layout(xaxis_title="Valor do Ticket", yaxis_title="Categoria")
+    fig5.update_traces(text=ticket_medio_categoria[coluna_valor].apply(lambda x: f"R$ {x:,.2f}"), textposition="inside", hovertemplate="Ticket Médio por Categoria: %{text}<br>Categoria: %{y}")
+    return fig5
+
+
+def grafico_ticket_mes(agregados, parametros):
+    import plotly.express as px
+    coluna_valor = parametros["coluna_valor"]
+    if agregados.get("periodos") is not None:
+        return grafico_periodos(agregados["periodos"]["ticket_medio"], parametros, "lttb", "#1c83e1", "Valor do Ticket",
+                                "Maior ticket médio {periodo}: R${valor:,.2f}", "Menor ticket médio {periodo}: R${valor:,.2f}",
+                                "Valor do Ticket: R$%{y:,.2f}<br>{periodo}: %{x|%d/%m/%Y}")
+    ticket_medio_mes = agregados["ticket_medio_mes"].sort_index(ascending=False).iloc[:12,:]
+    maior_ticket_mes = ticket_medio_mes[ticket_medio_mes[coluna_valor]== ticket_medio_mes[coluna_valor].max()]
+    menor_ticket_mes = ticket_medio_mes[ticket_medio_mes[coluna_valor]== ticket_medio_mes[coluna_valor].min()]
+    fig6 = px.bar(ticket_medio_mes, ticket_medio_mes.index, ticket_medio_mes[coluna_valor], color=ticket_medio_mes[coluna_valor],
+        title=f"{mapeamento_meses[maior_ticket_mes.index.month[0]]} de {maior_ticket_mes.index.year[0]} apresentou o maior ticket médio com um valor de {maior_ticket_mes[coluna_valor].iloc[0]:.2f}")
+    fig6.update_layout(yaxis_title="Valor do Ticket", 
+                xaxis_title=f"{mapeamento_meses[menor_ticket_mes.index.month[0]]} de {menor_ticket_mes.index.year[0]} foi o mês com o menor ticket médio: {menor_ticket_mes[coluna_valor].iloc[0]:,.2f}")
+    fig6.update_traces(text=ticket_medio_mes[coluna_valor].apply(lambda x: f"R$ {x:,.2f}"), textposition="none", hovertemplate="Valor do Ticket: %{text}<br>Mês: %{x} ")
+    return fig6
+
+
+def grafico_melhores_clientes(agregados, parametros):
+    import plotly.express as px
+    coluna_id, coluna_valor, maiores_valores = parametros["coluna_id"], parametros["coluna_valor"], parametros["maiores_valores"]
+    melhores_clientes = agregados["melhores_clientes"].iloc[:maiores_valores,:].reset_index() # Já ordenados pelo motor de agregação
+    melhores_clientes[coluna_id] = melhores_clientes[coluna_id].astype(str) # Rótulos convertidos apenas para os clientes exibidos
+    melhor_cliente = melhores_clientes[melhores_clientes[coluna_valor]== melhores_clientes[coluna_valor].max()]
+    fig7 = px.bar(melhores_clientes, melhores_clientes[coluna_id].apply(lambda x: "(" + x + ")"), melhores_clientes[coluna_valor],
+                   color=melhores_clientes[coluna_valor], color_continuous_scale="Greens",
+                  title=f"ID do Melhor Cliente: {melhor_cliente[coluna_id].iloc[0]}<br>Valor Total Gasto {melhor_cliente[coluna_valor].iloc[0]} ")
+    fig7.update_layout(xaxis_title="ID dos Melhores Clientes", yaxis_title="Valor Gasto")
+    fig7.update_traces(text=melhores_clientes[coluna_valor].apply(lambda x: f"R$ {x:,.2f}"), textposition="none", hovertemplate="Gastos do Cliente: R$%{text}<br>ID do Cliente: %{x}")
+    return fig7
+
+
+def grafico_clientes_frequentes(agregados, parametros):
+    import plotly.express as px
+    coluna_id, coluna_valor, maiores_valores = parametros["coluna_id"], parametros["coluna_valor"], parametros["maiores_valores"]
+    clientes_frequentes = agregados["clientes_frequentes"].iloc[:maiores_valores,:].reset_index()
+    clientes_frequentes[coluna_id] = clientes_frequentes[coluna_id].astype(str)
+    cliente_mais_frequente = clientes_frequentes[clientes_frequentes[coluna_valor]== clientes_frequentes[coluna_valor].max()]
+    fig8 = px.bar(clientes_frequentes, clientes_frequentes[coluna_id].apply(lambda x: "(" + x + ")"), 
+                  clientes_frequentes[coluna_valor], color=clientes_frequentes[coluna_valor],  color_continuous_scale="Greens",
+                  title=f"ID do Cliente mais frequente: {cliente_mais_frequente[coluna_id].iloc[0]}<br>Compras Realizadas: {cliente_mais_frequente[coluna_valor].iloc[0]} ")
+    fig8.update_layout(xaxis_title="Clientes Mais Frequentes", yaxis_title="Quantidade de Compras realizadas")
+    fig8.update_traces(text=clientes_frequentes[coluna_valor], textposition="auto", hovertemplate="Número de Compras do Cliente: %{y}<br>ID do Cliente: %{x} ")
+    return fig8
+
+
+def grafico_retencao(agregados, parametros):
+    import plotly.graph_objects as go
+    taxa_retencao = agregados["taxa_retencao"]
+    cor = "red" if taxa_retencao <0.2 else "green"
+    fig9 = go.Figure(go.Indicator(mode="gauge+number", 
+                                value= taxa_retencao*100,
+                                title={"text": f"Taxa de Recorrência de Clientes: {taxa_retencao*100:.2f}% "},
+                                gauge={"axis": {"range": [0, 100]},
+                                       "bar": {"color": cor}}))
+    fig9.add_annotation(x=0.5, y=-0.2, 
+                        text=f"Aproximadamente {round(taxa_retencao*10)} de cada 10 clientes voltaram a comprar",
+                        showarrow=False, font=dict(size=25, color=cor))
+    return fig9
+
+
+def grafico_recompra(agregados, parametros):
+    import plotly.express as px
+    cor = "red" if agregados["taxa_retencao"] <0.2 else "green"
+    if agregados.get("periodos") is not None:
+        return grafico_periodos(agregados["periodos"]["taxa_recompra"]*100, parametros, "lttb", cor, "Taxa de Recorrência(%)",
+                                "Maior taxa de recompra {periodo}: {valor:.2f}%", "Menor taxa de recorrência {periodo}: {valor:.2f}%",
+                                "Taxa de Recompra: %{y:.2f}%<br>{periodo}: %{x|%d/%m/%Y}")
+    taxa_recompra = agregados["taxa_recompra"]*100
+    maior_recorrencia = taxa_recompra[taxa_recompra.values== taxa_recompra.values.max()]
+    menor_recorrencia = taxa_recompra[taxa_recompra.values== taxa_recompra.values.min()]
+    fig10 = px.line(taxa_recompra, x=taxa_recompra.index, y=taxa_recompra.values, color_discrete_sequence=[cor])
+    fig10.update_layout(xaxis_title=f"{mapeamento_meses[menor_recorrencia.index.month[0]]} de {menor_recorrencia.index.year[0]} apresentou a menor taxa de recorrência: {menor_recorrencia.values[0]:.2f}%",
+        yaxis_title="Taxa de Recorrência(%)", title=f"No mês de {mapeamento_meses[maior_recorrencia.index.month[0]]} de {maior_recorrencia.index.year[0]} houve uma taxa de recompra de {maior_recorrencia.values[0]:.2f}%")
+    fig10.update_traces(text=taxa_recompra.apply(lambda x: f"{x:.2f}%"), textposition="bottom center", hovertemplate="Taxa de Recompra: %{text}<br>Mês: %{x}")
+    return fig10
+
+
+def grafico_coortes(agregados, parametros):
+    import plotly.express as px
+    retencao, tamanho = agregados["retencao_coortes"], agregados["tamanho_coortes"]
+    #Retenção média no mês seguinte à primeira compra, ponderada pelo tamanho das coortes que já completaram esse mês
+    seguinte = retencao.iloc[:, 1].values if retencao.shape[1] > 1 else np.array([np.nan])
+    completas = np.isfinite(seguinte)
+    retencao_seguinte = np.average(seguinte[completas], weights=tamanho.values[completas]) if completas.any() else np.nan
+    rotulos = [f"{mapeamento_meses[mes.month][:3]}/{mes.year} ({n:,})" for mes, n in zip(retencao.index, tamanho.values)]
+    fig12 = px.imshow(retencao.values*100, x=list(retencao.columns), y=rotulos, color_continuous_scale="Greens", zmin=0, aspect="auto",
+                      title=f"Em média {retencao_seguinte*100:.2f}% dos novos clientes voltaram a comprar no mês seguinte à primeira compra"
+                      if np.isfinite(retencao_seguinte) else "Retenção dos clientes por mês da primeira compra")
+    fig12.update_layout(xaxis_title="Meses desde a primeira compra", yaxis_title="Mês da primeira compra (novos clientes)", coloraxis_colorbar_title="Retenção(%)")
+    fig12.update_traces(hovertemplate="Coorte: %{y}<br>Meses desde a primeira compra: %{x}<br>Clientes ativos: %{z:.2f}%<extra></extra>")
+    return fig12
+
+
+def grafico_historico(agregados, parametros):
+    return agregados["fig_compar"]
+
+
+def grafico_previsao(agregados, parametros):
+    return agregados["fig_arima"]
+
+
+def grafico_previsao_categorias(agregados, parametros):
+    import plotly.express as px
+    previsoes = agregados["previsoes_categorias"]
+    fig11 = px.line(previsoes, x=previsoes.index, y=previsoes.columns, markers=True,
+                    title=f"Previsões por categoria para o período selecionado de {parametros['meses_prever']} meses")
+    fig11.update_layout(xaxis_title="Mês", yaxis_title="Valor de Vendas Previsto", legend_title="Categoria")
+    fig11.update_traces(hovertemplate="Mês: %{x}<br>Valor Previsto: %{y}")
+    return fig11
+
+
+def grafico_validacao(agregados, parametros):
+    import plotly.graph_objects as go
+    validacao = agregados["validacao"]
+    mape = validacao["MAPE"].dropna()
+    fig13 = go.Figure()
+    fig13.add_bar(x=validacao.index, y=validacao["MAPE"]*100, name="MAPE", marker_color="dodgerblue", customdata=validacao["Origens"],
+                  hovertemplate="Horizonte: %{x} meses<br>MAPE: %{y:.2f}%<br>Origens avaliadas: %{customdata}<extra></extra>")
+    fig13.add_scatter(x=validacao.index, y=validacao["sMAPE"]*100, mode="lines+markers", name="sMAPE", line=dict(color="darkorange"),
+                      hovertemplate="Horizonte: %{x} meses<br>sMAPE: %{y:.2f}%<extra></extra>")
+    fig13.add_scatter(x=validacao.index, y=validacao["MASE"], mode="lines+markers", name="MASE", yaxis="y2", line=dict(color="white", dash="dash"),
+                      hovertemplate="Horizonte: %{x} meses<br>MASE: %{y:.2f}<extra></extra>")
+    fig13.update_layout(title=f"O erro percentual médio do modelo vai de {mape.iloc[0]*100:.2f}% a {mape.index[0]} mês para {mape.iloc[-1]*100:.2f}% a {mape.index[-1]} meses"
+                        if len(mape) else agregados["aviso_validacao"] or "Erro do modelo por horizonte de previsão",
+                        xaxis_title="Meses à frente da origem da previsão", yaxis_title="Erro percentual (%)",
+                        yaxis2=dict(title="MASE", overlaying="y", side="right", showgrid=False), legend_title="Métrica")
+    return fig13
+
+
+#Registro dos agregados (função e parâmetros dos quais depende) e das páginas (agregados, parâmetros e gráficos necessários para cada visualização)
+AGREGADOS = {"totais": (agregado_totais, []), "categorias": (agregado_categorias, []), "mensal": (agregado_mensal, []),
+             "clientes": (agregado_clientes, []), "recompra": (agregado_recompra, []), "coortes": (agregado_coortes, []), "previsao": (agregado_previsao, ["meses_prever"]),
+             "previsao_categorias": (agregado_previsao_categorias, ["meses_prever"]), "validacao": (agregado_validacao, ["meses_prever"]),
+             "periodos": (agregado_periodos, ["granularidade"])}
+
+PAGINAS = {
+    "Vendas por Categoria": {"agregados": ["totais", "categorias", "mensal"], "parametros": [],
+                             "graficos": {"fig": grafico_vendas_categoria, "fig2": grafico_vendas_totais}},
+    "Vendas por Mês": {"agregados": ["mensal", "periodos"], "parametros": ["granularidade"],
+                       "graficos": {"fig3": grafico_crescimento, "fig4": grafico_vendas_mensais}},
+    "TickedMédio": {"agregados": ["categorias", "mensal", "periodos"], "parametros": ["granularidade"],
+                    "graficos": {"fig5": grafico_ticket_categoria, "fig6": grafico_ticket_mes}},
+    "Clientes Engajados": {"agregados": ["clientes"], "parametros": ["maiores_valores"],
+                           "graficos": {"fig7": grafico_melhores_clientes, "fig8": grafico_clientes_frequentes}},
+    "Taxa de Recorrência": {"agregados": ["clientes", "recompra", "coortes", "periodos"], "parametros": ["granularidade"],
+                            "graficos": {"fig9": grafico_retencao, "fig10": grafico_recompra, "fig12": grafico_coortes}},
+    "Projeção": {"agregados": ["previsao", "previsao_categorias", "validacao"], "parametros": ["meses_prever"],
+                 "graficos": {"fig_compar": grafico_historico, "fig_arima": grafico_previsao, "fig11": grafico_previsao_categorias, "fig13": grafico_validacao}},
+}
+
+
+#Páginas gravadas antes de a visualização ganhar novos gráficos (snapshots e resultados persistidos) são recalculadas
+def pagina_completa(pagina, visualizacao):
+    return pagina is not None and set(PAGINAS[visualizacao]["graficos"]) <= set(pagina["graficos"])
+
+
+#Chave de uma página: visualização e apenas os parâmetros dos quais os seus gráficos dependem
+def chave_pagina(visualizacao, maiores_valores, meses_prever, granularidade="Mensal"):
+    parametros = {"maiores_valores": maiores_valores, "meses_prever": meses_prever, "granularidade": granularidade}
+    return (visualizacao,) + tuple(parametros[p] for p in PAGINAS[visualizacao]["parametros"])
+
+
+#Trava de cada agregado ou página de um período preparado: sessões e tarefas de pré-cálculo que pedem o mesmo resultado
+#esperam pelo primeiro cálculo, e resultados diferentes do mesmo período continuam sendo calculados em paralelo
+def trava_resultado(preparado, tipo, chave):
+    with preparado["trava"]:
+        return preparado["travas"].setdefault((tipo, chave), threading.Lock())
+
+
+#Função de Geração da página selecionada: agregados e gráficos são calculados apenas quando a página é aberta 
+#e ficam armazenados junto aos dados preparados para as próximas visitas (o cache em memória mede o período novamente)
+def gerador_pagina(visualizacao, preparado, maiores_valores, meses_prever, granularidade="Mensal"):
+    pagina = PAGINAS[visualizacao]
+    parametros = dict(preparado["colunas"], maiores_valores=maiores_valores, meses_prever=meses_prever, granularidade=granularidade)
+
+    calculados = False # Apenas quem calculou um resultado novo mede o período novamente
+    agregados = {}
+    for nome in pagina["agregados"]:
+        funcao, dependencias = AGREGADOS[nome]
+        chave = (nome,) + tuple(parametros[p] for p in dependencias)
+        with estagio(f"agregado_{nome}"), trava_resultado(preparado, "agregados", chave):
+            marcar_cache(chave in preparado["agregados"])
+            if chave not in preparado["agregados"]:
+                preparado["agregados"][chave] = funcao(preparado, parametros)
+                calculados = True
+        agregados.update(preparado["agregados"][chave])
+
+    chave = chave_pagina(visualizacao, maiores_valores, meses_prever, granularidade)
+    with estagio("graficos"), trava_resultado(preparado, "graficos", chave):
+        marcar_cache(chave in preparado["graficos"])
+        if chave not in preparado["graficos"]:
+            graficos = {}
+            for nome, gerar in pagina["graficos"].items():
+                with estagio(f"grafico_{nome}"):
+                    graficos[nome] = gerar(agregados, parametros)
+            preparado["graficos"][chave] = graficos
+            calculados = True
+    
+    if calculados:
+        remedir_memoria(preparado)
+    return preparado["graficos"][chave], agregados
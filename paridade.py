@@ -0,0 +1,146 @@
+import argparse
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from benchmark import ARQUIVOS_EXEMPLO, COLUNAS_SINTETICAS, gerar_transacoes
+from ingestao import carregador_colunar, conversor_parquet, hash_caminho
+from consultas import fonte_sql
+from paineis import AGREGADOS, GRANULARIDADES, anexar_base, preparar_base, preparar_periodo
+
+
+
+#Teste de Paridade dos backends (desenvolvimento): os mesmos arquivos são processados pelo backend pandas (cubo mensal) e pelo
+#backend SQL (DuckDB) e todos os agregados dos painéis, as séries de treinamento e o resumo do período são comparados
+#    python paridade.py --linhas 100000 --periodo 2016-03-05:2017-08-20
+#Os agregados da Projeção não são comparados: dependem apenas das séries de treinamento, que são comparadas diretamente.
+#O comando falha (código 1) se houver qualquer diferença
+
+AGREGADOS_PARIDADE = [nome for nome in AGREGADOS if nome not in ("previsao", "previsao_categorias", "validacao")]
+PERIODOS_PADRAO = [(), (pd.Timestamp("2016-03-05").date(), pd.Timestamp("2017-08-20").date())]
+TOLERANCIA_RELATIVA = 1e-9 # As somas em SQL são feitas em outra ordem: diferenças de arredondamento são aceitas
+
+
+#Comparação de dois resultados (DataFrames, séries, dicionários ou escalares); retorna a lista de diferenças encontradas
+def comparar(nome, esperado, obtido):
+    if isinstance(esperado, dict):
+        if set(esperado) != set(obtido):
+            return [f"{nome}: chaves {sorted(esperado)} != {sorted(obtido)}"]
+        return [diferenca for chave in esperado for diferenca in comparar(f"{nome}.{chave}", esperado[chave], obtido[chave])]
+    if isinstance(esperado, (pd.DataFrame, pd.Series)):
+        if type(esperado) is not type(obtido) or esperado.shape != obtido.shape:
+            return [f"{nome}: formato {esperado.shape} != {getattr(obtido, 'shape', type(obtido))}"]
+        diferencas = comparar(f"{nome}.index", list(esperado.index), list(obtido.index))
+        if isinstance(esperado, pd.DataFrame):
+            diferencas += comparar(f"{nome}.columns", list(esperado.columns), list(obtido.columns))
+            return diferencas + [diferenca for i in range(esperado.shape[1]) # Coluna a coluna (cada uma com o seu tipo)
+                                 for diferenca in comparar(f"{nome}[{esperado.columns[i]}]", esperado.iloc[:, i], obtido.iloc[:, i])]
+        return diferencas + comparar(f"{nome}.valores", esperado.to_numpy(), obtido.to_numpy())
+    if isinstance(esperado, np.ndarray) and esperado.dtype.kind in "fiu":
+        if not np.allclose(esperado.astype("float64"), np.asarray(obtido, dtype="float64"), rtol=TOLERANCIA_RELATIVA, atol=0, equal_nan=True):
+            return [f"{nome}: diferença máxima {np.nanmax(np.abs(esperado - obtido))}"]
+        return []
+    if isinstance(esperado, (float, np.floating)) and isinstance(obtido, (float, np.floating)):
+        return [] if np.isclose(esperado, obtido, rtol=TOLERANCIA_RELATIVA, atol=0, equal_nan=True) else [f"{nome}: {esperado} != {obtido}"]
+    if isinstance(esperado, np.ndarray):
+        esperado = list(esperado)
+    if isinstance(obtido, np.ndarray):
+        obtido = list(obtido)
+    return [] if esperado == obtido else [f"{nome}: {str(esperado)[:200]} != {str(obtido)[:200]}"]
+
+
+#Carregamento de um arquivo no formato de cada backend (linhas mapeadas ou fonte das consultas)
+def carregar(backend, caminho, colunas):
+    if backend == "duckdb":
+        return fonte_sql([conversor_parquet(caminho, *colunas, hash_arquivo=hash_caminho(caminho))[0]], *colunas)
+    return carregador_colunar(caminho.read_bytes(), *colunas, hash_arquivo=hash_caminho(caminho))[0]
+
+
+def preparar(backend, arquivos, colunas):
+    base = preparar_base(carregar(backend, arquivos[0], colunas), *colunas)
+    for anexo in arquivos[1:]:
+        base = anexar_base(base, carregar(backend, anexo, colunas), *colunas)
+    return base
+
+
+#Verificação de um conjunto de dados (arquivo principal e anexos) em todos os períodos; retorna as diferenças e os tempos
+#Apenas erros de mapeamento (ValueError: datas ou valores inválidos) são esperados, e os dois backends devem falhar com
+#a mesma mensagem; qualquer outra exceção (arquivo inexistente, erro de SQL) é uma diferença
+def verificar(arquivos, colunas, periodos):
+    resultados, tempos, erros = {}, {}, []
+    for backend in ("pandas", "duckdb"):
+        inicio = time.perf_counter()
+        try:
+            base = preparar(backend, arquivos, colunas)
+        except ValueError as error: # Mapeamento incompatível
+            resultados[backend] = f"{type(error).__name__}: {error}"
+            continue
+        except Exception as error:
+            resultados[backend] = None
+            erros.append(f"{backend}: erro inesperado {type(error).__name__}: {error}")
+            continue
+        resultados[backend] = {"vendas": base["vendas"], "series_categorias": base["series_categorias"]}
+        for datas in periodos:
+            try:
+                preparado = preparar_periodo(base, *colunas, datas)
+            except ValueError as error: # Nenhuma venda no período
+                resultados[backend][datas] = str(error)
+                continue
+            resultados[backend][datas] = {"resumo": preparado["fatia"]["resumo"]}
+            for nome in AGREGADOS_PARIDADE: # Agregados que dependem da granularidade são comparados em todas elas
+                funcao, dependencias = AGREGADOS[nome]
+                for granularidade in (GRANULARIDADES if "granularidade" in dependencias else ["Mensal"]):
+                    resultados[backend][datas][f"{nome}_{granularidade}"] = funcao(preparado, {"granularidade": granularidade})
+        tempos[backend] = time.perf_counter() - inicio
+    if erros:
+        return erros, tempos
+    return comparar("resultado", resultados["pandas"], resultados["duckdb"]), tempos
+
+
+#Dados sintéticos divididos em um arquivo principal e um anexo (as últimas linhas), para verificar também a anexação
+def gerar_sinteticos(pasta, n_linhas, semente):
+    caminho = pasta / f"sinteticos_{n_linhas}.csv"
+    gerar_transacoes(caminho, n_linhas, semente=semente)
+    linhas = caminho.read_text(encoding="utf-8").splitlines(keepends=True)
+    corte = 1 + int(n_linhas * 0.9)
+    caminho.write_text("".join(linhas[:corte]), encoding="utf-8")
+    anexo = pasta / f"sinteticos_{n_linhas}_anexo.csv"
+    anexo.write_text(linhas[0] + "".join(linhas[corte:]), encoding="utf-8")
+    return [caminho, anexo]
+
+
+def converter_periodo(texto):
+    return tuple(pd.Timestamp(parte).date() for parte in texto.split(":") if parte)
+
+
+def argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Compara os agregados dos backends pandas e SQL (DuckDB).")
+    parser.add_argument("--linhas", type=int, nargs="*", default=[100_000], help="Tamanhos dos conjuntos sintéticos (com um anexo cada)")
+    parser.add_argument("--semente", type=int, default=0, help="Semente do gerador de dados sintéticos")
+    parser.add_argument("--periodo", type=converter_periodo, action="append", help="Período INICIO[:FIM] (pode ser repetido)")
+    parser.add_argument("--sem-exemplos", action="store_true", help="Não verifica os arquivos de exemplo")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = argumentos(argv)
+    periodos = PERIODOS_PADRAO + (args.periodo or [])
+    falhas = 0
+    with tempfile.TemporaryDirectory() as pasta:
+        conjuntos = {} if args.sem_exemplos else {arquivo: ([Path(__file__).parent / arquivo], colunas) for arquivo, colunas in ARQUIVOS_EXEMPLO.items()}
+        for n_linhas in args.linhas:
+            conjuntos[f"sinteticos_{n_linhas}"] = (gerar_sinteticos(Path(pasta), n_linhas, args.semente), COLUNAS_SINTETICAS)
+        for nome, (arquivos, colunas) in conjuntos.items():
+            diferencas, tempos = verificar(arquivos, colunas, periodos)
+            duracao = ", ".join(f"{backend} {tempo:.2f}s" for backend, tempo in tempos.items())
+            print(f"{nome}: {'OK' if not diferencas else f'{len(diferencas)} diferenças'} ({duracao or 'ambos falham'})")
+            for diferenca in diferencas:
+                print(f"    {diferenca}")
+            falhas += len(diferencas)
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
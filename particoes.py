@@ -0,0 +1,130 @@
+import hashlib
+import pandas as pd
+import pyarrow.parquet as pq
+from pathlib import Path
+from pandas.api.types import union_categoricals
+from agregacoes import fatiador_cubo, metricas_mensais, series_mensais
+from armazenamento import chave_armazenamento, gravar_resultado, ler_resultado
+from ingestao import TAMANHO_AMOSTRA, carregador_colunar, converter_datas, identificador_dados, ler_cabecalho
+from paineis import construir_cubo
+
+
+
+#Conjuntos de Dados Particionados: uma pasta local com um arquivo CSV ou Parquet por partição (por exemplo, um por mês)
+#Cada partição é identificada pela sua assinatura (caminho relativo, tamanho e data de modificação), sem ler o conteúdo,
+#e resumida uma única vez por versão do arquivo (datas inicial e final e vendas mensais, total e por categoria).
+#Apenas as partições que cobrem o período selecionado são carregadas, e as séries de treinamento do modelo vêm da soma
+#dos resumos, mantida pelas novas partições sem reler o histórico
+
+EXTENSOES_PARTICOES = (".csv", ".parquet")
+
+
+#Partições da pasta (inclusive subpastas, como ano=2024/mes=01) em ordem alfabética, com a assinatura de cada arquivo
+def listar_particoes(pasta):
+    pasta = Path(pasta)
+    if not pasta.is_dir():
+        raise ValueError(f"Pasta não encontrada: {pasta}")
+    particoes = []
+    for caminho in sorted(pasta.rglob("*")):
+        if caminho.is_file() and caminho.suffix.lower() in EXTENSOES_PARTICOES:
+            estado = caminho.stat()
+            particoes.append((caminho, (caminho.relative_to(pasta).as_posix(), estado.st_size, estado.st_mtime_ns)))
+    if not particoes:
+        raise ValueError(f"Nenhum arquivo CSV ou Parquet encontrado em {pasta}")
+    return particoes
+
+
+#Identificador do conjunto particionado (ou de parte dele): muda quando alguma partição é adicionada, removida ou alterada
+def identificador_particoes(particoes):
+    return identificador_dados(hashlib.sha1(repr([assinatura for _, assinatura in particoes]).encode()).hexdigest())
+
+
+#Nomes das colunas a partir da primeira partição (esquema do Parquet ou cabeçalho do CSV)
+def cabecalho_particoes(particoes):
+    caminho = particoes[0][0]
+    if caminho.suffix.lower() == ".parquet":
+        return pq.read_schema(caminho).names
+    with open(caminho, "rb") as arquivo:
+        return ler_cabecalho(arquivo.read(TAMANHO_AMOSTRA))
+
+
+#Leitura das colunas mapeadas de uma partição com os mesmos tipos do carregamento colunar
+#Partições CSV passam pelo cache em Parquet, chaveado pela assinatura (o arquivo só é lido quando não está no cache)
+def ler_particao(caminho, assinatura, coluna_data, coluna_id, coluna_categoria, coluna_valor):
+    if caminho.suffix.lower() != ".parquet":
+        hash_particao = hashlib.sha1(repr((str(caminho.resolve()), assinatura)).encode()).hexdigest()
+        return carregador_colunar(caminho, coluna_data, coluna_id, coluna_categoria, coluna_valor, hash_arquivo=hash_particao)[0]
+    colunas = list(dict.fromkeys([coluna_data, coluna_id, coluna_categoria, coluna_valor]))
+    data = pd.read_parquet(caminho, columns=colunas)
+    for coluna in (coluna_id, coluna_categoria):
+        if coluna not in (coluna_data, coluna_valor):
+            data[coluna] = data[coluna].astype("category")
+    data[coluna_data] = converter_datas(data[coluna_data])
+    if pd.api.types.is_numeric_dtype(data[coluna_valor]):
+        data[coluna_valor] = data[coluna_valor].astype("float64")
+    return data
+
+
+#Concatenação das partições: colunas categóricas são unidas pelos rótulos (sem converter as linhas em strings)
+def concatenar_particoes(dados):
+    if len(dados) == 1:
+        return dados[0]
+    colunas = {}
+    for coluna in dados[0].columns:
+        partes = [data[coluna] for data in dados]
+        if all(isinstance(parte.dtype, pd.CategoricalDtype) for parte in partes):
+            colunas[coluna] = union_categoricals(partes, sort_categories=True)
+        else:
+            colunas[coluna] = pd.concat(partes, ignore_index=True)
+    return pd.DataFrame(colunas)
+
+
+def carregar_particoes(particoes, coluna_data, coluna_id, coluna_categoria, coluna_valor):
+    return concatenar_particoes([ler_particao(caminho, assinatura, coluna_data, coluna_id, coluna_categoria, coluna_valor)
+                                 for caminho, assinatura in particoes])
+
+
+#Resumo de uma partição (persistido e chaveado pela assinatura): período coberto e vendas mensais, total e por categoria
+#Partições sem vendas com data válida têm resumo None e nunca são carregadas
+def resumo_particao(caminho, assinatura, coluna_data, coluna_id, coluna_categoria, coluna_valor):
+    chave = chave_armazenamento(str(caminho.resolve()), assinatura, coluna_data, coluna_id, coluna_categoria, coluna_valor)
+    resumo = ler_resultado("particoes", chave)
+    if resumo is not None:
+        return resumo["resumo"]
+    data = ler_particao(caminho, assinatura, coluna_data, coluna_id, coluna_categoria, coluna_valor)
+    if data[coluna_data].notna().any():
+        fatia = fatiador_cubo(construir_cubo(data, coluna_data, coluna_id, coluna_categoria, coluna_valor))
+        resumo = {"data_inicial": fatia["resumo"]["data_inicial"], "data_final": fatia["resumo"]["data_final"],
+                  "vendas": metricas_mensais(fatia)["vendas_mensais"][coluna_valor],
+                  "series_categorias": series_mensais(fatia, "categoria", fatia["categorias"])}
+    gravar_resultado("particoes", chave, {"resumo": resumo}) # Envolvido em um dicionário: o resumo de uma partição vazia também é persistido
+    return resumo
+
+
+def resumos_particoes(particoes, coluna_data, coluna_id, coluna_categoria, coluna_valor):
+    return [resumo_particao(caminho, assinatura, coluna_data, coluna_id, coluna_categoria, coluna_valor) for caminho, assinatura in particoes]
+
+
+#Resumo mensal do conjunto: soma dos resumos das partições, no mesmo formato das séries da base (series_base)
+def resumo_mensal(resumos, coluna_data, coluna_categoria, coluna_valor):
+    resumos = [resumo for resumo in resumos if resumo is not None]
+    if not resumos:
+        raise ValueError("Nenhuma venda com data válida foi encontrada nas partições")
+    vendas = pd.concat([resumo["vendas"] for resumo in resumos]).groupby(level=0).sum() # Partições podem compartilhar meses
+    meses = pd.date_range(vendas.index.min(), vendas.index.max(), freq="MS", name=coluna_data)
+    vendas = pd.DataFrame({coluna_valor: vendas.reindex(meses, fill_value=0.0).values}, index=meses).reset_index()
+    series_categorias = pd.concat([resumo["series_categorias"] for resumo in resumos]).fillna(0.0).groupby(level=0).sum()
+    series_categorias = series_categorias.reindex(meses, fill_value=0.0).sort_index(axis=1)
+    series_categorias.columns.name = coluna_categoria
+    return {"vendas": vendas, "series_categorias": series_categorias}
+
+
+#Partições que cobrem o período selecionado (datas inicial e final inclusivas, como no filtro do cubo)
+def particoes_periodo(particoes, resumos, datas):
+    inicio = pd.Timestamp(datas[0]) if len(datas) >= 1 else pd.Timestamp.min
+    fim = pd.Timestamp(datas[1]) if len(datas) == 2 else pd.Timestamp.max
+    selecionadas = [particao for particao, resumo in zip(particoes, resumos)
+                    if resumo is not None and resumo["data_final"] >= inicio and resumo["data_inicial"] <= fim]
+    if not selecionadas:
+        raise ValueError("Nenhuma venda encontrada no período selecionado")
+    return selecionadas
@@ -0,0 +1,90 @@
+import argparse
+import time
+import pandas as pd
+from pathlib import Path
+from ingestao import LIMITE_STREAMING, carregador_colunar, carregador_streaming, conversor_parquet, hash_caminho, identificador_anexo, identificador_dados
+from particoes import carregar_particoes, identificador_particoes, listar_particoes, resumo_mensal, resumos_particoes
+from paineis import GRANULARIDADES, PAGINAS, anexar_base, chave_pagina, divisao_treino_teste, gerador_pagina, impressao_serie, preparar_base, preparar_periodo, treinador_modelo
+from consultas import BACKEND, fonte_sql
+from snapshots import PASTA_SNAPSHOTS, pasta_pagina, salvar_modelo, salvar_pagina
+
+
+
+#Pré-cálculo dos Painéis em linha de comando (por exemplo em um job noturno), sem o Streamlit:
+#    python precalcular.py vendas.csv --data Order_Date --id Customer_ID --categoria Category --valor Sales --periodo 2017-01-01:2017-12-31
+#Todas as páginas são calculadas para o período completo e para cada período informado, e os agregados, os gráficos
+#e o modelo ajustado são gravados na pasta de snapshots, de onde a aplicação os carrega instantaneamente
+#Com --anexo, as novas vendas são combinadas à base e o modelo gravado na execução anterior é atualizado em vez de re-treinado
+#O arquivo também pode ser uma pasta de dados particionados (um CSV ou Parquet por período), como na barra lateral da aplicação
+
+
+#Conversão de "INICIO[:FIM]" para o mesmo formato do filtro de datas da barra lateral
+def converter_periodo(texto):
+    datas = tuple(pd.Timestamp(parte).date() for parte in texto.split(":") if parte)
+    if len(datas) not in (1, 2) or (len(datas) == 2 and datas[1] <= datas[0]):
+        raise argparse.ArgumentTypeError(f"Período inválido: {texto} (use INICIO ou INICIO:FIM, com INICIO menor que FIM)")
+    return datas
+
+
+def argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Pré-calcula os painéis da aplicação e grava os snapshots em disco.")
+    parser.add_argument("arquivo", type=Path, help="Arquivo CSV com os dados de vendas ou pasta de dados particionados")
+    parser.add_argument("--data", default="Order_Date", help="Coluna de data")
+    parser.add_argument("--id", default="Customer_ID", help="Coluna de identificação do cliente")
+    parser.add_argument("--categoria", default="Category", help="Coluna de categoria")
+    parser.add_argument("--valor", default="Sales", help="Coluna de valor")
+    parser.add_argument("--anexo", type=Path, action="append", default=[], help="Arquivo com novas vendas combinado ao arquivo principal (pode ser repetido, na ordem de exportação)")
+    parser.add_argument("--periodo", type=converter_periodo, action="append", default=[], help="Período INICIO[:FIM] (pode ser repetido)")
+    parser.add_argument("--paginas", nargs="+", choices=list(PAGINAS), default=list(PAGINAS), help="Páginas a pré-calcular")
+    parser.add_argument("--maiores-valores", type=int, default=10, help="Número de clientes exibidos (Clientes Engajados)")
+    parser.add_argument("--meses-prever", type=int, default=12, help="Horizonte de previsão em meses (Projeção)")
+    parser.add_argument("--granularidade", choices=list(GRANULARIDADES), default="Mensal", help="Granularidade das séries temporais")
+    return parser.parse_args(argv)
+
+
+#Carregamento de um arquivo (colunar, em blocos ou no backend SQL, como na aplicação) ou de todas as partições de uma pasta e o seu identificador
+def carregar(caminho, colunas):
+    if caminho.is_dir():
+        particoes = listar_particoes(caminho)
+        return identificador_particoes(particoes), carregar_particoes(particoes, *colunas)
+    id_dados = identificador_dados(hash_caminho(caminho))
+    if BACKEND == "duckdb": # Backend SQL: arquivo convertido para Parquet e consultado no DuckDB
+        return id_dados, fonte_sql([conversor_parquet(caminho, *colunas, hash_arquivo=id_dados[0])[0]], *colunas)
+    if caminho.stat().st_size > LIMITE_STREAMING:
+        return id_dados, carregador_streaming(caminho, *colunas)
+    return id_dados, carregador_colunar(caminho.read_bytes(), *colunas, hash_arquivo=id_dados[0])[0]
+
+
+def main(argv=None):
+    args = argumentos(argv)
+    colunas = (args.data, args.id, args.categoria, args.valor)
+    inicio = time.perf_counter()
+
+    id_dados, data = carregar(args.arquivo, colunas)
+    resumo = None
+    if args.arquivo.is_dir(): # Séries de treinamento do resumo mensal das partições (mesmo modelo e mesma impressão digital da aplicação)
+        resumo = resumo_mensal(resumos_particoes(listar_particoes(args.arquivo), *colunas), args.data, args.categoria, args.valor)
+    base = preparar_base(data, *colunas, resumo)
+    for caminho in args.anexo:
+        id_anexo, delta = carregar(caminho, colunas)
+        id_dados = identificador_anexo(id_dados, id_anexo)
+        base = anexar_base(base, delta, *colunas)
+    print(f"Dados preparados em {time.perf_counter() - inicio:.1f}s ({id_dados[0]}, versão {id_dados[1]})")
+
+    for datas in [()] + args.periodo:
+        preparado = preparar_periodo(base, *colunas, datas)
+        for visualizacao in args.paginas:
+            graficos, agregados = gerador_pagina(visualizacao, preparado, args.maiores_valores, args.meses_prever, args.granularidade)
+            pasta = pasta_pagina(id_dados, colunas, datas, chave_pagina(visualizacao, args.maiores_valores, args.meses_prever, args.granularidade))
+            salvar_pagina(pasta, graficos, agregados, preparado["fatia"]["resumo"], preparado["vendas"])
+        print(f"Período {' a '.join(map(str, datas)) or 'completo'}: {len(args.paginas)} páginas gravadas")
+
+    vendas = base["vendas"]
+    impressao = impressao_serie(vendas)
+    modelo = treinador_modelo(impressao, *divisao_treino_teste(vendas, args.valor), base.get("anterior")) # Com anexos, atualiza o modelo da execução anterior
+    salvar_modelo(impressao, modelo) # Reutilizado em outros horizontes de previsão e na próxima anexação
+    print(f"Snapshots gravados em {PASTA_SNAPSHOTS} em {time.perf_counter() - inicio:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+import numpy as np
+import pandas as pd
+import copy
+import os
+import threading
+import time
+import types
+import warnings
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextvars import ContextVar
+from pmdarima import ARIMA, auto_arima
+from pmdarima.arima import StepwiseContext
+from pmdarima.arima import _auto_solvers as solvers
+from pmdarima.arima import auto as auto_pmdarima
+from pmdarima.compat import statsmodels as sm_compat
+from statsmodels.tsa.forecasting.theta import ThetaModel
+from statsmodels.tsa.holtwinters import ExponentialSmoothing
+from instrumentacao import anotar, registrar
+from tarefas import informar_progresso
+
+
+
+#Backend de Previsão: a busca stepwise do auto_arima continua tomando exatamente as mesmas decisões (mesma sequência de
+#candidatos e mesmo modelo de menor AIC), mas todos os vizinhos que ela pode visitar em seguida são ajustados de forma
+#especulativa em um pool de processos compartilhado entre as sessões, aproveitando os núcleos ociosos do servidor.
+#O SARIMA é um dos motores de previsão registrados em MOTORES, e o modelo da Projeção é o motor de menor MAPE no teste
+
+PARAMETROS_ARIMA = dict(start_p=0, start_q=0, d=None, max_d=5, max_q=7, D=0,            #Hiper-parâmetros generalistas
+                        seasonal=True, trace=False, stepwise=True, start_P=0, start_Q=0, max_D=7, max_Q=5, m=12)
+PROCESSOS_BUSCA = int(os.environ.get("ANALISEDADOS_PROCESSOS", min(os.cpu_count() or 1, 16))) # Tamanho máximo do pool (1 desativa o paralelismo)
+ESPECULACAO_MAXIMA = int(os.environ.get("ANALISEDADOS_ESPECULACAO", PROCESSOS_BUSCA)) # Ajustes especulativos em andamento por busca
+PASSOS_LOTE = int(os.environ.get("ANALISEDADOS_PASSOS_LOTE", 20)) # Passos máximos da busca de cada série do lote (a busca já parte das ordens do modelo agregado)
+TEMPO_MAXIMO_BUSCA = float(os.environ.get("ANALISEDADOS_TEMPO_BUSCA", 120)) # Orçamento de tempo da busca em segundos (parada antecipada)
+TEMPO_MAXIMO_SELECAO = float(os.environ.get("ANALISEDADOS_TEMPO_SELECAO", TEMPO_MAXIMO_BUSCA)) # Orçamento de tempo da seleção do motor (todos os motores)
+MOTORES_SELECAO = os.environ.get("ANALISEDADOS_MOTORES", "sazonal_ingenuo,theta,holt_winters,sarima").split(",") # Motores avaliados pela seleção
+SAZONALIDADE = PARAMETROS_ARIMA["m"]
+LIMITE_DEGRADACAO = float(os.environ.get("ANALISEDADOS_LIMITE_DEGRADACAO", 0.25)) # Piora relativa do MAPE de validação que dispara uma nova seleção após anexar dados
+
+EXECUTOR_ATIVO = ContextVar("executor_busca_arima", default=None) # Pool usado pela busca da sessão atual (None = busca sequencial)
+LIMITES_BUSCA = ContextVar("limites_busca_arima", default=None) # Passos e tempo máximos da busca atual (StepwiseContext não empilhado)
+_executor = None
+_trava_executor = threading.Lock()
+
+
+#Pool de processos compartilhado (criado sob demanda; processos "spawn" evitam copiar as threads do servidor Streamlit)
+def executor_compartilhado():
+    global _executor
+    if PROCESSOS_BUSCA <= 1:
+        return None
+    with _trava_executor:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=PROCESSOS_BUSCA, mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+def descartar_executor():
+    global _executor
+    with _trava_executor:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+#Busca stepwise com ajuste especulativo dos candidatos: a lógica de decisão do pmdarima não é alterada, apenas a origem dos ajustes
+#Os limites de passos e de tempo vêm de LIMITES_BUSCA e não da pilha de contextos do pmdarima, que é global ao processo:
+#buscas simultâneas de sessões diferentes ou de tarefas em segundo plano trocariam entre si os seus limites
+class BuscaStepwiseParalela(solvers._StepwiseFitWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        limites = LIMITES_BUSCA.get()
+        if limites is not None: # Os mesmos atributos que o pmdarima lê do StepwiseContext ativo
+            self.exec_context = limites
+            self.max_k = 100 if limites.max_steps is None else limites.max_steps
+            self.max_dur = limites.max_dur
+        self.ajuste_sequencial = self._fit_arima
+        self._fit_arima = self.ajuste_especulativo
+        self.futuros = {}
+        self.n_especulados = 0
+        self.n_avaliados = 0
+
+    def chave(self, order, seasonal_order, constant=None):
+        if not self.seasonal:
+            seasonal_order = (0, 0, 0, 0)
+        return (tuple(order), sm_compat.check_seasonal_order(seasonal_order), self.with_intercept if constant is None else constant)
+
+    #Candidatos que a busca pode visitar a partir do estado atual (mesma ordem do algoritmo stepwise)
+    def candidatos(self):
+        d, D, m = self.d, self.D, self.m
+        if self.bestfit_key is None: # Modelos iniciais
+            _p, _P = (1 if self.max_p > 0 else 0), (1 if (m > 1 and self.max_P > 0) else 0)
+            _q, _Q = (1 if self.max_q > 0 else 0), (1 if (m > 1 and self.max_Q > 0) else 0)
+            iniciais = [((self.p, d, self.q), (self.P, D, self.Q, m), None), ((0, d, 0), (0, D, 0, m), None),
+                        ((_p, d, 0), (_P, D, 0, m), None), ((0, d, _q), (0, D, _Q, m), None)]
+            if self.with_intercept:
+                iniciais.append(((0, d, 0), (0, D, 0, m), False))
+            return [self.chave(*candidato) for candidato in iniciais]
+
+        (p, _, q), (P, _, Q, _), constante = self.bestfit_key
+        passos = [(0, 0, dP, dQ) for dP, dQ in ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))] + \
+                 [(dp, dq, 0, 0) for dp, dq in ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))]
+        vizinhos = [self.chave((p + dp, d, q + dq), (P + dP, D, Q + dQ, m), constante) for dp, dq, dP, dQ in passos
+                    if 0 <= p + dp <= self.max_p and 0 <= q + dq <= self.max_q and 0 <= P + dP <= self.max_P and 0 <= Q + dQ <= self.max_Q]
+        return vizinhos + [self.chave((p, d, q), (P, D, Q, m), not constante)]
+
+    def _do_fit(self, order, seasonal_order, constant=None):
+        executor = EXECUTOR_ATIVO.get()
+        chave = self.chave(order, seasonal_order, constant)
+        if executor is not None and chave not in self.results_dict and chave not in self.futuros:
+            candidatos = [chave] + self.candidatos()
+            for outro in [outro for outro in self.futuros if outro not in candidatos]: # Vizinhos de um modelo que deixou de ser o melhor
+                if self.futuros[outro].cancel():
+                    del self.futuros[outro]
+            em_andamento = sum(not futuro.done() for futuro in self.futuros.values())
+            for candidato in candidatos:
+                if em_andamento >= ESPECULACAO_MAXIMA: # Os demais são ajustados quando a busca os visitar
+                    break
+                if candidato not in self.results_dict and candidato not in self.futuros:
+                    self.futuros[candidato] = executor.submit(self.ajuste_sequencial, order=candidato[0],
+                                                              seasonal_order=candidato[1], with_intercept=candidato[2])
+                    self.n_especulados += 1
+                    em_andamento += 1
+        return super()._do_fit(order, seasonal_order, constant)
+
+    def ajuste_especulativo(self, order, seasonal_order, with_intercept):
+        futuro = self.futuros.pop(self.chave(order, seasonal_order, with_intercept), None)
+        if futuro is None:
+            ajuste = self.ajuste_sequencial(order=order, seasonal_order=seasonal_order, with_intercept=with_intercept)
+        else:
+            ajuste = futuro.result()
+        registrar("candidatos", {"modelo": f"{order}{seasonal_order[:3]}[{seasonal_order[3]}]", "constante": with_intercept,
+                                 "tempo_s": round(float(ajuste[1]), 4), "aic": round(float(ajuste[2]), 3)}) # Instrumentação: cada candidato avaliado pela busca
+        self.n_avaliados += 1
+        informar_progresso(detalhe=f"{self.n_avaliados} modelos avaliados")
+        return ajuste
+
+    def solve(self):
+        try:
+            return super().solve()
+        finally:
+            for futuro in self.futuros.values(): # Candidatos especulados que a busca não chegou a visitar
+                futuro.cancel()
+            wait(self.futuros.values()) # Os ajustes já iniciados não podem ser interrompidos: a busca só termina com o pool livre
+            anotar(especulados=self.n_especulados)
+
+
+#auto_arima com a busca acima: uma cópia da função do pmdarima cujo módulo "solvers" fornece a BuscaStepwiseParalela.
+#Nenhum objeto do pmdarima é alterado, e o auto_arima original continua disponível para o restante do processo
+_solvers_busca = types.SimpleNamespace(**dict(vars(solvers), _StepwiseFitWrapper=BuscaStepwiseParalela))
+_auto_arima_busca = types.FunctionType(auto_arima.__code__, dict(vars(auto_pmdarima), solvers=_solvers_busca), auto_arima.__name__, auto_arima.__defaults__)
+
+
+def buscar_arima(serie, max_steps=None, max_dur=None, **parametros):
+    contexto = LIMITES_BUSCA.set(StepwiseContext(max_steps=max_steps, max_dur=max_dur))
+    try:
+        return _auto_arima_busca(serie, **parametros)
+    finally:
+        LIMITES_BUSCA.reset(contexto)
+
+
+#Função de Treinamento do Modelo ARIMA com busca paralela, orçamento de tempo e parada antecipada da busca stepwise
+def treinar_arima(serie, tempo_maximo=TEMPO_MAXIMO_BUSCA):
+    informar_progresso(mensagem="Busca do modelo de previsão")
+    executor = executor_compartilhado()
+    contexto = EXECUTOR_ATIVO.set(executor)
+    try:
+        return buscar_arima(serie, max_dur=tempo_maximo, **PARAMETROS_ARIMA)
+    except BrokenProcessPool: # Um processo do pool foi encerrado: o pool é recriado na próxima busca e esta segue sequencial
+        descartar_executor()
+        EXECUTOR_ATIVO.set(None)
+        return buscar_arima(serie, max_dur=tempo_maximo, **PARAMETROS_ARIMA)
+    finally:
+        EXECUTOR_ATIVO.reset(contexto)
+
+
+#Divisão entre treino e teste usada por todas as previsões (85% dos meses para treino; o mês de corte pertence aos dois conjuntos)
+def corte_treino(n_meses):
+    return int(0.85 * n_meses)
+
+
+#Erro percentual absoluto médio de todas as séries em uma única passada (mesma definição do mean_absolute_percentage_error)
+def mape_lote(reais, previstos):
+    erros = np.abs(previstos - reais) / np.maximum(np.abs(reais), np.finfo(np.float64).eps)
+    return erros.mean(axis=1)
+
+
+#Motores de Previsão: cada motor ajusta um modelo à série de treino (ajustar) e prevê os meses seguintes (prever)
+#Motores com "atualizar" incorporam novas observações ao modelo ajustado; os demais são baratos e simplesmente reajustados
+def ajustar_sazonal_ingenuo(treino, tempo_maximo):
+    valores = np.asarray(treino, dtype="float64")
+    return valores[-SAZONALIDADE:] if len(valores) >= SAZONALIDADE else valores[-1:] # Séries curtas: repete o último mês
+
+
+def prever_sazonal_ingenuo(modelo, n_periodos):
+    return np.resize(modelo, n_periodos) # Repete o último ano observado
+
+
+def ajustar_theta(treino, tempo_maximo):
+    valores = np.asarray(treino, dtype="float64")
+    return ThetaModel(valores, period=SAZONALIDADE, deseasonalize=len(valores) >= 2 * SAZONALIDADE).fit()
+
+
+def ajustar_holt_winters(treino, tempo_maximo):
+    valores = np.asarray(treino, dtype="float64")
+    sazonal = len(valores) >= 2 * SAZONALIDADE # A sazonalidade exige ao menos dois anos de treino
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore") # Avisos de convergência da otimização dos parâmetros de suavização
+        return ExponentialSmoothing(valores, trend="add", damped_trend=True, seasonal="add" if sazonal else None,
+                                    seasonal_periods=SAZONALIDADE if sazonal else None, initialization_method="estimated").fit()
+
+
+def prever_statsmodels(modelo, n_periodos):
+    return modelo.forecast(n_periodos)
+
+
+def prever_sarima(modelo, n_periodos):
+    return modelo.predict(n_periodos)
+
+
+def atualizar_sarima(modelo, novas_observacoes):
+    modelo = copy.deepcopy(modelo) # O modelo anterior continua em cache para a série original
+    if len(novas_observacoes):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            modelo.update(novas_observacoes)
+    return modelo
+
+
+#Registro dos motores em ordem crescente de custo (ordem de avaliação da seleção)
+MOTORES = {"sazonal_ingenuo": {"descricao": "Sazonal ingênuo", "ajustar": ajustar_sazonal_ingenuo, "prever": prever_sazonal_ingenuo, "atualizar": None},
+           "theta": {"descricao": "Theta", "ajustar": ajustar_theta, "prever": prever_statsmodels, "atualizar": None},
+           "holt_winters": {"descricao": "Holt-Winters", "ajustar": ajustar_holt_winters, "prever": prever_statsmodels, "atualizar": None},
+           "sarima": {"descricao": "SARIMA", "ajustar": treinar_arima, "prever": prever_sarima, "atualizar": atualizar_sarima}}
+
+
+def prever_motor(motor, modelo, n_periodos):
+    return np.asarray(MOTORES[motor]["prever"](modelo, n_periodos), dtype="float64")
+
+
+#Previsão do modelo selecionado (o resultado de selecionar_motor ou de atualizar_modelo)
+def prever_modelo(selecao, n_periodos):
+    return prever_motor(selecao["motor"], selecao["modelo"], n_periodos)
+
+
+def mape_teste(motor, modelo, teste):
+    return float(mape_lote(np.asarray(teste, dtype="float64")[None], prever_motor(motor, modelo, len(teste))[None])[0])
+
+
+#Descrição do modelo exibida na Projeção (o SARIMA é descrito pelas suas ordens)
+def descricao_modelo(motor, modelo):
+    if motor == "sarima":
+        return f"{modelo.order}{modelo.seasonal_order[:3]}[{modelo.seasonal_order[3]}]"
+    return MOTORES[motor]["descricao"]
+
+
+#Seleção do Motor de Previsão: os motores são ajustados no treino em ordem crescente de custo e avaliados pelo MAPE no teste
+#(o mesmo corte 85/15 da Projeção), cada um com o tempo que resta do orçamento; os que não couberem no orçamento são pulados
+#Retorna o motor vencedor com o seu modelo ajustado, o tempo total da seleção e a avaliação de cada motor
+def selecionar_motor(treino, teste, tempo_maximo=TEMPO_MAXIMO_SELECAO):
+    inicio = time.perf_counter()
+    avaliacoes, melhor = [], None
+    for motor in [motor for motor in MOTORES if motor in MOTORES_SELECAO]:
+        restante = tempo_maximo - (time.perf_counter() - inicio)
+        if restante <= 0 and melhor is not None: # Sempre há ao menos um motor avaliado
+            avaliacoes.append({"motor": motor, "mape": None, "tempo_s": 0.0, "situacao": "sem tempo"})
+            continue
+        informar_progresso(mensagem=f"Seleção do modelo de previsão: {MOTORES[motor]['descricao']}")
+        inicio_motor = time.perf_counter()
+        try:
+            modelo = MOTORES[motor]["ajustar"](treino, restante)
+            mape = mape_teste(motor, modelo, teste)
+        except Exception as erro: # Série curta ou constante demais para o motor
+            avaliacoes.append({"motor": motor, "mape": None, "tempo_s": round(time.perf_counter() - inicio_motor, 4), "situacao": f"falhou ({type(erro).__name__})"})
+            continue
+        avaliacoes.append({"motor": motor, "mape": mape, "tempo_s": round(time.perf_counter() - inicio_motor, 4), "situacao": "avaliado"})
+        if melhor is None or (np.isfinite(mape) and not mape >= melhor["mape"]): # Em caso de empate vence o motor mais barato
+            melhor = {"motor": motor, "modelo": modelo, "mape": mape}
+        registrar("motores", {"motor": motor, "mape": round(mape, 4), "tempo_s": avaliacoes[-1]["tempo_s"]}) # Instrumentação: cada motor avaliado
+    if melhor is None:
+        raise ValueError("Nenhum motor de previsão conseguiu ajustar a série de vendas")
+    for avaliacao in avaliacoes:
+        if avaliacao["motor"] == melhor["motor"]:
+            avaliacao["situacao"] = "selecionado"
+    anotar(motor=melhor["motor"])
+    return dict(melhor, tempo_s=round(time.perf_counter() - inicio, 4), avaliacoes=avaliacoes)
+
+
+#Atualização Incremental do modelo após anexar novos dados: as novas observações de treino são incorporadas ao modelo já ajustado
+#(model.update do pmdarima, mantendo as ordens, ou um novo ajuste dos motores baratos) e o MAPE de validação é comparado ao do
+#modelo anterior no seu próprio teste
+#Retorna None quando o histórico de treino foi alterado ou o erro piorou além do limite, e então a seleção completa é refeita
+def atualizar_modelo(selecao, treino_anterior, teste_anterior, treino, teste, limite=LIMITE_DEGRADACAO):
+    n = len(treino_anterior)
+    if len(treino) < n or not np.allclose(treino.to_numpy()[:n], treino_anterior.to_numpy(), equal_nan=True):
+        return None
+    motor = MOTORES[selecao["motor"]]
+    mape_anterior = mape_teste(selecao["motor"], selecao["modelo"], teste_anterior)
+    if motor["atualizar"] is not None:
+        modelo = motor["atualizar"](selecao["modelo"], treino.to_numpy()[n:])
+    else:
+        modelo = motor["ajustar"](treino, TEMPO_MAXIMO_SELECAO)
+    mape = mape_teste(selecao["motor"], modelo, teste)
+    anotar(mape_anterior=round(mape_anterior, 4), mape_atualizado=round(mape, 4), novas_observacoes=len(treino) - n)
+    if not mape <= mape_anterior * (1 + limite): # Também refaz a seleção se algum dos erros for NaN
+        return None
+    return dict(selecao, modelo=modelo, mape=mape)
+
+
+#Ajuste de uma série do lote com o motor selecionado para a série agregada (executado nos processos do pool para o SARIMA):
+#a busca stepwise parte das ordens do modelo agregado e, se falhar (séries curtas ou constantes), o modelo é ajustado
+#diretamente com essas ordens
+def ajustar_serie(serie, motor, ordem, ordem_sazonal, meses_prever, tempo_maximo):
+    corte = corte_treino(len(serie))
+    treino, n_teste = serie[:corte + 1], len(serie) - corte
+    if motor != "sarima":
+        try:
+            modelo = MOTORES[motor]["ajustar"](treino, tempo_maximo)
+            return descricao_modelo(motor, modelo), prever_motor(motor, modelo, n_teste), prever_motor(motor, modelo, meses_prever)
+        except Exception:
+            return None
+    partida = dict(start_p=ordem[0], start_q=ordem[2], start_P=ordem_sazonal[0], start_Q=ordem_sazonal[2])
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore") # Atingir o limite de passos é esperado na busca a partir das ordens do modelo agregado
+            modelo = buscar_arima(treino, max_steps=PASSOS_LOTE, max_dur=tempo_maximo, **dict(PARAMETROS_ARIMA, **partida))
+    except Exception:
+        try:
+            modelo = ARIMA(order=ordem, seasonal_order=ordem_sazonal, suppress_warnings=True).fit(treino)
+        except Exception:
+            return None
+    return descricao_modelo(motor, modelo), prever_motor(motor, modelo, n_teste), prever_motor(motor, modelo, meses_prever)
+
+
+#Função de Previsão em Lote: cada coluna de "series" (meses x grupos) é ajustada com o motor selecionado para a série agregada
+#(em paralelo no pool compartilhado, partindo das ordens do modelo agregado, quando for o SARIMA) e o MAPE de todas as séries
+#é calculado de uma vez sobre a matriz de teste
+def prever_lote(series, selecao, meses_prever, tempo_maximo=TEMPO_MAXIMO_BUSCA):
+    valores = series.to_numpy(dtype="float64")
+    motor, modelo = selecao["motor"], selecao["modelo"]
+    ordens = (modelo.order, modelo.seasonal_order) if motor == "sarima" else (None, None)
+    argumentos = [(valores[:, i], motor, *ordens, meses_prever, tempo_maximo) for i in range(valores.shape[1])]
+    informar_progresso(1 / (len(argumentos) + 1), f"Previsões por categoria: 0 de {len(argumentos)} séries")
+    executor = executor_compartilhado() if motor == "sarima" else None # Os demais motores levam milissegundos por série
+    try:
+        ajustes = executor.map(ajustar_serie, *zip(*argumentos)) if executor is not None and argumentos else (ajustar_serie(*a) for a in argumentos)
+        resultados = []
+        for resultado in ajustes: # Progresso: a busca do modelo agregado conta como uma etapa e cada série do lote como outra
+            resultados.append(resultado)
+            informar_progresso((len(resultados) + 1) / (len(argumentos) + 1), f"Previsões por categoria: {len(resultados)} de {len(argumentos)} séries")
+    except BrokenProcessPool:
+        descartar_executor()
+        resultados = [ajustar_serie(*a) for a in argumentos]
+
+    corte = corte_treino(valores.shape[0])
+    vazio = np.full(valores.shape[0] - corte, np.nan)
+    previstos_teste = np.array([vazio if r is None else r[1] for r in resultados], dtype="float64").reshape(len(resultados), len(vazio))
+    mape = mape_lote(valores[corte:].T, previstos_teste) # Séries sem modelo ficam com erro nulo (NaN)
+
+    previsoes = pd.DataFrame({grupo: np.full(meses_prever, np.nan) if r is None else r[2] for grupo, r in zip(series.columns, resultados)})
+    modelos = [None if r is None else r[0] for r in resultados]
+    return {"previsoes": previsoes, "mape": pd.Series(mape, index=series.columns), "modelos": pd.Series(modelos, index=series.columns, dtype=object)}
@@ -0,0 +1,64 @@
+import pandas as pd
+import hashlib
+import json
+import os
+import pickle
+import re
+import plotly.io as pio
+from pathlib import Path
+from armazenamento import escrever_arquivo
+
+
+
+#Snapshots dos Painéis: páginas pré-calculadas fora do Streamlit (precalcular.py) são gravadas em disco com os gráficos
+#serializados em JSON do Plotly, os agregados e o resumo do período, e a aplicação apenas as carrega quando existirem
+#Os modelos ajustados ficam em uma pasta própria, indexados pela impressão digital da série de treinamento
+
+PASTA_SNAPSHOTS = Path(os.environ.get("ANALISEDADOS_SNAPSHOTS", ".snapshots")) # Pasta raiz dos snapshots e modelos pré-calculados
+
+
+#Nome da pasta do período filtrado (as datas seguem o mesmo formato do filtro da barra lateral)
+def chave_periodo(datas):
+    if not datas:
+        return "completo"
+    return "_".join(pd.Timestamp(data).strftime("%Y-%m-%d") for data in datas)
+
+
+#Pasta de uma página: conjunto de dados (identificador e versão) / mapeamento de colunas / período / página e parâmetros
+def pasta_pagina(id_dados, colunas, datas, chave_pagina):
+    chave_colunas = hashlib.sha1(repr(tuple(colunas)).encode()).hexdigest()[:12]
+    nome = re.sub(r"\W+", "_", "_".join(str(parte) for parte in chave_pagina)).strip("_")
+    return PASTA_SNAPSHOTS / f"{id_dados[0]}_v{id_dados[1]}" / chave_colunas / chave_periodo(datas) / nome
+
+
+#Os gráficos são exportados em JSON do Plotly (para uso fora da aplicação) e também gravados junto aos dados da página,
+#pois a leitura do JSON converte textos numéricos em strings e alteraria os rótulos exibidos
+def salvar_pagina(pasta, graficos, agregados, resumo, vendas):
+    figuras = {nome: json.loads(pio.to_json(figura)) for nome, figura in graficos.items()}
+    escrever_arquivo(pasta / "graficos.json", json.dumps(figuras).encode())
+    escrever_arquivo(pasta / "dados.pkl", pickle.dumps({"graficos": graficos, "agregados": agregados, "resumo": resumo, "vendas": vendas})) # Gravado por último: marca a página como completa
+
+
+def carregar_pagina(pasta):
+    try:
+        with open(pasta / "dados.pkl", "rb") as arquivo:
+            return pickle.load(arquivo)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None # Página não pré-calculada ou gravada por uma versão incompatível
+
+
+#Modelos ajustados, indexados pela impressão digital da série de treinamento
+def caminho_modelo(impressao):
+    return PASTA_SNAPSHOTS / "modelos" / f"{impressao}.pkl"
+
+
+def salvar_modelo(impressao, modelo):
+    escrever_arquivo(caminho_modelo(impressao), pickle.dumps(modelo))
+
+
+def carregar_modelo(impressao):
+    try:
+        with open(caminho_modelo(impressao), "rb") as arquivo:
+            return pickle.load(arquivo)
+    except Exception:
+        return None
@@ -0,0 +1,81 @@
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from instrumentacao import medicoes_tarefa
+from memoria import guardar_memoria, ler_memoria
+
+
+
+#Tarefas em Segundo Plano: cálculos demorados (como a Projeção, que depende da busca do ARIMA) são executados em threads
+#de trabalho, e um registro compartilhado por todas as sessões do processo garante que pedidos idênticos e simultâneos
+#utilizem a mesma tarefa. As funções executadas informam o progresso com informar_progresso, lido pela página que aguarda
+
+TAREFAS_SIMULTANEAS = int(os.environ.get("ANALISEDADOS_TAREFAS", 2)) # Threads de trabalho (a busca do ARIMA já usa o pool de processos)
+MAX_TAREFAS_CONCLUIDAS = 32 # Tarefas concluídas mantidas no registro (apenas o estado; os resultados ficam no cache em memória)
+
+_executor = ThreadPoolExecutor(max_workers=TAREFAS_SIMULTANEAS, thread_name_prefix="tarefa")
+_tarefas = OrderedDict()
+_trava = threading.Lock()
+_tarefa_atual = ContextVar("tarefa_atual", default=None)
+
+
+#Executada em uma cópia do contexto de quem criou a tarefa: os estágios medidos ficam em tarefa["medicoes"], incorporados
+#pela página que aguarda o resultado (que pode não ser a execução que iniciou a tarefa)
+#O resultado é guardado no cache em memória (memoria.py), que o mede e o descarta junto aos demais quando o orçamento é excedido
+def executar_tarefa(tarefa, funcao, *args):
+    tarefa["medicoes"] = medicoes_tarefa()
+    contexto = _tarefa_atual.set(tarefa)
+    try:
+        guardar_memoria("tarefas", tarefa["chave"], funcao(*args), MAX_TAREFAS_CONCLUIDAS)
+    finally:
+        tarefa["progresso"], tarefa["fim"] = 1.0, time.time()
+        _tarefa_atual.reset(contexto)
+
+
+def falhou(tarefa):
+    return tarefa["futuro"].done() and (tarefa["futuro"].cancelled() or tarefa["futuro"].exception() is not None)
+
+
+#Inicia a tarefa ou retorna a que já está em andamento (ou concluída) com a mesma chave; tarefas que falharam são reiniciadas
+def iniciar_tarefa(chave, funcao, *args):
+    with _trava:
+        tarefa = _tarefas.get(chave)
+        if tarefa is not None and not falhou(tarefa):
+            _tarefas.move_to_end(chave)
+            return tarefa
+        tarefa = {"chave": chave, "progresso": 0.0, "mensagem": None, "detalhe": None, "inicio": time.time(), "fim": None, "medicoes": None}
+        tarefa["futuro"] = _executor.submit(contextvars.copy_context().run, executar_tarefa, tarefa, funcao, *args)
+        _tarefas[chave] = tarefa
+        concluidas = [outra for outra, registro in _tarefas.items() if registro["futuro"].done()]
+        for outra in concluidas[:max(len(concluidas) - MAX_TAREFAS_CONCLUIDAS, 0)]:
+            del _tarefas[outra]
+    return tarefa
+
+
+#Progresso da tarefa atual: fração concluída, descrição da etapa e detalhe dentro da etapa (uma nova etapa limpa o detalhe)
+#Sem efeito fora de uma tarefa
+def informar_progresso(fracao=None, mensagem=None, detalhe=None):
+    tarefa = _tarefa_atual.get()
+    if tarefa is None:
+        return
+    if fracao is not None:
+        tarefa["progresso"] = min(max(float(fracao), 0.0), 1.0)
+    if mensagem is not None:
+        tarefa["mensagem"], tarefa["detalhe"] = mensagem, None
+    if detalhe is not None:
+        tarefa["detalhe"] = detalhe
+
+
+#Resultado de uma tarefa concluída (exceções da tarefa são relançadas); memoria.AUSENTE se já foi descartado do cache
+def resultado_tarefa(tarefa):
+    tarefa["futuro"].result()
+    return ler_memoria("tarefas", tarefa["chave"])
+
+
+def descricao_progresso(tarefa, padrao):
+    descricao = tarefa["mensagem"] or padrao
+    return f"{descricao} ({tarefa['detalhe']})" if tarefa["detalhe"] else descricao
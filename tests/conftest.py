@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+
+
+#Os módulos da aplicação ficam na raiz do repositório (não há pacote instalável)
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
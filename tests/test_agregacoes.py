@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import RAIZ
+from agregacoes import codificador_chaves, combinar_cubos, construtor_cubo, fatiador_cubo, metricas_categorias, metricas_clientes, metricas_coortes, metricas_mensais
+from ingestao import detectar_codificacao, ler_colunas
+
+
+
+#Cubo mensal e cubo anexado comparados a um groupby simples do pandas sobre o arquivo de exemplo
+
+COLUNAS = ("Order_Date", "Customer_ID", "Category", "Sales")
+PERIODO = (pd.Timestamp("2016-03-05"), pd.Timestamp("2017-08-20")) # Meses de borda parcialmente cobertos pelo filtro
+
+
+@pytest.fixture(scope="module")
+def vendas():
+    conteudo = (RAIZ / "superstore_final_dataset.csv").read_bytes()
+    data = ler_colunas(conteudo, *COLUNAS, detectar_codificacao(conteudo))
+    return data.set_index(COLUNAS[0]).sort_index()
+
+
+def cubo(data):
+    return construtor_cubo(codificador_chaves(data, *COLUNAS[1:]))
+
+
+#Métricas esperadas calculadas diretamente sobre as linhas
+def esperado_mensal(data):
+    mensal = data["Sales"].groupby(data.index.to_period("M")).sum()
+    return mensal.to_numpy()
+
+
+def esperado_categorias(data):
+    return data.groupby("Category", observed=True)["Sales"].sum().nlargest(10)
+
+
+def esperado_clientes(data):
+    return data.groupby("Customer_ID", observed=True)["Sales"].sum()
+
+
+#Coortes pelo mês da primeira compra de cada cliente dentro do período (clientes anteriores ao início entram na coorte do
+#seu primeiro mês no período); meses desde a aquisição que passam do fim do período ficam vazios
+def esperado_coortes(data, meses):
+    presenca = pd.DataFrame({"cliente": data["Customer_ID"].to_numpy(), "mes": data.index.to_period("M")}).dropna().drop_duplicates()
+    coorte = presenca.groupby("cliente", observed=True)["mes"].transform("min")
+    distancia = (presenca["mes"] - coorte).map(lambda deslocamento: deslocamento.n)
+    ativos = presenca.groupby([coorte.rename("coorte"), distancia.rename("distancia")]).size().unstack(fill_value=0)
+    ativos = ativos.reindex(columns=range(len(meses)), fill_value=0)
+    tamanho = ativos[0]
+    retencao = ativos.div(tamanho, axis=0).astype("float64")
+    posicao = meses.to_period("M").get_indexer(retencao.index)
+    retencao = retencao.mask(posicao[:, None] + np.arange(len(meses)) >= len(meses))
+    return retencao, tamanho
+
+
+def conferir_coortes(fatia, data):
+    coortes = metricas_coortes(fatia)
+    retencao, tamanho = esperado_coortes(data, fatia["meses"])
+    assert list(coortes["tamanho_coortes"].index.to_period("M")) == list(tamanho.index)
+    np.testing.assert_array_equal(coortes["tamanho_coortes"].to_numpy(), tamanho.to_numpy())
+    assert list(coortes["retencao_coortes"].index.to_period("M")) == list(retencao.index)
+    np.testing.assert_allclose(coortes["retencao_coortes"].to_numpy(), retencao.to_numpy()) # NaN nas mesmas posições
+
+
+def conferir_fatia(fatia, data):
+    np.testing.assert_allclose(metricas_mensais(fatia)["vendas_mensais"]["Sales"].to_numpy(), esperado_mensal(data))
+    categorias = metricas_categorias(fatia)["vendas_por_categoria"]["Sales"]
+    esperado = esperado_categorias(data)
+    assert list(categorias.index) == list(esperado.index)
+    np.testing.assert_allclose(categorias.to_numpy(), esperado.to_numpy())
+    melhores = metricas_clientes(fatia)["melhores_clientes"]["Sales"]
+    np.testing.assert_allclose(melhores.to_numpy(), esperado_clientes(data).loc[melhores.index].to_numpy())
+    np.testing.assert_allclose(melhores.to_numpy(), esperado_clientes(data).nlargest(len(melhores)).to_numpy())
+    assert fatia["resumo"]["n_vendas"] == data["Sales"].count()
+    conferir_coortes(fatia, data)
+
+
+def test_cubo_completo(vendas):
+    conferir_fatia(fatiador_cubo(cubo(vendas)), vendas)
+
+
+def test_cubo_periodo(vendas):
+    conferir_fatia(fatiador_cubo(cubo(vendas), PERIODO), vendas.loc[PERIODO[0]:PERIODO[1]])
+
+
+#O anexo começa no meio de um mês já carregado (células somadas) e traz clientes e meses novos
+@pytest.mark.parametrize("datas", [(), PERIODO])
+def test_cubo_anexado(vendas, datas):
+    corte = vendas.index.searchsorted(pd.Timestamp("2017-06-15"))
+    combinado = combinar_cubos(cubo(vendas.iloc[:corte]), cubo(vendas.iloc[corte:]))
+    esperado = vendas.loc[datas[0]:datas[1]] if datas else vendas
+    conferir_fatia(fatiador_cubo(combinado, datas), esperado)
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+from amostragem import lttb, minimo_maximo, reduzir_serie
+
+
+
+#Redução das séries dos gráficos: número de pontos, extremidades e preservação dos picos
+
+
+@pytest.fixture
+def serie():
+    gerador = np.random.default_rng(0)
+    x = np.arange(5000, dtype="float64")
+    y = np.sin(x / 200) * 100 + gerador.normal(0, 5, len(x))
+    y[3210] = 1000.0 # Pico isolado
+    return x, y
+
+
+@pytest.mark.parametrize("n", [3, 10, 1200])
+def test_lttb_pontos_e_extremidades(serie, n):
+    x, y = serie
+    indices = lttb(x, y, n)
+    assert len(indices) == n
+    assert indices[0] == 0 and indices[-1] == len(x) - 1
+    assert np.all(np.diff(indices) > 0) # Ordem do tempo, sem pontos repetidos
+
+
+def test_lttb_mantem_pico(serie):
+    x, y = serie
+    assert 3210 in lttb(x, y, 100)
+
+
+@pytest.mark.parametrize("n", [2, 5000, 6000])
+def test_lttb_series_curtas(serie, n):
+    x, y = serie
+    np.testing.assert_array_equal(lttb(x, y, n), np.arange(len(x)))
+
+
+def test_minimo_maximo(serie):
+    x, y = serie
+    indices = minimo_maximo(x, y, 200)
+    assert len(indices) <= 200
+    assert np.argmax(y) in indices and np.argmin(y) in indices
+    assert np.all(np.diff(indices) > 0)
+
+
+#Datas no eixo x e valores nulos descartados antes da redução
+def test_reduzir_serie_datas():
+    datas = pd.date_range("2015-01-01", periods=3000, freq="D").to_numpy()
+    valores = np.linspace(0, 1, 3000)
+    valores[[0, 1500]] = np.nan
+    x, y = reduzir_serie(datas, valores, n=300)
+    assert len(x) == 300 and np.isfinite(y).all()
+    assert x[0] == datas[1] and x[-1] == datas[-1]
@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+from conftest import RAIZ
+
+pytest.importorskip("duckdb")
+
+import armazenamento
+import ingestao
+from benchmark import ARQUIVOS_EXEMPLO, COLUNAS_SINTETICAS
+from consultas import fonte_sql, fatia_sql
+from paridade import PERIODOS_PADRAO, gerar_sinteticos, verificar
+
+
+
+#Paridade dos backends: todos os agregados dos painéis (em todas as granularidades), as séries de treinamento e o resumo do
+#período calculados pelo DuckDB são comparados aos do backend pandas
+
+PERIODOS = PERIODOS_PADRAO + [(pd.Timestamp("2016-01-10").date(), pd.Timestamp("2016-01-20").date()), (pd.Timestamp("2017-06-01").date(),)]
+
+
+@pytest.fixture(autouse=True)
+def pasta_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestao, "PASTA_CACHE", tmp_path / "cache")
+    monkeypatch.setattr(armazenamento, "PASTA_ARMAZENAMENTO", tmp_path / "cache")
+
+
+def test_paridade_exemplo():
+    diferencas, _ = verificar([RAIZ / "superstore_final_dataset.csv"], ARQUIVOS_EXEMPLO["superstore_final_dataset.csv"], PERIODOS)
+    assert diferencas == []
+
+
+#Dados sintéticos com um anexo (vendas repetidas e novos clientes) e valores nulos
+def test_paridade_sinteticos_com_anexo(tmp_path):
+    diferencas, _ = verificar(gerar_sinteticos(tmp_path, 20_000, 0), COLUNAS_SINTETICAS, PERIODOS)
+    assert diferencas == []
+
+
+#A fatia SQL guarda apenas as condições da consulta: nenhuma célula ou rótulo de cliente é transferido para o Python
+def test_fatia_sql_sem_celulas():
+    caminho = RAIZ / "superstore_final_dataset.csv"
+    colunas = ARQUIVOS_EXEMPLO[caminho.name]
+    fatia = fatia_sql(fonte_sql([ingestao.conversor_parquet(caminho, *colunas, hash_arquivo=ingestao.hash_caminho(caminho))[0]], *colunas))
+    assert "celulas" not in fatia and "clientes" not in fatia
+    assert fatia["resumo"]["n_vendas"] == pd.read_csv(caminho, encoding="latin-1")[colunas[3]].count()
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import RAIZ
+import ingestao
+from agregacoes import fatiador_cubo, metricas_mensais
+from ingestao import carregador_streaming, conversor_parquet, converter_datas, detectar_formato_data
+
+
+
+#Detecção do formato das datas: arquivos de exemplo, datas ambíguas e arquivos lidos em blocos cujo primeiro bloco é ambíguo
+
+
+@pytest.mark.parametrize("arquivo, coluna, formato", [("superstore_final_dataset.csv", "Order_Date", "%d/%m/%Y"),
+                                                      ("ecommerce_product_sales.csv", "Sale Date", "%Y-%m-%d")])
+def test_formato_exemplos(arquivo, coluna, formato):
+    assert detectar_formato_data(pd.read_csv(RAIZ / arquivo, usecols=[coluna], encoding="latin-1")[coluna]) == formato
+
+
+#Datas ambíguas são lidas com o mês primeiro, como o format="mixed" do pandas
+def test_datas_ambiguas():
+    serie = pd.Series(["01/02/2017", "03/04/2017", "12/11/2018"])
+    pd.testing.assert_series_equal(converter_datas(serie), pd.to_datetime(serie, format="mixed"))
+
+
+#Arquivos ordenados cujo primeiro bloco (50 linhas) só tem dias até 12: o formato vem dos blocos seguintes
+@pytest.fixture(params=["%m/%d/%Y", "%d/%m/%Y"])
+def arquivo_ambiguo(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestao, "PASTA_CACHE", tmp_path / "cache")
+    datas = pd.date_range("2017-01-01", "2017-03-31", freq="D").repeat(5)
+    vendas = pd.DataFrame({"Data": datas.strftime(request.param), "Cliente": np.arange(len(datas)) % 7, "Categoria": "A",
+                           "Valor": np.arange(len(datas), dtype="float64")})
+    caminho = tmp_path / "vendas.csv"
+    vendas.to_csv(caminho, index=False)
+    return caminho, pd.Series(datas, name="Data"), vendas["Valor"]
+
+
+def test_streaming_primeiro_bloco_ambiguo(arquivo_ambiguo):
+    caminho, datas, valores = arquivo_ambiguo
+    fatia = fatiador_cubo(carregador_streaming(caminho, "Data", "Cliente", "Categoria", "Valor", linhas_por_bloco=50))
+    esperado = valores.groupby(datas.dt.to_period("M").to_numpy()).sum()
+    np.testing.assert_allclose(metricas_mensais(fatia)["vendas_mensais"]["Valor"].to_numpy(), esperado.to_numpy())
+    assert (fatia["resumo"]["data_inicial"], fatia["resumo"]["data_final"]) == (datas.iloc[0], datas.iloc[-1])
+
+
+def test_parquet_primeiro_bloco_ambiguo(arquivo_ambiguo):
+    caminho, datas, _ = arquivo_ambiguo
+    convertido, _ = conversor_parquet(caminho, "Data", "Cliente", "Categoria", "Valor", hash_arquivo="teste", linhas_por_bloco=50)
+    np.testing.assert_array_equal(pd.read_parquet(convertido)["Data"].to_numpy(), datas.to_numpy())
+
+
+#Um valor fora do formato do arquivo que não apareceu nas amostras interrompe a leitura em blocos
+def test_streaming_formato_inconsistente(tmp_path):
+    linhas = [f"01/{dia:02d}/2017,1,A,1.0" for dia in range(1, 29)] * 200
+    linhas.insert(1, "2017-02-01,1,A,1.0") # Fora da amostra de um a cada dois valores
+    linhas.insert(0, "Data,Cliente,Categoria,Valor")
+    caminho = tmp_path / "vendas.csv"
+    caminho.write_text("\n".join(linhas))
+    with pytest.raises(ValueError, match="formato"):
+        carregador_streaming(caminho, "Data", "Cliente", "Categoria", "Valor", linhas_por_bloco=10_000)
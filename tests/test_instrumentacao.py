@@ -0,0 +1,46 @@
+import time
+import numpy as np
+import pytest
+import instrumentacao
+from instrumentacao import estagio, iniciar_medicoes, memoria_atual
+
+
+
+#Pico de memória residente medido por estágio (e não o pico do processo desde o início)
+
+
+@pytest.fixture(autouse=True)
+def amostragem_linux():
+    if memoria_atual() is None:
+        pytest.skip("memória residente atual só é lida no Linux")
+
+
+def alocar(megabytes):
+    bloco = np.ones(megabytes * 2**20, dtype="uint8") # Páginas tocadas: contam na memória residente
+    time.sleep(5 * instrumentacao.INTERVALO_MEMORIA)
+    return int(bloco[-1])
+
+
+#Um estágio leve depois de um estágio que alocou e liberou muita memória não herda o pico do anterior
+def test_pico_por_estagio():
+    medicoes = iniciar_medicoes()
+    with estagio("pesado"):
+        alocar(200)
+    with estagio("leve"):
+        alocar(1)
+    pesado, leve = medicoes
+    assert pesado["rss_acrescimo_mb"] >= 150
+    assert leve["rss_acrescimo_mb"] < 50
+    assert leve["rss_pico_mb"] < pesado["rss_pico_mb"] - 100
+
+
+#O pico do estágio pai inclui o dos estágios aninhados, e a thread de amostragem termina junto com os estágios
+def test_estagios_aninhados():
+    medicoes = iniciar_medicoes()
+    with estagio("pai"):
+        with estagio("filho"):
+            alocar(100)
+    pai, filho = medicoes
+    assert pai["rss_pico_mb"] >= filho["rss_pico_mb"]
+    assert filho["rss_acrescimo_mb"] >= 75
+    assert instrumentacao._picos == {}
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from collections import OrderedDict
+import memoria
+from memoria import AUSENTE, estatisticas_memoria, guardar_memoria, ler_memoria
+
+
+
+#Descarte do cache em memória com um orçamento pequeno (arrays de bytes: o tamanho medido é exatamente o do conteúdo)
+
+
+@pytest.fixture(autouse=True)
+def cache_vazio(monkeypatch):
+    monkeypatch.setattr(memoria, "_entradas", OrderedDict())
+    monkeypatch.setattr(memoria, "_contadores", {})
+    monkeypatch.setattr(memoria, "_total", 0)
+    monkeypatch.setattr(memoria, "LIMITE_MEMORIA", 10_000)
+
+
+def bloco(tamanho):
+    return np.zeros(tamanho, dtype="uint8")
+
+
+def presentes(cache="teste"):
+    return [chave for (nome, chave) in memoria._entradas if nome == cache]
+
+
+#Entre as entradas usadas há mais tempo, a maior sai primeiro
+def test_descarta_maior_entre_as_mais_antigas():
+    for chave, tamanho in (("a", 1000), ("b", 4000), ("c", 1000), ("d", 2000)):
+        guardar_memoria("teste", chave, bloco(tamanho))
+    guardar_memoria("teste", "e", bloco(3000))
+    assert presentes() == ["a", "c", "d", "e"]
+    assert memoria._total == 7000
+
+
+#A leitura torna a entrada a mais recente: ela deixa a janela de descarte
+def test_leitura_protege_entrada():
+    for chave, tamanho in (("a", 3000), ("b", 1000), ("c", 1000), ("d", 1000), ("e", 1000)):
+        guardar_memoria("teste", chave, bloco(tamanho))
+    assert ler_memoria("teste", "a") is not AUSENTE
+    guardar_memoria("teste", "f", bloco(4000))
+    assert presentes() == ["c", "d", "e", "a", "f"] # Janela com b, c, d e e: todas do mesmo tamanho, sai a mais antiga
+    assert ler_memoria("teste", "b") is AUSENTE
+
+
+#A entrada recém-guardada nunca é descartada; resultados maiores que o orçamento não são guardados
+def test_entrada_nova_e_entrada_grande():
+    guardar_memoria("teste", "a", bloco(2000))
+    guardar_memoria("teste", "b", bloco(9000))
+    assert presentes() == ["b"]
+    guardar_memoria("teste", "c", bloco(20_000))
+    assert presentes() == ["b"]
+    contagem = estatisticas_memoria()["caches"][0]
+    assert contagem["descartes"] == 2 and contagem["entradas"] == 1
+
+
+#max_entradas limita o número de entradas de um cache sem afetar os demais
+def test_max_entradas():
+    guardar_memoria("outro", "x", bloco(100))
+    for chave in "abcd":
+        guardar_memoria("teste", chave, bloco(100), max_entradas=2)
+    assert presentes() == ["c", "d"]
+    assert presentes("outro") == ["x"]
@@ -0,0 +1,77 @@
+import threading
+import time
+import pytest
+from conftest import RAIZ
+import armazenamento
+import ingestao
+import paineis
+from benchmark import ARQUIVOS_EXEMPLO
+from paineis import gerador_pagina, preparar_periodo
+from paridade import preparar
+
+
+
+#Páginas do mesmo período pedidas ao mesmo tempo por sessões e tarefas de pré-cálculo: cada agregado e cada conjunto
+#de gráficos é calculado uma única vez e todas as chamadas recebem o mesmo resultado
+
+CHAMADAS = 8
+
+
+@pytest.fixture(autouse=True)
+def pasta_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestao, "PASTA_CACHE", tmp_path / "cache")
+    monkeypatch.setattr(armazenamento, "PASTA_ARMAZENAMENTO", tmp_path / "cache")
+
+
+@pytest.fixture
+def preparado():
+    colunas = ARQUIVOS_EXEMPLO["superstore_final_dataset.csv"]
+    return preparar_periodo(preparar("pandas", [RAIZ / "superstore_final_dataset.csv"], colunas), *colunas, ())
+
+
+#Página de teste com um agregado e um gráfico lentos que contam as próprias execuções
+@pytest.fixture
+def contagens(monkeypatch):
+    contagens = {"agregado": 0, "grafico": 0, "medicoes": 0}
+
+    def agregado_lento(preparado, parametros):
+        contagens["agregado"] += 1
+        time.sleep(0.05)
+        return {"valor": contagens["agregado"]}
+
+    def grafico_lento(agregados, parametros):
+        contagens["grafico"] += 1
+        time.sleep(0.05)
+        return object()
+
+    def remedir(resultado):
+        contagens["medicoes"] += 1
+
+    monkeypatch.setitem(paineis.AGREGADOS, "lento", (agregado_lento, []))
+    monkeypatch.setitem(paineis.PAGINAS, "Lenta", {"agregados": ["lento"], "parametros": [], "graficos": {"fig": grafico_lento}})
+    monkeypatch.setattr(paineis, "remedir_memoria", remedir)
+    return contagens
+
+
+def test_pagina_calculada_uma_vez(preparado, contagens):
+    resultados, barreira = [], threading.Barrier(CHAMADAS)
+
+    def abrir():
+        barreira.wait()
+        resultados.append(gerador_pagina("Lenta", preparado, 10, 3))
+
+    threads = [threading.Thread(target=abrir) for _ in range(CHAMADAS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert contagens == {"agregado": 1, "grafico": 1, "medicoes": 1}
+    assert len(resultados) == CHAMADAS
+    assert all(graficos is resultados[0][0] and agregados == {"valor": 1} for graficos, agregados in resultados)
+
+
+#Uma nova visita à página já calculada não mede o período novamente
+def test_nova_visita_sem_medicao(preparado, contagens):
+    gerador_pagina("Lenta", preparado, 10, 3)
+    gerador_pagina("Lenta", preparado, 10, 3)
+    assert contagens == {"agregado": 1, "grafico": 1, "medicoes": 1}
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+import validacao
+from validacao import MAX_ORIGENS, TREINO_MINIMO, validar_origem_movel
+
+
+
+#Validação com origem móvel comparada a um laço direto sobre as origens e horizontes (motor sazonal ingênuo, sem o pool)
+
+HORIZONTE = 4
+
+
+@pytest.fixture(autouse=True)
+def sem_pool(monkeypatch):
+    monkeypatch.setattr(validacao, "executor_compartilhado", lambda: None)
+
+
+def serie_mensal(n):
+    gerador = np.random.default_rng(n)
+    meses = np.arange(n)
+    return 1000 + 5 * meses + 200 * np.sin(2 * np.pi * meses / 12) + gerador.normal(0, 30, n)
+
+
+#Métricas esperadas: cada origem prevê repetindo os últimos 12 meses do seu treino
+def metricas_esperadas(serie):
+    n = len(serie)
+    origens = list(range(max(min(TREINO_MINIMO, n // 2), n - MAX_ORIGENS, 2), n))
+    periodo = 12 if min(origens) > 12 else 1
+    erros = {"MAPE": [[] for _ in range(HORIZONTE)], "sMAPE": [[] for _ in range(HORIZONTE)], "MASE": [[] for _ in range(HORIZONTE)]}
+    for origem in origens:
+        treino = serie[:origem]
+        ultimo_ano = treino[-12:] if len(treino) >= 12 else treino[-1:]
+        escala = sum(abs(serie[t] - serie[t - periodo]) for t in range(periodo, origem)) / (origem - periodo)
+        for h in range(HORIZONTE):
+            if origem + h >= n:
+                continue
+            real, previsto = serie[origem + h], ultimo_ano[h % len(ultimo_ano)]
+            erros["MAPE"][h].append(abs(previsto - real) / abs(real))
+            erros["sMAPE"][h].append(2 * abs(previsto - real) / (abs(real) + abs(previsto)))
+            erros["MASE"][h].append(abs(previsto - real) / escala)
+    return {metrica: [np.mean(valores) for valores in por_horizonte] for metrica, por_horizonte in erros.items()}, \
+           [len(valores) for valores in erros["MAPE"]]
+
+
+@pytest.mark.parametrize("n", [20, 30, 60]) # Treinos com menos de um ano, origens limitadas por MAX_ORIGENS
+def test_metricas_por_horizonte(n):
+    serie = serie_mensal(n)
+    resultado = validar_origem_movel(serie, {"motor": "sazonal_ingenuo", "modelo": None}, HORIZONTE)
+    esperadas, origens = metricas_esperadas(serie)
+    assert list(resultado.index) == list(range(1, HORIZONTE + 1))
+    for metrica, valores in esperadas.items():
+        np.testing.assert_allclose(resultado[metrica].to_numpy(), valores, rtol=1e-12)
+    assert list(resultado["Origens"]) == origens
+
+
+def test_serie_curta():
+    with pytest.raises(ValueError):
+        validar_origem_movel(serie_mensal(2), {"motor": "sazonal_ingenuo", "modelo": None}, HORIZONTE)
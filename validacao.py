@@ -0,0 +1,96 @@
+import os
+import warnings
+import numpy as np
+import pandas as pd
+from concurrent.futures.process import BrokenProcessPool
+from pmdarima import ARIMA
+from previsao import MOTORES, PROCESSOS_BUSCA, SAZONALIDADE, TEMPO_MAXIMO_SELECAO, descartar_executor, executor_compartilhado, prever_motor
+from tarefas import informar_progresso
+
+
+
+#Validação com Origem Móvel (backtesting): o modelo selecionado para a Projeção é reajustado em várias origens com janela
+#de treino crescente e cada origem prevê os meses seguintes até o horizonte da Projeção. As origens são divididas em blocos
+#contíguos avaliados em paralelo no pool compartilhado; dentro de um bloco, motores com atualização incremental (SARIMA)
+#são ajustados uma única vez e atualizados com as novas observações de cada origem. Os erros (MAPE, sMAPE e MASE) de todas
+#as origens e horizontes são calculados de uma vez sobre a matriz origens x horizontes
+
+MAX_ORIGENS = int(os.environ.get("ANALISEDADOS_ORIGENS_VALIDACAO", 24)) # Origens mais recentes avaliadas
+TREINO_MINIMO = 2 * SAZONALIDADE # Meses de treino da primeira origem (dois anos, exigidos pelos motores sazonais)
+
+
+#Configuração do modelo selecionado reaplicada em cada origem: o SARIMA mantém as ordens escolhidas pela busca (sem refazê-la)
+def configuracao_modelo(selecao):
+    modelo = selecao["modelo"]
+    if selecao["motor"] == "sarima":
+        return {"order": modelo.order, "seasonal_order": modelo.seasonal_order, "with_intercept": modelo.with_intercept}
+    return {}
+
+
+def ajustar_origem(treino, motor, configuracao):
+    if motor == "sarima":
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            return ARIMA(suppress_warnings=True, **configuracao).fit(treino)
+    return MOTORES[motor]["ajustar"](treino, TEMPO_MAXIMO_SELECAO)
+
+
+#Previsões de um bloco de origens consecutivas (executado nos processos do pool): o modelo da origem anterior é atualizado
+#com os meses entre as duas origens quando o motor permite; origens que falharem ficam com previsões nulas (NaN)
+def avaliar_bloco(serie, motor, configuracao, origens, horizonte):
+    previsoes = np.full((len(origens), horizonte), np.nan)
+    modelo, anterior = None, None
+    for i, origem in enumerate(origens):
+        try:
+            if modelo is not None and MOTORES[motor]["atualizar"] is not None:
+                modelo = MOTORES[motor]["atualizar"](modelo, serie[anterior:origem])
+            else:
+                modelo = ajustar_origem(serie[:origem], motor, configuracao)
+            previsoes[i] = prever_motor(motor, modelo, horizonte)
+        except Exception:
+            modelo = None # A próxima origem é ajustada do zero
+        anterior = origem
+    return previsoes
+
+
+#Erros por horizonte: a linha i da matriz contém as previsões feitas com os meses anteriores à origem i; meses previstos
+#além do fim da série ficam nulos e não entram nas médias. O MASE divide o erro pelo erro médio do sazonal ingênuo
+#dentro do treino de cada origem (ingênuo simples quando o treino não tem mais de um ano)
+def metricas_horizonte(serie, origens, previsoes):
+    n, horizonte = len(serie), previsoes.shape[1]
+    posicoes = origens[:, None] + np.arange(horizonte)
+    reais = np.where(posicoes < n, serie[np.minimum(posicoes, n - 1)], np.nan)
+    erros = np.abs(previsoes - reais)
+    minimo = np.finfo(np.float64).eps
+    periodo = SAZONALIDADE if origens.min() > SAZONALIDADE else 1
+    acumuladas = np.concatenate([[0.0], np.cumsum(np.abs(serie[periodo:] - serie[:-periodo]))])
+    escala = acumuladas[origens - periodo] / (origens - periodo)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore") # Horizontes sem nenhuma origem avaliada resultam em médias nulas
+        return pd.DataFrame({"MAPE": np.nanmean(erros / np.maximum(np.abs(reais), minimo), axis=0),
+                             "sMAPE": np.nanmean(2 * erros / np.maximum(np.abs(reais) + np.abs(previsoes), minimo), axis=0),
+                             "MASE": np.nanmean(erros / np.where(escala > 0, escala, np.nan)[:, None], axis=0),
+                             "Origens": np.sum(~np.isnan(erros), axis=0)}, index=pd.RangeIndex(1, horizonte + 1, name="Horizonte (meses)"))
+
+
+#Função de Validação: as origens vão do fim do treino mínimo (ou das MAX_ORIGENS mais recentes) até o penúltimo mês da série
+def validar_origem_movel(serie, selecao, horizonte, max_origens=MAX_ORIGENS):
+    serie = np.asarray(serie, dtype="float64")
+    origens = np.arange(max(min(TREINO_MINIMO, len(serie) // 2), len(serie) - max_origens, 2), len(serie))
+    if not len(origens):
+        raise ValueError("Série de vendas curta demais para a validação com origem móvel")
+    motor, configuracao = selecao["motor"], configuracao_modelo(selecao)
+    executor = executor_compartilhado()
+    blocos = np.array_split(origens, min(len(origens), PROCESSOS_BUSCA) if executor is not None else 1) # Um bloco por processo
+    informar_progresso(mensagem="Validação com origem móvel", detalhe=f"0 de {len(origens)} origens")
+    try:
+        avaliacoes = executor.map(avaliar_bloco, *zip(*[(serie, motor, configuracao, bloco, horizonte) for bloco in blocos])) if executor is not None \
+            else (avaliar_bloco(serie, motor, configuracao, bloco, horizonte) for bloco in blocos)
+        previsoes = []
+        for avaliacao in avaliacoes:
+            previsoes.append(avaliacao)
+            informar_progresso(detalhe=f"{sum(len(bloco) for bloco in previsoes)} de {len(origens)} origens")
+    except BrokenProcessPool:
+        descartar_executor()
+        previsoes = [avaliar_bloco(serie, motor, configuracao, bloco, horizonte) for bloco in blocos]
+    return metricas_horizonte(serie, origens, np.vstack(previsoes))